@@ -1,103 +1,288 @@
 import asyncio
 import json
+import threading
+import time
+from collections import deque
 import websockets
 import pygame
 from render import Render, UIState
+from protocol import BINARY, apply_delta, decode_frame, encode_input
+from prediction import Predictor
 
 class Client:
-    def __init__(self, host, port):
+    def __init__(self, host, port, encoding=BINARY, spectate=None, rate=1):
         self.host = host
         self.port = port
+        self.encoding = encoding # "binary" or "json" (easier to debug)
+        self.spectate = spectate # room id to watch instead of playing
+        self.rate = rate # spectators can ask for every n-th frame only
         self.username = ""
         self.render = None
         self.websocket = None
+        self.predictor = Predictor()
 
-    async def start(self):
-        uri = f"ws://{self.host}:{self.port}"
+        # delta stream tracking, owned by the network thread
+        self.seq = None
+        self.awaiting_keyframe = False
+        self.state = None
 
-        async with websockets.connect(uri) as ws:
-            self.websocket = ws
+        # network thread -> render thread handoff, drained once per frame
+        self.events = deque()
+        self.loop = None
+        self.connected = threading.Event()
+        self.disconnected = False # set once the connection ends, later inputs are dropped
+        self.connect_error = None
 
-            self.render = Render(None, None, self)
-            asyncio.create_task(self.receive_loop())
+    # Networking runs on its own thread and event loop so decoding and sending
+    # never wait on the frame cap; pygame stays on the main thread
+    def start(self):
+        threading.Thread(target=self.network_main, daemon=True).start()
 
-            while True:
-                self.render.run_frame()
-                await asyncio.sleep(0.016)
+        self.connected.wait()
+        if self.connect_error:
+            raise self.connect_error
+
+        self.render = Render(None, None, self)
+        self.render.predictor = self.predictor
+
+        if self.spectate is not None:
+            self.render.ui_state = UIState.WAITING
+            self.send_raw(self.handshake())
+
+        while True:
+            self.process_events()
+            self.render.run_frame()
+
+    def network_main(self):
+        asyncio.run(self.network())
+
+    async def network(self):
+        uri = f"ws://{self.host}:{self.port}"
+
+        # the render thread waits on connected: it is set however connecting ends,
+        # a failure of any kind is raised again by start()
+        try:
+            self.websocket = await websockets.connect(uri)
+            self.loop = asyncio.get_running_loop()
+        except Exception as e:
+            self.connect_error = e
+            return
+        finally:
+            self.connected.set()
+
+        try:
+            await self.receive_loop()
+        finally:
+            await self.websocket.close()
 
     async def receive_loop(self):
         try:
-            async for msg in self.websocket:
-                try:
-                    data = json.loads(msg)
-                except json.JSONDecodeError:
-                    self.username = msg
-                    self.render.username = msg
-                    continue
-                
-                # result screen
-                if data.get("type") == "result":
-                    self.render.ui_state = UIState.GAME_OVER
-                    self.render.state = None
-
-                    if data["winner"] == self.username:
-                        self.render.game_over_message = "YOU WIN!"
-                    else:
-                        self.render.game_over_message = "YOU LOST!"
-                    continue
-                
-                # Waiting message
-                if data.get("type") == "waiting":
-                    if self.render.ui_state in (UIState.USERNAME, UIState.WAITING):
-                        self.render.ui_state = UIState.WAITING
-                    continue
-                
-                # game state
-                if self.render.ui_state in (UIState.WAITING, UIState.USERNAME):
-                    self.render.game_over_message = ""
-                    self.render.dimensions = data["dimensions"]
-                    self.render.setup_game_screen()
-
-                    # Determine role once players match
-                    player = data["players"].get(self.username)
-                    if player:
-                        self.render.instruction_role = player["role"]
-                        self.render.instruction_start_time = pygame.time.get_ticks()
-                        self.render.ui_state = UIState.INSTRUCTIONS
-
-                    self.render.screen = pygame.display.set_mode(
-                        (self.render.screen_width, self.render.screen_height)
-                    )
-
-                # Always update state and set to GAME when receiving game state
-                self.render.state = data
-                if self.render.ui_state == UIState.WAITING:
-                    self.render.ui_state == UIState.GAME
+            while True:
+                redirect = None
+                async for msg in self.websocket:
+                    redirect = self.handle_message(msg)
+                    if redirect:
+                        break
+
+                if redirect is None:
+                    break
+                await self.follow_redirect(redirect)
 
         except websockets.exceptions.ConnectionClosed:
             pass
         
         finally:
-            # when server is terminated - force exit UI loop
+            self.disconnected = True
+            self.events.append(("closed", None))
+
+    # Decodes one server message on the network thread and queues it for the render
+    # thread, returns the redirect if the router sent one
+    def handle_message(self, msg):
+        if isinstance(msg, bytes):
+            data = decode_frame(msg)
+            if data is None:
+                return
+        else:
+            # text frames are JSON control messages whatever the encoding, except the
+            # unique username which may itself parse as JSON ("42", "null")
+            try:
+                data = json.loads(msg)
+            except json.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict):
+                self.username = msg
+                self.events.append(("username", msg))
+                return
+
+        # the router paired us, move to the game server it picked
+        if data.get("type") == "redirect":
+            return data
+
+        # keyframes carry the full state, deltas patch the previous one
+        if data.get("type") == "keyframe":
+            self.seq = data["seq"]
+            self.awaiting_keyframe = False
+            self.state = data["state"]
+
+        elif data.get("type") == "delta":
+            if self.state is None or self.seq is None or data["seq"] != self.seq + 1:
+                self.request_resync()
+                return
+            self.seq = data["seq"]
+            self.state = apply_delta(self.state, data)
+
+        else:
+            self.events.append(("message", data))
+            return
+
+        self.events.append(("state", (self.state, time.monotonic())))
+
+    # Runs on the render thread before each frame: UI messages are handled in order,
+    # consecutive states collapse into the latest one
+    def process_events(self):
+        latest = None
+
+        while self.events:
+            kind, data = self.events.popleft()
+
+            if kind == "state":
+                state, received_at = data
+                self.predictor.on_frame(state, received_at)
+                latest = state
+                continue
+
+            if latest is not None:
+                self.show_state(latest)
+                latest = None
+
+            if kind == "username":
+                self.render.username = data
+                self.predictor.username = data
+
+            elif kind == "message":
+                self.show_message(data)
+
+            elif kind == "closed":
+                # when server is terminated - force exit UI loop
+                self.render.ui_state = UIState.GAME_OVER
+                self.render.game_over_message = "Server terminated"
+
+        if latest is not None:
+            self.show_state(latest)
+
+    def show_message(self, data):
+        # result screen
+        if data.get("type") == "result":
             self.render.ui_state = UIState.GAME_OVER
-            self.render.game_over_message = "Server terminated"
+            self.render.state = None
+
+            if data["winner"] is None:
+                self.render.game_over_message = "MATCH ABANDONED"
+            elif self.spectate is not None:
+                self.render.game_over_message = f"{data['winner']} WINS!"
+            elif data["winner"] == self.username:
+                self.render.game_over_message = "YOU WIN!"
+            else:
+                self.render.game_over_message = "YOU LOST!"
+            return
+        
+        # Waiting message
+        if data.get("type") == "waiting":
+            if self.render.ui_state in (UIState.USERNAME, UIState.WAITING):
+                self.render.ui_state = UIState.WAITING
+
+        # ratings shown while waiting for an opponent
+        if data.get("type") == "leaderboard":
+            self.render.leaderboard = data
+
+    def show_state(self, data):
+        # game state
+        if self.render.ui_state in (UIState.WAITING, UIState.USERNAME):
+            self.render.game_over_message = ""
+            self.render.dimensions = data["dimensions"]
+            self.render.setup_game_screen()
+
+            # spectators have no role to explain
+            if self.spectate is not None:
+                self.render.ui_state = UIState.GAME
+
+            # Determine role once players match
+            player = data["players"].get(self.username)
+            if player:
+                self.render.instruction_role = player["role"]
+                self.render.instruction_start_time = pygame.time.get_ticks()
+                self.render.ui_state = UIState.INSTRUCTIONS
+
+            self.render.screen = pygame.display.set_mode(
+                (self.render.screen_width, self.render.screen_height)
+            )
+
+        # Always update state and set to GAME when receiving game state
+        self.render.state = data
+        if self.render.ui_state == UIState.WAITING:
+            self.render.ui_state == UIState.GAME
+
+    # Reconnects to the game server the router assigned to our match
+    async def follow_redirect(self, redirect):
+        old_websocket = self.websocket
+        self.port = redirect["port"]
+        self.websocket = await websockets.connect(f"ws://{self.host}:{self.port}")
+        await old_websocket.close()
+
+        # players carry the match token to the worker, spectators only switch servers
+        await self.websocket.send(self.handshake(redirect.get("match")))
+
+    # Asks the server for a keyframe after a missed delta
+    def request_resync(self):
+        if self.awaiting_keyframe:
+            return
+        self.awaiting_keyframe = True
+        self.send({"resync": True})
+
+    # Safe to call from either thread, the send itself runs on the network loop
+    def send(self, message):
+        self.send_raw(encode_input(message, self.encoding))
+
+    def send_raw(self, data):
+        if self.disconnected:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.send_now, data)
+        except RuntimeError:
+            # the network loop closed after the check above
+            pass
+
+    def send_now(self, data):
+        if not self.disconnected:
+            asyncio.create_task(self.websocket.send(data))
+
+    def handshake(self, match=None):
+        if self.spectate is not None:
+            return json.dumps({"spectate": self.spectate, "rate": self.rate, "encoding": self.encoding})
+
+        data = {"username": self.username, "encoding": self.encoding}
+        if match:
+            data["match"] = match
+        return json.dumps(data)
 
     def send_username(self, username):
         self.username = username
-        asyncio.create_task(
-            self.websocket.send(json.dumps({"username": username}))
-        )
+        self.predictor.username = username
+        self.send_raw(self.handshake())
 
     def send_direction(self, key):
-        asyncio.create_task(
-            self.websocket.send(json.dumps({"direction": key}))
-        )
+        # shown right away, the server's frames correct it if needed
+        self.predictor.on_input(key)
+        self.send({"direction": key})
 
     def send_action(self, action):
-        asyncio.create_task(
-            self.websocket.send(json.dumps({"action": action}))
-        )
+        self.send({"action": action})
 
 if __name__ == "__main__":
     host = input("Enter server IP: ")
-    asyncio.run(Client(host, 5050).start())
\ No newline at end of file
+    room = input("Room to spectate (leave empty to play): ").strip()
+
+    if room:
+        Client(host, 5050, spectate=int(room)).start()
+    else:
+        Client(host, 5050).start()
\ No newline at end of file
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from array import array
+
+import websockets
+
+from protocol import BINARY, JSON, apply_delta, decode_frame, encode_input
+
+# Headless bots for capacity tests: no pygame, same handshake and inputs as Client
+
+DIRECTIONS = {
+    "w": (-1, 0),
+    "a": (0, -1),
+    "s": (1, 0),
+    "d": (0, 1)
+}
+
+CONTROLLER_ACTIONS = ["food_up", "food_down", "food_left", "food_right"]
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class Stats:
+    def __init__(self):
+        self.started = time.monotonic()
+
+        self.connect_times = array("d") # socket open
+        self.match_times = array("d") # handshake to first game frame
+        self.intervals = array("d") # game frame inter-arrival
+        self.jitter = array("d") # change between consecutive inter-arrivals
+
+        self.connected = 0 # currently open
+        self.connects = 0
+        self.errors = 0
+        self.matches = 0
+        self.frames = 0
+        self.keyframes = 0
+        self.dropped = 0 # deltas missed according to their sequence numbers
+        self.resyncs = 0
+        self.bytes = 0
+        self.inputs = 0
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        ms = lambda values, fraction: percentile(values, fraction) * 1000
+
+        lines = [
+            f"--- {elapsed:.0f}s: {self.connected} connected, {self.connects} connects, {self.errors} errors, {self.matches} matches",
+            f"connect ms     p50 {ms(self.connect_times, 0.5):7.1f}  p95 {ms(self.connect_times, 0.95):7.1f}  p99 {ms(self.connect_times, 0.99):7.1f}",
+            f"match wait ms  p50 {ms(self.match_times, 0.5):7.1f}  p95 {ms(self.match_times, 0.95):7.1f}  p99 {ms(self.match_times, 0.99):7.1f}",
+            f"frame gap ms   p50 {ms(self.intervals, 0.5):7.1f}  p95 {ms(self.intervals, 0.95):7.1f}  p99 {ms(self.intervals, 0.99):7.1f}",
+            f"jitter ms      p50 {ms(self.jitter, 0.5):7.1f}  p95 {ms(self.jitter, 0.95):7.1f}  p99 {ms(self.jitter, 0.99):7.1f}",
+            f"frames {self.frames} ({self.keyframes} keyframes), dropped {self.dropped}, resyncs {self.resyncs}, inputs sent {self.inputs}",
+            f"received {self.bytes / 1e6:.1f} MB ({self.bytes / max(elapsed, 1e-9) / 1e3:.1f} kB/s)",
+        ]
+        print("\n".join(lines), flush=True)
+
+class Bot:
+    def __init__(self, index, host, port, encoding, stats, input_interval, rng):
+        self.name = f"bot{index}"
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+        self.stats = stats
+        self.input_interval = input_interval
+        self.rng = rng
+
+        self.username = None
+        self.state = None
+        self.seq = None
+        self.awaiting_keyframe = False
+
+    # Plays matches back to back until the deadline
+    async def run(self, deadline):
+        while time.monotonic() < deadline:
+            try:
+                await self.play(deadline)
+            except (OSError, websockets.exceptions.WebSocketException, asyncio.TimeoutError):
+                self.stats.errors += 1
+                await asyncio.sleep(1 + self.rng.random())
+
+    async def connect(self, port, match=None):
+        started = time.monotonic()
+        websocket = await asyncio.wait_for(websockets.connect(f"ws://{self.host}:{port}", max_queue=None), 30)
+        self.stats.connect_times.append(time.monotonic() - started)
+        self.stats.connects += 1
+
+        handshake = {"username": self.name, "encoding": self.encoding}
+        if match:
+            handshake["match"] = match
+        await websocket.send(json.dumps(handshake))
+        return websocket
+
+    async def play(self, deadline):
+        self.username = self.state = self.seq = None
+        self.awaiting_keyframe = False
+
+        websocket = await self.connect(self.port)
+        self.stats.connected += 1
+        joined = time.monotonic()
+        last_frame = last_interval = None
+        inputs = asyncio.create_task(self.send_inputs(websocket))
+
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    msg = await asyncio.wait_for(websocket.recv(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    return
+
+                self.stats.bytes += len(msg)
+                data = self.decode(msg)
+                if data is None:
+                    continue
+
+                kind = data.get("type")
+
+                # router picked a game server for our match
+                if kind == "redirect":
+                    await websocket.close()
+                    websocket = await self.connect(data["port"], data["match"])
+                    inputs.cancel()
+                    inputs = asyncio.create_task(self.send_inputs(websocket))
+                    continue
+
+                if kind == "result":
+                    self.stats.matches += 1
+                    return
+
+                if kind not in ("keyframe", "delta"):
+                    continue
+
+                now = time.monotonic()
+                if self.state is None:
+                    self.stats.match_times.append(now - joined)
+                if last_frame is not None:
+                    interval = now - last_frame
+                    self.stats.intervals.append(interval)
+                    if last_interval is not None:
+                        self.stats.jitter.append(abs(interval - last_interval))
+                    last_interval = interval
+                last_frame = now
+
+                self.apply(data, websocket)
+        finally:
+            inputs.cancel()
+            self.stats.connected -= 1
+            await websocket.close()
+
+    def decode(self, msg):
+        if isinstance(msg, bytes):
+            return decode_frame(msg)
+        try:
+            data = json.loads(msg)
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            self.username = msg
+            return None
+        return data
+
+    # Keeps the state like Client does, counting the deltas lost on the way
+    def apply(self, data, websocket):
+        self.stats.frames += 1
+
+        if data["type"] == "keyframe":
+            self.stats.keyframes += 1
+            self.seq = data["seq"]
+            self.awaiting_keyframe = False
+            self.state = data["state"]
+            return
+
+        # after a gap every delta waits for the keyframe, seq stays at the last one applied
+        if self.awaiting_keyframe:
+            return
+
+        if self.state is None or self.seq is None or data["seq"] != self.seq + 1:
+            if self.seq is not None and data["seq"] > self.seq + 1:
+                self.stats.dropped += data["seq"] - self.seq - 1
+            self.awaiting_keyframe = True
+            self.stats.resyncs += 1
+            asyncio.create_task(websocket.send(encode_input({"resync": True}, self.encoding)))
+            return
+
+        self.seq = data["seq"]
+        self.state = apply_delta(self.state, data)
+
+    # Sends inputs at random intervals, whatever suits the bot's role
+    async def send_inputs(self, websocket):
+        try:
+            while True:
+                await asyncio.sleep(self.rng.expovariate(1 / self.input_interval))
+
+                message = self.choose_input()
+                if message is None:
+                    continue
+                await websocket.send(encode_input(message, self.encoding))
+                self.stats.inputs += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def choose_input(self):
+        player = self.state and self.state["players"].get(self.username)
+        if not player:
+            return None
+
+        if player["role"] == "controller":
+            if self.rng.random() < 0.05:
+                return {"action": "spawn_wall"}
+            return {"action": self.rng.choice(CONTROLLER_ACTIONS)}
+
+        if player["role"] == "snake" and player["segments"]:
+            return self.steer(player)
+        return None
+
+    # Turns towards the food, avoiding the border and walls a step ahead
+    def steer(self, player):
+        (y, x), (dy, dx) = player["segments"][0], player["direction"]
+        height, width = self.state["dimensions"]
+        fy, fx = self.state["food_pos"]
+        blocked = {tuple(cell) for wall in self.state["walls"] for cell in wall["cells"]}
+
+        options = []
+        for key, (ny, nx) in DIRECTIONS.items():
+            if (ny, nx) == (-dy, -dx):
+                continue
+            cell = (y + ny, x + nx)
+            if not (0 < cell[0] < height - 1 and 0 < cell[1] < width - 1) or cell in blocked:
+                continue
+            options.append((abs(fy - cell[0]) + abs(fx - cell[1]), key))
+
+        if not options:
+            return None
+
+        # mostly chase the food, sometimes wander
+        options.sort()
+        key = options[0][1] if self.rng.random() < 0.8 else self.rng.choice(options)[1]
+        if DIRECTIONS[key] == (dy, dx):
+            return None
+        return {"direction": key}
+
+async def report_every(stats, seconds):
+    while True:
+        await asyncio.sleep(seconds)
+        stats.report()
+
+async def main(args):
+    stats = Stats()
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.duration
+    reporter = asyncio.create_task(report_every(stats, args.report_every))
+
+    bots = []
+    for i in range(args.clients):
+        bot = Bot(i, args.host, args.port, args.encoding, stats, args.input_interval, random.Random(rng.random()))
+        bots.append(asyncio.create_task(bot.run(deadline)))
+
+        # ramp up instead of opening every connection at once
+        await asyncio.sleep(1 / args.ramp)
+
+    await asyncio.gather(*bots)
+    reporter.cancel()
+    stats.report()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless bot swarm for load testing the snake server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--ramp", type=float, default=200, help="new connections per second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run")
+    parser.add_argument("--encoding", default=BINARY, choices=(BINARY, JSON))
+    parser.add_argument("--input-interval", type=float, default=0.5, help="mean seconds between inputs per bot")
+    parser.add_argument("--report-every", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+class Predictor:
+    # Same keys and rules as State.DIRECTION_MAP on the server
+    DIRECTION_MAP = {
+        "w": [-1, 0],
+        "a": [0, -1],
+        "s": [1, 0],
+        "d": [0, 1]
+    }
+
+    MIN_TICK = 0.05
+    MAX_TICK = 1.0
+
+    def __init__(self, username=None):
+        self.username = username
+
+        # last authoritative frame
+        self.segments = {} # username -> [[y, x], ...]
+        self.directions = {}
+        self.food_pos = None
+        self.dimensions = None
+        self.walls = set() # (y, x) of every wall cell
+        self.running = False # snakes only move once the countdown is over
+        self.frame_time = None
+
+        # estimated server tick, refined from frame arrival times
+        self.tick_interval = 0.3
+
+        # local turn not yet confirmed by the server
+        self.pending_direction = None
+
+        # predicted next frame, rebuilt on every authoritative frame or local turn
+        self.next_segments = {}
+
+    # Stores an authoritative frame and reconciles the local prediction with it
+    def on_frame(self, state, now):
+        if self.frame_time is not None:
+            interval = min(self.MAX_TICK, max(self.MIN_TICK, now - self.frame_time))
+            self.tick_interval += (interval - self.tick_interval) * 0.2
+
+        self.frame_time = now
+        self.food_pos = state["food_pos"]
+        self.dimensions = state["dimensions"]
+        self.walls = {(y, x) for wall in state["walls"] for y, x in wall["cells"]}
+        # the server only counts down the match time once the snakes move
+        self.running = state["remaining_time"] is not None and not state["game_over"]
+        self.segments = {}
+        self.directions = {}
+
+        for username, player in state["players"].items():
+            if player["role"] == "snake" and player["segments"]:
+                self.segments[username] = player["segments"]
+                self.directions[username] = player["direction"]
+
+        # the server applied our turn, nothing left to predict on top of it
+        if self.directions.get(self.username) == self.pending_direction:
+            self.pending_direction = None
+
+        self.predict()
+
+    # Applies our own turn immediately, returns False if the server would reject it
+    def on_input(self, key):
+        if key not in self.DIRECTION_MAP or self.username not in self.directions:
+            return False
+
+        new_dir = self.DIRECTION_MAP[key]
+        current = self.pending_direction or self.directions[self.username]
+        if [new_dir[0] + current[0], new_dir[1] + current[1]] == [0, 0]:
+            return False
+
+        self.pending_direction = new_dir
+        self.predict()
+        return True
+
+    # Moves every snake one tick ahead with the server's update rules
+    def predict(self):
+        self.next_segments = {}
+        if not self.running:
+            return
+
+        for username, segments in self.segments.items():
+            direction = self.directions[username]
+            if username == self.username and self.pending_direction:
+                direction = self.pending_direction
+            self.next_segments[username] = self.step(segments, direction)
+
+    def step(self, segments, direction):
+        head = [segments[0][0] + direction[0], segments[0][1] + direction[1]]
+        height, width = self.dimensions
+
+        # the snake dies on the border or a wall, keep it where it is
+        if head[0] in (0, height - 1) or head[1] in (0, width - 1) or tuple(head) in self.walls:
+            return segments
+
+        if head == self.food_pos:
+            return [head] + segments
+        return [head] + segments[:-1]
+
+    # Fraction of the way from the last frame to the predicted next one
+    def alpha(self, now):
+        if self.frame_time is None:
+            return 0.0
+        return min(1.0, (now - self.frame_time) / self.tick_interval)
+
+    # Segment positions (floats, in cells) to draw for a snake at the given time
+    def interpolated_segments(self, username, now):
+        segments = self.segments.get(username)
+        if not segments:
+            return []
+
+        target = self.next_segments.get(username, segments)
+        alpha = self.alpha(now)
+
+        positions = []
+        for i, (ty, tx) in enumerate(target):
+            sy, sx = segments[min(i, len(segments) - 1)]
+            positions.append((sy + (ty - sy) * alpha, sx + (tx - sx) * alpha))
+        return positions
@@ -0,0 +1,226 @@
+import json
+import struct
+
+# Client side of the wire protocol, must match server/protocol.py
+
+JSON = "json"
+BINARY = "binary"
+
+FRAME_KEYFRAME = 1
+FRAME_DELTA = 2
+FRAME_WAITING = 3
+FRAME_RESULT = 4
+
+DELTA_PLAYERS = 1
+DELTA_FOOD = 2
+DELTA_TIME = 4
+DELTA_GAME_OVER = 8
+DELTA_MESSAGE = 16
+DELTA_WALLS_ADDED = 32
+DELTA_WALLS_REMOVED = 64
+DELTA_SPAWNS_LEFT = 128
+
+PLAYER_HEAD = 1
+PLAYER_TAIL = 2
+PLAYER_SCORE = 4
+PLAYER_DIRECTION = 8
+PLAYER_ROLE = 16
+
+INPUT_DIRECTION = 1
+INPUT_ACTION = 2
+INPUT_RESYNC = 3
+
+ACTIONS = ["food_up", "food_down", "food_left", "food_right", "spawn_wall"]
+
+HEADER = struct.Struct("!BI")
+DELTA_FLAGS = struct.Struct("!H")
+CELL = struct.Struct("!HH")
+SHORT = struct.Struct("!H")
+SIGNED_SHORT = struct.Struct("!h")
+DIRECTION = struct.Struct("!bb")
+WALL = struct.Struct("!IdH")
+WALL_ID = struct.Struct("!I")
+
+# Encodes an input message ({"direction": ...}, {"action": ...} or {"resync": True})
+def encode_input(message, encoding):
+    if encoding != BINARY:
+        return json.dumps(message)
+
+    if "direction" in message:
+        return bytes((INPUT_DIRECTION, ord(message["direction"])))
+    if "action" in message:
+        return bytes((INPUT_ACTION, ACTIONS.index(message["action"])))
+    if "resync" in message:
+        return bytes((INPUT_RESYNC,))
+
+    raise ValueError(f"Unknown input: {message}")
+
+# Decodes a binary frame into the same dict the JSON encoding carries, None if it
+# is truncated or malformed
+def decode_frame(data):
+    try:
+        return read_frame(data)
+    except (struct.error, IndexError, ValueError):
+        # UnicodeDecodeError and JSONDecodeError are ValueErrors too
+        return None
+
+def read_frame(data):
+    frame_type, seq = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+
+    if frame_type == FRAME_KEYFRAME:
+        return {"type": "keyframe", "seq": seq, "state": json.loads(data[offset:])}
+
+    if frame_type == FRAME_WAITING:
+        return {"type": "waiting"}
+
+    if frame_type == FRAME_RESULT:
+        winner, offset = read_long_str(data, offset)
+        return {"type": "result", "winner": winner or None}
+
+    if frame_type == FRAME_DELTA:
+        return decode_delta(data, seq, offset)
+
+    raise ValueError(f"Unknown frame type: {frame_type}")
+
+def read_str(data, offset):
+    length = data[offset]
+    offset += 1
+    return data[offset:offset + length].decode(), offset + length
+
+def read_long_str(data, offset):
+    (length,) = SHORT.unpack_from(data, offset)
+    offset += SHORT.size
+    return data[offset:offset + length].decode(), offset + length
+
+def read_cells(data, offset, count):
+    cells = []
+    for _ in range(count):
+        y, x = CELL.unpack_from(data, offset)
+        cells.append([y, x])
+        offset += CELL.size
+    return cells, offset
+
+def decode_delta(data, seq, offset):
+    frame = {"type": "delta", "seq": seq}
+    (flags,) = DELTA_FLAGS.unpack_from(data, offset)
+    offset += DELTA_FLAGS.size
+
+    if flags & DELTA_PLAYERS:
+        players = {}
+        count = data[offset]
+        offset += 1
+        for _ in range(count):
+            username, offset = read_long_str(data, offset)
+            players[username], offset = read_player(data, offset)
+        frame["players"] = players
+
+    if flags & DELTA_FOOD:
+        y, x = CELL.unpack_from(data, offset)
+        frame["food_pos"] = [y, x]
+        offset += CELL.size
+
+    if flags & DELTA_TIME:
+        (remaining_time,) = SIGNED_SHORT.unpack_from(data, offset)
+        frame["remaining_time"] = None if remaining_time < 0 else remaining_time
+        offset += SIGNED_SHORT.size
+
+    if flags & DELTA_GAME_OVER:
+        frame["game_over"] = bool(data[offset])
+        offset += 1
+
+    if flags & DELTA_MESSAGE:
+        frame["game_over_message"], offset = read_long_str(data, offset)
+
+    if flags & DELTA_WALLS_ADDED:
+        walls = []
+        count = data[offset]
+        offset += 1
+        for _ in range(count):
+            wall_id, expires_at, cell_count = WALL.unpack_from(data, offset)
+            offset += WALL.size
+            cells, offset = read_cells(data, offset, cell_count)
+            walls.append({"id": wall_id, "cells": cells, "expires_at": expires_at})
+        frame["walls_added"] = walls
+
+    if flags & DELTA_WALLS_REMOVED:
+        count = data[offset]
+        offset += 1
+        removed = []
+        for _ in range(count):
+            (wall_id,) = WALL_ID.unpack_from(data, offset)
+            removed.append(wall_id)
+            offset += WALL_ID.size
+        frame["walls_removed"] = removed
+
+    if flags & DELTA_SPAWNS_LEFT:
+        spawns_left = {}
+        count = data[offset]
+        offset += 1
+        for _ in range(count):
+            username, offset = read_long_str(data, offset)
+            spawns_left[username] = data[offset]
+            offset += 1
+        frame["wall_spawns_left"] = spawns_left
+
+    return frame
+
+def read_player(data, offset):
+    changes = {}
+    flags = data[offset]
+    offset += 1
+
+    if flags & PLAYER_HEAD:
+        (count,) = SHORT.unpack_from(data, offset)
+        offset += SHORT.size
+        changes["head"], offset = read_cells(data, offset, count)
+
+    if flags & PLAYER_TAIL:
+        (changes["tail"],) = SHORT.unpack_from(data, offset)
+        offset += SHORT.size
+
+    if flags & PLAYER_SCORE:
+        (changes["score"],) = SHORT.unpack_from(data, offset)
+        offset += SHORT.size
+
+    if flags & PLAYER_DIRECTION:
+        changes["direction"] = list(DIRECTION.unpack_from(data, offset))
+        offset += DIRECTION.size
+
+    if flags & PLAYER_ROLE:
+        role, offset = read_str(data, offset)
+        changes["role"] = role or None
+
+    return changes, offset
+
+# Applies a delta frame to the last known state. The result is a new state sharing
+# unchanged parts, so a state handed to another thread is never modified.
+def apply_delta(state, delta):
+    state = dict(state)
+    state["players"] = dict(state["players"])
+
+    for username, changes in delta.get("players", {}).items():
+        player = state["players"][username] = dict(state["players"][username])
+        segments = player["segments"]
+
+        if "tail" in changes:
+            segments = segments[:max(0, len(segments) - changes["tail"])]
+        if "head" in changes:
+            segments = changes["head"] + segments
+        player["segments"] = segments
+
+        for key in ("score", "direction", "role"):
+            if key in changes:
+                player[key] = changes[key]
+
+    for key in ("food_pos", "remaining_time", "game_over", "game_over_message", "wall_spawns_left"):
+        if key in delta:
+            state[key] = delta[key]
+
+    if "walls_removed" in delta:
+        removed = set(delta["walls_removed"])
+        state["walls"] = [w for w in state["walls"] if w["id"] not in removed]
+    if "walls_added" in delta:
+        state["walls"] = state["walls"] + delta["walls_added"]
+
+    return state
@@ -1,5 +1,6 @@
 import pygame
 import sys
+import time
 
 class UIState:
     USERNAME = "username"
@@ -11,6 +12,7 @@ class UIState:
 class Render:
     LEADERBOARD_WIDTH = 200
     CELL_SIZE = 15
+    GAME_FPS = 60 # snakes are interpolated between server ticks
 
     COLOURS = {
         1: (255, 0, 0),
@@ -48,11 +50,23 @@ class Render:
 
         self.game_over = False
         self.game_over_message = ""
+        self.leaderboard = None # lobby ratings sent by the server
 
         # player role instructions
         self.instruction_start_time = None
         self.instruction_role = None
 
+        # client side prediction, set by the client
+        self.predictor = None
+
+        # cached game screen: background surface, text surfaces and what was drawn last frame
+        self.background = None
+        self.background_walls = None
+        self.text_cache = {}
+        self.hud = {} # key -> (text, rect)
+        self.cell_rects = []
+        self.dirty_rects = []
+
     def cleanup(self):
         pygame.quit()
         sys.exit()
@@ -68,6 +82,7 @@ class Render:
 
             if now - self.instruction_start_time >= 9000:
                 self.ui_state = UIState.GAME
+                self.background = None # full redraw over the instructions
                 return
 
             for event in pygame.event.get():
@@ -109,9 +124,7 @@ class Render:
                 if event.type == pygame.QUIT:
                     self.cleanup()
 
-            self.screen.fill((0, 0, 0))
-            text = self.font.render("Waiting for other player to join...", True, (255, 255, 255))
-            self.screen.blit(text, (150, 200))
+            self.draw_waiting()
             pygame.display.flip()
             self.clock.tick(30)
             return
@@ -161,52 +174,163 @@ class Render:
         # drawing
         if self.ui_state == UIState.GAME:
             self.draw()
+            pygame.display.update(self.dirty_rects)
+        else:
+            pygame.display.flip()
 
-        pygame.display.flip()
-        self.clock.tick(15)
+        self.clock.tick(self.GAME_FPS)
 
-    # main draw loop
+    # main draw loop: the board, walls and role label live on a cached background surface,
+    # each frame only the areas under last frame's cells, this frame's cells and changed text
+    # are restored from it and redrawn
     def draw(self):
-        self.screen.fill((0, 0, 0))
-
-        self.draw_board()
-        self.draw_food(self.state["food_pos"])
-        self.draw_snakes(self.state["players"])
-        self.draw_hud()
-        player = self.state["players"][self.username]
-
-        if player["role"] == "snake":
-            self.draw_score(player["score"])
+        player = self.state["players"].get(self.username)
+        role = player["role"] if player else "spectator"
+
+        walls = self.state.get("walls", [])
+        wall_ids = [wall.get("id") for wall in walls]
+
+        full_redraw = self.background is None or wall_ids != self.background_walls
+        if full_redraw:
+            self.build_background(walls, role)
+            self.cell_rects = []
+            self.hud = {}
+
+        cells = [((255, 165, 0), self.food_rect(self.state["food_pos"]))]
+        cells.extend(self.snake_cells(self.state["players"]))
+
+        dirty = self.cell_rects + [rect for colour, rect in cells]
+
+        # text is alpha blended over the cells, so any text touching a dirty area has to be
+        # erased and drawn again, which can in turn dirty the text overlapping it
+        texts = {}
+        for key, (text, colour, position) in self.hud_items(player, role).items():
+            surface = self.render_text(text, colour)
+            texts[key] = (text, surface, surface.get_rect(**position))
+
+        redraw = set()
+        for key, (text, rect) in self.hud.items():
+            if key not in texts or texts[key][0] != text:
+                dirty.append(rect)
+        for key, (text, surface, rect) in texts.items():
+            if self.hud.get(key, (None,))[0] != text:
+                redraw.add(key)
+                dirty.append(rect)
+
+        changed = True
+        while changed:
+            changed = False
+            for key, (text, surface, rect) in texts.items():
+                if key not in redraw and rect.collidelist(dirty) != -1:
+                    redraw.add(key)
+                    dirty.append(rect)
+                    changed = True
+
+        if full_redraw:
+            self.screen.blit(self.background, (0, 0))
+            dirty = [self.screen.get_rect()]
+        else:
+            for rect in dirty:
+                self.screen.blit(self.background, rect, rect)
+
+        for colour, rect in cells:
+            pygame.draw.rect(self.screen, colour, rect)
+
+        for key, (text, surface, rect) in texts.items():
+            if full_redraw or key in redraw:
+                self.screen.blit(surface, rect)
+
+        self.cell_rects = [rect for colour, rect in cells]
+        self.hud = {key: (text, rect) for key, (text, surface, rect) in texts.items()}
+        self.dirty_rects = dirty
+
+    # Renders a line of text once and reuses the surface until the text changes
+    def render_text(self, text, colour):
+        key = (text, colour)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) > 512:
+                self.text_cache.clear()
+            surface = self.text_cache[key] = self.font.render(text, True, colour)
+        return surface
+
+    def build_background(self, walls, role):
+        self.background = pygame.Surface(self.screen.get_size())
+        self.background.fill((0, 0, 0))
+        self.background_walls = [wall.get("id") for wall in walls]
+
+        self.draw_board(self.background)
+        self.draw_walls(walls, self.background)
+
+        label = self.render_text(f"Role: {role.upper()}", (200, 200, 200))
+        self.background.blit(label, (10, 10))
+
+    # Text shown over the board: key -> (text, colour, position)
+    def hud_items(self, player, role):
+        items = {}
+        board_right = self.width * self.CELL_SIZE
 
-        self.draw_leaderboard(self.state["players"])
-        self.draw_walls(self.state.get("walls", []))
+        remaining_time = self.state.get("remaining_time")
+        if remaining_time is not None:
+            minutes = remaining_time // 60
+            seconds = remaining_time % 60
+
+            items["time"] = (
+                f"TIME LEFT: {minutes:02}:{seconds:02}",
+                (255, 200, 200),
+                {"topleft": (self.screen_width // 2 - 200, 10)}
+            )
+            items["win"] = (
+                f"POINTS TO WIN: {self.state.get('score_to_win')}",
+                (200, 200, 255),
+                {"topleft": (self.screen_width // 2 - 200, 30)}
+            )
 
-        role = self.state["players"][self.username]["role"]
-        label = self.font.render(f"Role: {role.upper()}", True, (200, 200, 200))
+        if role == "snake":
+            items["score"] = (
+                f"Score: {player['score']}",
+                (255, 255, 255),
+                {"topleft": (10, self.screen_height - 30)}
+            )
 
         if role == "controller":
             remaining = self.state.get("wall_spawns_left", {}).get(self.username, 0)
-
-            text = self.font.render(
+            items["walls"] = (
                 f"WALL SPAWNS LEFT: {remaining}",
-                True,
-                (255, 100, 100)
+                (255, 100, 100),
+                {"top": 10, "right": board_right - 10}
             )
-            text_rect = text.get_rect(
-                top=10,
-                right=self.width * self.CELL_SIZE - 10
-            )
-            self.screen.blit(text, text_rect)
 
-        self.screen.blit(label, (10, 10))
+        # leaderboard: snake players sorted by score
+        snakes = sorted(
+            (
+                (username, p)
+                for username, p in self.state["players"].items()
+                if p["role"] == "snake"
+            ),
+            key=lambda item: item[1]["score"],
+            reverse=True
+        )
+
+        if snakes:
+            x_offset = board_right + 10
+            items["leaderboard"] = ("LEADERBOARD", (255, 255, 255), {"topleft": (x_offset, 10)})
+
+            y = 40
+            for i, (username, snake) in enumerate(snakes):
+                colour = self.COLOURS.get(snake["colour"], (255, 255, 255))
+                items[f"leaderboard_{i}"] = (f"{username}: {snake['score']}", colour, {"topleft": (x_offset, y)})
+                y += 20
 
-    def draw_board(self):
+        return items
+
+    def draw_board(self, surface):
         rect = pygame.Rect(
             0, 0,
             self.width * self.CELL_SIZE,
             self.height * self.CELL_SIZE
         )
-        pygame.draw.rect(self.screen, (255, 255, 255), rect, 2)
+        pygame.draw.rect(surface, (255, 255, 255), rect, 2)
 
     def setup_game_screen(self):
         self.height, self.width = self.dimensions
@@ -219,6 +343,7 @@ class Render:
         self.screen = pygame.display.set_mode(
             (self.screen_width, self.screen_height)
         )
+        self.background = None
 
     def draw_username_screen(self):
         self.screen.fill((0, 0, 0))
@@ -242,74 +367,67 @@ class Render:
                 if len(self.input_text) < 12:
                     self.input_text += event.unicode
 
-    def draw_food(self, pos):
+    def food_rect(self, pos):
         y, x = pos
-        pygame.draw.rect(
-            self.screen,
-            (255, 165, 0),
-            pygame.Rect(
-                x * self.CELL_SIZE,
-                y * self.CELL_SIZE,
-                self.CELL_SIZE,
-                self.CELL_SIZE
-            )
+        return pygame.Rect(
+            x * self.CELL_SIZE,
+            y * self.CELL_SIZE,
+            self.CELL_SIZE,
+            self.CELL_SIZE
         )
 
-    def draw_snakes(self, players):
+    # (colour, rect) for every snake cell to draw this frame
+    def snake_cells(self, players):
+        cells = []
+        now = time.monotonic()
+
         for username, player in players.items():
             if player["role"] != "snake":
                 continue 
 
             colour = self.COLOURS[player["colour"]]
-            for y, x in player["segments"]:
-                pygame.draw.rect(
-                    self.screen,
-                    colour,
-                    pygame.Rect(
-                        x * self.CELL_SIZE,
-                        y * self.CELL_SIZE,
-                        self.CELL_SIZE,
-                        self.CELL_SIZE
-                    )
+
+            segments = player["segments"]
+            if self.predictor:
+                segments = self.predictor.interpolated_segments(username, now) or segments
+
+            for y, x in segments:
+                rect = pygame.Rect(
+                    round(x * self.CELL_SIZE),
+                    round(y * self.CELL_SIZE),
+                    self.CELL_SIZE,
+                    self.CELL_SIZE
                 )
+                cells.append((colour, rect))
 
-    def draw_score(self, score):
-        text = self.font.render(f"Score: {score}", True, (255, 255, 255))
-        self.screen.blit(text, (10, self.screen_height - 30))
+        return cells
 
-    def draw_leaderboard(self, players):
-        # Only include snake players
-        snakes = {
-            username: player
-            for username, player in players.items()
-            if player["role"] == "snake"
-        }
+    def draw_waiting(self):
+        self.screen.fill((0, 0, 0))
+        text = self.font.render("Waiting for other player to join...", True, (255, 255, 255))
 
-        if not snakes:
+        if not self.leaderboard:
+            self.screen.blit(text, (150, 200))
             return
 
-        x_offset = self.width * self.CELL_SIZE + 10
-        y = 10
+        self.screen.blit(text, text.get_rect(center=(self.screen_width // 2, 30)))
 
-        # Title
-        title = self.font.render("LEADERBOARD", True, (255, 255, 255))
-        self.screen.blit(title, (x_offset, y))
-        y += 30
+        # top players of each role side by side, then the player's own standing
+        columns = (("snake", "Top Snakes", (0, 255, 0), 40), ("controller", "Top Controllers", (255, 255, 0), 320))
+        for role, title, colour, x in columns:
+            self.screen.blit(self.font.render(title, True, colour), (x, 70))
+            for i, entry in enumerate(self.leaderboard["top"].get(role, [])):
+                line = f"{i + 1:>2}. {entry['username'][:12]:<12} {entry['rating']:>4}"
+                self.screen.blit(self.font.render(line, True, (255, 255, 255)), (x, 100 + i * 22))
 
-        # Sort snakes by score
-        for username, snake in sorted(
-            snakes.items(),
-            key=lambda item: item[1]["score"],
-            reverse=True
-        ):
-            colour = self.COLOURS.get(snake["colour"], (255, 255, 255))
-            text = self.font.render(
-                f"{username}: {snake['score']}",
-                True,
-                colour
-            )
-            self.screen.blit(text, (x_offset, y))
-            y += 20
+        you = self.leaderboard.get("you", {})
+        standing = "  ".join(
+            f"{role}: #{you[role]['rank']} of {you[role]['players']} ({you[role]['rating']})"
+            for role in ("snake", "controller") if role in you
+        )
+        if standing:
+            text = self.font.render(standing, True, (0, 255, 255))
+            self.screen.blit(text, text.get_rect(center=(self.screen_width // 2, 360)))
 
     def draw_game_over(self):
         self.screen.fill((0, 0, 0))
@@ -328,7 +446,7 @@ class Render:
         self.screen.blit(text, rect)
         self.screen.blit(sub, sub_rect)
 
-    def draw_walls(self, walls):
+    def draw_walls(self, walls, surface):
         WALL_FILL = (90, 90, 90) # dark gray
         WALL_BORDER = (140, 140, 140) # lighter edge
 
@@ -342,10 +460,10 @@ class Render:
                 )
 
                 # fill
-                pygame.draw.rect(self.screen, WALL_FILL, rect)
+                pygame.draw.rect(surface, WALL_FILL, rect)
 
                 # border
-                pygame.draw.rect(self.screen, WALL_BORDER, rect, 2)
+                pygame.draw.rect(surface, WALL_BORDER, rect, 2)
 
     def draw_instructions(self):
         self.screen.fill((0, 0, 0))
@@ -383,32 +501,4 @@ class Render:
             text = self.font.render(line, True, color)
             rect = text.get_rect(center=(self.screen_width // 2, y))
             self.screen.blit(text, rect)
-            y += 30
-
-    def draw_hud(self):
-        if not self.state:
-            return
-        
-        remaining_time = self.state.get("remaining_time")
-        score_to_win = self.state.get("score_to_win")
-
-        if remaining_time is None:
-            return
-        
-        minutes = remaining_time // 60
-        seconds = remaining_time % 60
-
-        time_text = self.font.render(
-            f"TIME LEFT: {minutes:02}:{seconds:02}",
-            True,
-            (255, 200, 200)
-        )
-
-        win_text = self.font.render(
-            f"POINTS TO WIN: {score_to_win}",
-            True,
-            (200, 200, 255)
-        )
-
-        self.screen.blit(time_text, (self.screen_width // 2 - 200, 10))
-        self.screen.blit(win_text, (self.screen_width // 2 - 200, 30))
\ No newline at end of file
+            y += 30
\ No newline at end of file
@@ -0,0 +1,511 @@
+import argparse
+import logging
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from state import State
+from simulation import Simulation
+
+# Tunable rules, defaulting to the values State uses
+RULES = ("START_DELAY", "BASE_TICK", "MIN_TICK", "SPEED_STEP", "TIME_LIMIT",
+    "SCORE_TO_WIN", "WALL_LIMIT", "WALL_COOLDOWN", "WALL_LIFETIME")
+
+KEYS = list(State.DIRECTION_MAP) # direction index -> key, opposite directions are 2 apart
+
+# Match outcomes, checked in the order State.update_state checks them
+RUNNING = 0
+SNAKE_WON = 1
+OUT_OF_TIME = 2
+SNAKE_DIED = 3
+
+WALL_OFFSETS = range(-4, 4) # widest wall State spawns: length 7 covers -7 // 2 .. 7 // 2
+
+class BatchSimulation:
+    # n snake-vs-controller matches held as arrays, one row per board, all advanced
+    # by one vectorized step. Same rules as State.update_state; the random draws
+    # (spawn points, food, wall lengths) come from a NumPy generator instead of
+    # random.Random, so boards match State tick for tick only with the same draws.
+    def __init__(self, n, dimensions=None, seed=0, skip_countdown=True, **rules):
+        if np is None:
+            raise ImportError("BatchSimulation needs numpy (pip install numpy)")
+
+        reference = State(dimensions)
+        for name in RULES:
+            setattr(self, name, rules.pop(name, getattr(reference, name)))
+        if rules:
+            raise TypeError(f"Unknown rules: {', '.join(rules)}")
+
+        self.n = n
+        self.dimensions = reference.dimensions
+        self.height, self.width = self.dimensions
+        self.size = self.height * self.width
+        self.skip_countdown = skip_countdown
+        self.rng = np.random.default_rng(seed)
+
+        self.dy = np.array([State.DIRECTION_MAP[k][0] for k in KEYS])
+        self.dx = np.array([State.DIRECTION_MAP[k][1] for k in KEYS])
+
+        # cells food can spawn on, the same margin as the grid's free cell index
+        margin = reference.grid.FREE_MARGIN
+        self.margin = np.zeros(self.dimensions, dtype=bool)
+        self.margin[margin:self.height - margin, margin:self.width - margin] = True
+        self.margin = self.margin.reshape(-1)
+
+        # occupancy: wall cells and snake segments per cell (a snake may cross itself)
+        self.walls = np.zeros((n, self.size), dtype=bool)
+        self.counts = np.zeros((n, self.size), dtype=np.uint16)
+        self.walls_flat = self.walls.reshape(-1)
+        self.counts_flat = self.counts.reshape(-1)
+
+        # snake bodies as rings of packed cells (y * width + x), head at body[b, head[b]]
+        self.body = np.zeros((n, 8), dtype=np.int32)
+        self.head = np.zeros(n, dtype=np.intp)
+        self.length = np.zeros(n, dtype=np.intp)
+        self.direction = np.zeros(n, dtype=np.intp)
+
+        self.food = np.zeros(n, dtype=np.intp)
+        self.score = np.zeros(n, dtype=np.int32)
+        self.tick_interval = np.zeros(n)
+        self.now = np.zeros(n)
+        self.match_start = np.zeros(n)
+        self.remaining_time = np.zeros(n, dtype=np.int64) # -1 until the first update
+        self.outcome = np.zeros(n, dtype=np.int8)
+
+        # live walls: cells per slot (-1 unused) and expiry; a wall that got no cells
+        # takes no slot. Lifetimes longer than the cooldown allow more live walls.
+        self.max_walls = self.WALL_LIMIT * (1 + int(min(self.WALL_LIFETIME, 10 * self.WALL_COOLDOWN) // self.WALL_COOLDOWN))
+        self.wall_cells = np.full((n, self.max_walls, len(WALL_OFFSETS)), -1, dtype=np.intp)
+        self.wall_expires = np.full((n, self.max_walls), np.inf)
+
+        # wall spawn quota: the controller's last WALL_LIMIT spawn times
+        self.wall_spawns = np.full((n, self.WALL_LIMIT), -np.inf)
+
+        self.ticks = 0
+        self.reset()
+
+    @property
+    def game_over(self):
+        return self.outcome != RUNNING
+
+    # Starts new matches on the given boards (all when None), drawn like State.add_player
+    def reset(self, boards=None):
+        boards = np.arange(self.n) if boards is None else np.asarray(boards, dtype=np.intp)
+        k = len(boards)
+        if not k:
+            return
+
+        self.clear(boards)
+
+        # food inside a buffer of 3 like State.get_random_position, snake inside 5
+        h, w = self.height, self.width
+        food_y = self.rng.integers(4, h - 4, k)
+        food_x = self.rng.integers(4, w - 4, k)
+        snake_y = self.rng.integers(5, h - 5, k)
+        snake_x = self.rng.integers(5, w - 5, k)
+
+        self.food[boards] = food_y * w + food_x
+        self.body[boards, 0] = snake_y * w + snake_x
+        self.length[boards] = 1
+        self.direction[boards] = self.rng.integers(0, 4, k)
+        self.counts_flat[boards * self.size + self.body[boards, 0]] += 1
+
+        self.now[boards] = self.START_DELAY if self.skip_countdown else 0.0
+        self.match_start[boards] = self.START_DELAY
+
+    def clear(self, boards):
+        self.walls[boards] = False
+        self.counts[boards] = 0
+        self.head[boards] = 0
+        self.length[boards] = 0
+        self.score[boards] = 0
+        self.tick_interval[boards] = self.BASE_TICK
+        self.remaining_time[boards] = -1
+        self.outcome[boards] = RUNNING
+        self.wall_cells[boards] = -1
+        self.wall_expires[boards] = np.inf
+        self.wall_spawns[boards] = -np.inf
+
+    # Copies a two player State (one snake, one controller) onto a board
+    def load_state(self, board, state):
+        self.clear([board])
+        snake = next((p for p in state.players.values() if p.role == "snake"), None)
+        controller = next((u for u, p in state.players.items() if p.role == "controller"), None)
+
+        if snake and snake.body:
+            self.grow(len(snake.body) + 1)
+            self.body[board, :len(snake.body)] = list(snake.body)
+            self.length[board] = len(snake.body)
+            self.direction[board] = KEYS.index(next(k for k, v in State.DIRECTION_MAP.items() if v == snake.direction))
+            self.score[board] = snake.score
+            np.add.at(self.counts[board], list(snake.body), 1)
+
+        for slot, wall in enumerate(w for w in state.walls if w["cells"]):
+            cells = [y * self.width + x for y, x in wall["cells"]]
+            self.wall_cells[board, slot, :len(cells)] = cells
+            self.wall_expires[board, slot] = wall["expires_at"]
+            self.walls[board, cells] = True
+
+        spawns = [t for t, u in state.wall_spawns if u == controller][-self.WALL_LIMIT:]
+        self.wall_spawns[board, :len(spawns)] = spawns
+
+        self.food[board] = state.food_pos[0] * self.width + state.food_pos[1]
+        self.tick_interval[board] = state.tick_interval
+        self.now[board] = state.clock()
+        self.match_start[board] = state.match_start_time
+        self.remaining_time[board] = -1 if state.remaining_time is None else state.remaining_time
+        if state.game_over:
+            self.outcome[board] = SNAKE_WON if snake and state.winner in state.players and state.players[state.winner] is snake else SNAKE_DIED
+
+    # Snake segments of a board as [y, x], head first
+    def segments(self, board):
+        order = (self.head[board] + np.arange(self.length[board])) % self.body.shape[1]
+        return [[int(i) // self.width, int(i) % self.width] for i in self.body[board, order]]
+
+    def walls_of(self, board):
+        cells = self.wall_cells[board]
+        return [[[int(i) // self.width, int(i) % self.width] for i in wall if i >= 0] for wall in cells if (wall >= 0).any()]
+
+    # Makes room for bodies of the given length, unrolling every ring to start at 0
+    def grow(self, length):
+        capacity = self.body.shape[1]
+        if length <= capacity:
+            return
+        while capacity < length:
+            capacity *= 2
+
+        order = (self.head[:, None] + np.arange(self.body.shape[1])) % self.body.shape[1]
+        body = np.zeros((self.n, capacity), dtype=np.int32)
+        body[:, :self.body.shape[1]] = np.take_along_axis(self.body, order, axis=1)
+        self.body = body
+        self.head[:] = 0
+
+    # Random draws, overridable to replay another engine's draws
+    def draw_wall_lengths(self, boards):
+        return self.rng.integers(5, 8, len(boards))
+
+    # A uniformly random free cell for each board, or -1 when the board has none
+    def draw_food(self, boards, free):
+        weights = self.rng.random(free.shape)
+        weights[~free] = -1.0
+        cells = weights.argmax(axis=1)
+        return np.where(free.any(axis=1), cells, -1)
+
+    # Advances every board by one tick and returns game_over. Inputs, all optional:
+    #   turns       direction index per board (KEYS order), -1 for none
+    #   food_moves  net food move per board as (n, 2) [dy, dx]
+    #   spawn_walls True where the controller spawns a wall
+    # applied in the order the room's input buffer drains them.
+    def step(self, turns=None, food_moves=None, spawn_walls=None):
+        running = self.outcome == RUNNING
+
+        if turns is not None:
+            self.turn(turns, running)
+        if food_moves is not None:
+            self.move_food(food_moves)
+        if spawn_walls is not None:
+            self.spawn_walls(np.flatnonzero(np.asarray(spawn_walls) & running))
+
+        self.update(np.flatnonzero(running & (self.now >= self.match_start)))
+
+        self.now += self.tick_interval
+        self.ticks += 1
+        return self.game_over
+
+    def turn(self, turns, running):
+        turns = np.asarray(turns)
+        allowed = running & (turns >= 0) & (turns != (self.direction + 2) % 4)
+        self.direction[allowed] = turns[allowed]
+
+    def move_food(self, food_moves):
+        y, x = np.divmod(self.food, self.width)
+        y = np.clip(y + food_moves[:, 0], 1, self.height - 2)
+        x = np.clip(x + food_moves[:, 1], 1, self.width - 2)
+        self.food = y * self.width + x
+
+    def spawn_walls(self, boards):
+        if not len(boards):
+            return
+
+        now = self.now[boards]
+        recent = (now[:, None] - self.wall_spawns[boards]) < self.WALL_COOLDOWN
+        boards = boards[recent.sum(axis=1) < self.WALL_LIMIT]
+        if not len(boards):
+            return
+
+        now = self.now[boards]
+        self.wall_spawns[boards, self.wall_spawns[boards].argmin(axis=1)] = now
+
+        # perpendicular to movement, 5 cells ahead of the head
+        lengths = self.draw_wall_lengths(boards)
+        head_y, head_x = np.divmod(self.body[boards, self.head[boards]], self.width)
+        d = self.direction[boards]
+        base_y = head_y + self.dy[d] * 5
+        base_x = head_x + self.dx[d] * 5
+
+        offsets = np.array(WALL_OFFSETS)
+        vertical = (self.dy[d] != 0)[:, None]
+        y = base_y[:, None] + np.where(vertical, 0, offsets)
+        x = base_x[:, None] + np.where(vertical, offsets, 0)
+
+        # offsets range(-length // 2, length // 2 + 1), on empty cells inside the border
+        inside = (
+            (offsets >= -((lengths[:, None] + 1) // 2)) & (offsets <= lengths[:, None] // 2)
+            & (y >= 1) & (y <= self.height - 2) & (x >= 1) & (x <= self.width - 2)
+        )
+        cells = np.where(inside, y * self.width + x, 0)
+        flat = boards[:, None] * self.size + cells
+        placed = inside & ~self.walls_flat[flat] & (self.counts_flat[flat] == 0)
+
+        keep = placed.any(axis=1)
+        boards, placed, cells, flat, now = boards[keep], placed[keep], cells[keep], flat[keep], now[keep]
+        if not len(boards):
+            return
+
+        # an unused slot, or the wall expiring first when every slot is live
+        unused = (self.wall_cells[boards] < 0).all(axis=2)
+        slots = np.where(unused.any(axis=1), unused.argmax(axis=1), self.wall_expires[boards].argmin(axis=1))
+        self.remove_walls(boards, slots)
+
+        self.wall_cells[boards, slots] = np.where(placed, cells, -1)
+        self.wall_expires[boards, slots] = now + self.WALL_LIFETIME
+        self.walls_flat[flat[placed]] = True
+
+    def remove_walls(self, boards, slots):
+        cells = self.wall_cells[boards, slots]
+        used = cells >= 0
+        self.walls_flat[(boards[:, None] * self.size + cells)[used]] = False
+        self.wall_cells[boards, slots] = -1
+        self.wall_expires[boards, slots] = np.inf
+
+    # State.update_state for the boards past their countdown
+    def update(self, boards):
+        if not len(boards):
+            return
+
+        expired = self.wall_expires[boards] <= self.now[boards, None]
+        if expired.any():
+            rows, slots = np.nonzero(expired)
+            self.remove_walls(boards[rows], slots)
+
+        self.grow(self.length.max() + 1)
+        capacity = self.body.shape[1]
+
+        # move: wall or border on the new head kills the snake (it can cross itself)
+        d = self.direction[boards]
+        new_head = self.body[boards, self.head[boards]] + self.dy[d] * self.width + self.dx[d]
+        y, x = np.divmod(new_head, self.width)
+        dead = (
+            self.walls_flat[boards * self.size + new_head]
+            | (y == 0) | (y == self.height - 1) | (x == 0) | (x == self.width - 1)
+        )
+
+        alive = ~dead
+        movers, new_head = boards[alive], new_head[alive]
+        head = (self.head[movers] - 1) % capacity
+        self.head[movers] = head
+        self.body[movers, head] = new_head
+        self.length[movers] += 1
+        self.counts_flat[movers * self.size + new_head] += 1
+
+        # food check: eaters keep their tail
+        ate = new_head == self.food[movers]
+        tails = movers[~ate]
+        tail = self.body[tails, (self.head[tails] + self.length[tails] - 1) % capacity]
+        self.length[tails] -= 1
+        self.counts_flat[tails * self.size + tail] -= 1
+
+        eaters = movers[ate]
+        if len(eaters):
+            self.regenerate_food(eaters)
+
+        # the dead snake leaves the board
+        died = boards[dead]
+        if len(died):
+            self.counts[died] = 0
+            self.length[died] = 0
+
+        elapsed = self.now[boards] - self.match_start[boards]
+        remaining = np.maximum(0, (self.TIME_LIMIT - elapsed).astype(np.int64))
+        self.remaining_time[boards] = remaining
+
+        won = alive & (self.score[boards] >= self.SCORE_TO_WIN) & (remaining > 0)
+        self.outcome[boards] = np.select(
+            [won, remaining <= 0, dead],
+            [SNAKE_WON, OUT_OF_TIME, SNAKE_DIED],
+            RUNNING
+        )
+
+    def regenerate_food(self, boards):
+        free = self.margin & ~self.walls[boards] & (self.counts[boards] == 0)
+        cells = self.draw_food(boards, free)
+        self.food[boards] = np.where(cells >= 0, cells, self.food[boards])
+
+        self.score[boards] += 1
+        self.tick_interval[boards] = np.maximum(self.MIN_TICK, self.tick_interval[boards] - self.SPEED_STEP)
+
+# Replays the random draws a set of reference States made, so boards can be compared with them
+class ScriptedDraws(BatchSimulation):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wall_lengths = np.zeros(self.n, dtype=np.intp)
+        self.foods = np.zeros(self.n, dtype=np.intp)
+        self.problems = []
+
+    def draw_wall_lengths(self, boards):
+        return self.wall_lengths[boards]
+
+    def draw_food(self, boards, free):
+        cells = self.foods[boards]
+        for board, row, cell in zip(boards, free, cells):
+            if not row[cell]:
+                self.problems.append(f"board {board} tick {self.ticks}: food placed on a cell that is not free")
+        return cells
+
+# Records State's randint calls, the only draws made while a match runs are wall lengths
+class RecordingRandom(random.Random):
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.draws = []
+
+    def randint(self, a, b):
+        value = super().randint(a, b)
+        self.draws.append(value)
+        return value
+
+# Plays the same random inputs through Simulation and BatchSimulation, returns the differences
+def validate(matches=200, ticks=600, seed=0, dimensions=None, **rules):
+    rng = random.Random(seed)
+    sims = []
+    for k in range(matches):
+        sim = Simulation(seed=seed + k, dimensions=dimensions)
+        for name, value in rules.items():
+            setattr(sim.state, name, value)
+        recording = RecordingRandom(0)
+        recording.setstate(sim.state.rng.getstate())
+        sim.state.rng = recording
+        sims.append(sim)
+
+    batch = ScriptedDraws(matches, dimensions, **rules)
+    for k, sim in enumerate(sims):
+        batch.load_state(k, sim.state)
+
+    for tick in range(ticks):
+        turns = np.full(matches, -1)
+        food_moves = np.zeros((matches, 2), dtype=np.intp)
+        spawn_walls = np.zeros(matches, dtype=bool)
+
+        for k, sim in enumerate(sims):
+            if sim.state.game_over:
+                continue
+
+            # mostly the autopilot, so snakes live long enough to eat, win and time out
+            inputs = sim.autopilot()
+            if rng.random() < 0.1:
+                inputs = [(sim.SNAKE, {"direction": rng.choice(KEYS)})]
+            if inputs:
+                turns[k] = KEYS.index(inputs[0][1]["direction"])
+
+            # the food sometimes drifts towards the snake's head
+            if rng.random() < 0.8:
+                (y, x), (fy, fx) = sim.state.players[sim.SNAKE].get_head(), sim.state.food_pos
+                food_moves[k] = [(y > fy) - (y < fy), (x > fx) - (x < fx)] if rng.random() < 0.7 else [rng.randint(-1, 1), 0]
+                inputs.append((sim.CONTROLLER, {"food_move": food_moves[k].tolist()}))
+            if rng.random() < 0.02:
+                spawn_walls[k] = True
+                inputs.append((sim.CONTROLLER, {"action": "spawn_wall"}))
+
+            sim.state.rng.draws.clear()
+            sim.step(inputs)
+            if sim.state.rng.draws:
+                batch.wall_lengths[k] = sim.state.rng.draws[0]
+            batch.foods[k] = sim.state.food_pos[0] * batch.width + sim.state.food_pos[1]
+
+        batch.step(turns, food_moves, spawn_walls)
+        for k, sim in enumerate(sims):
+            for problem in compare(batch, k, sim.state):
+                batch.problems.append(f"board {k} tick {tick}: {problem}")
+
+        if batch.problems:
+            break
+
+    return batch.problems
+
+def compare(batch, board, state):
+    snake = state.players.get(Simulation.SNAKE)
+    problems = []
+
+    expected = {
+        "game_over": state.game_over,
+        "snake_won": state.game_over and state.winner == Simulation.SNAKE,
+        "segments": snake.segments if snake else [],
+        "score": snake.score if snake else None,
+        "food_pos": state.food_pos,
+        "walls": sorted(w["cells"] for w in state.walls if w["cells"]),
+        "tick_interval": state.tick_interval,
+        "remaining_time": -1 if state.remaining_time is None else state.remaining_time,
+    }
+    actual = {
+        "game_over": bool(batch.game_over[board]),
+        "snake_won": bool(batch.outcome[board] == SNAKE_WON),
+        "segments": batch.segments(board),
+        "score": int(batch.score[board]) if snake else None,
+        "food_pos": [int(batch.food[board]) // batch.width, int(batch.food[board]) % batch.width],
+        "walls": sorted(batch.walls_of(board)),
+        "tick_interval": float(batch.tick_interval[board]),
+        "remaining_time": int(batch.remaining_time[board]),
+    }
+
+    for name, value in expected.items():
+        if actual[name] != value:
+            problems.append(f"{name} {actual[name]!r}, State has {value!r}")
+    return problems
+
+# Random play on every board, finished boards start a new match straight away
+def benchmark(boards, ticks, seed):
+    batch = BatchSimulation(boards, seed=seed)
+    rng = np.random.default_rng(seed)
+    moves = np.array([[-1, 0], [1, 0], [0, -1], [0, 1], [0, 0]])
+
+    # inputs drawn up front so only the engine is timed
+    turns = np.where(rng.random((ticks, boards)) < 0.2, rng.integers(0, 4, (ticks, boards)), -1)
+    food_moves = moves[rng.integers(0, len(moves), (ticks, boards))]
+    spawn_walls = rng.random((ticks, boards)) < 0.02
+
+    matches = 0
+    started = time.perf_counter()
+    for t in range(ticks):
+        done = batch.step(turns[t], food_moves[t], spawn_walls[t])
+        finished = np.flatnonzero(done)
+        matches += len(finished)
+        batch.reset(finished)
+    elapsed = time.perf_counter() - started
+
+    print(f"{boards} boards x {ticks} ticks in {elapsed:.2f}s: {boards * ticks / elapsed:,.0f} match-ticks/s, {matches} matches finished")
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized batch of snake matches for offline balancing")
+    parser.add_argument("--boards", type=int, default=4096)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--validate", action="store_true", help="check the batch against State instead of benchmarking")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    if args.validate:
+        problems = validate(seed=args.seed)
+        for problem in problems[:20]:
+            print(f"MISMATCH: {problem}")
+        print("batch matches State" if not problems else f"{len(problems)} mismatches")
+        raise SystemExit(1 if problems else 0)
+
+    benchmark(args.boards, args.ticks, args.seed)
+
+if __name__ == "__main__":
+    main()
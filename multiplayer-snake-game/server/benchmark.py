@@ -0,0 +1,98 @@
+import argparse
+import itertools
+import logging
+import time
+import tracemalloc
+
+from simulation import Simulation
+
+BOARD_SIZES = [[30, 50], [60, 100], [120, 200]]
+SNAKE_LENGTHS = [1, 50, 500]
+WALL_COUNTS = [0, 4, 32]
+
+# Builds a simulation that keeps running for the whole benchmark
+def make_simulation(seed, dimensions, length, walls):
+    sim = Simulation(seed=seed, dimensions=dimensions)
+    state = sim.state
+
+    # no win / timeout / speed-up during the benchmark
+    state.SCORE_TO_WIN = float("inf")
+    state.TIME_LIMIT = 10 ** 9
+    state.SPEED_STEP = 0
+    state.WALL_LIFETIME = float("inf")
+
+    sim.set_snake_length(length)
+
+    # walls spread over the lower half of the board, away from the snake
+    height, width = dimensions
+    for _ in range(walls):
+        y = state.rng.randint(height // 2, height - 3)
+        x = state.rng.randint(1, width - 8)
+        cells = [[y, x + i] for i in range(6) if state.grid.is_empty(y, x + i)]
+        state.add_wall(cells, sim.clock())
+
+    return sim
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+# Runs one scenario and returns its stats
+def run_scenario(dimensions, length, walls, ticks, seed=0):
+    sim = make_simulation(seed, dimensions, length, walls)
+    latencies = []
+    restarts = 0
+
+    for _ in range(ticks):
+        inputs = sim.autopilot()
+        start = time.perf_counter_ns()
+        game_over = sim.step(inputs)
+        latencies.append(time.perf_counter_ns() - start)
+
+        # snake got boxed in: start over with the same layout
+        if game_over or sim.SNAKE not in sim.state.players:
+            restarts += 1
+            sim = make_simulation(seed + restarts, dimensions, length, walls)
+
+    # allocations over a shorter traced run
+    sim = make_simulation(seed, dimensions, length, walls)
+    traced_ticks = max(1, ticks // 10)
+    tracemalloc.start()
+    for _ in range(traced_ticks):
+        sim.step(sim.autopilot())
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies) / 1e9
+
+    return {
+        "ticks_per_sec": ticks / total if total else float("inf"),
+        "p50_us": percentile(latencies, 50) / 1000,
+        "p95_us": percentile(latencies, 95) / 1000,
+        "p99_us": percentile(latencies, 99) / 1000,
+        "peak_kib": peak / 1024,
+        "restarts": restarts,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless State.update_state benchmark")
+    parser.add_argument("--ticks", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    print(f"{'board':>9} {'length':>6} {'walls':>5} {'ticks/s':>10} {'p50 us':>8} {'p95 us':>8} {'p99 us':>8} {'peak KiB':>9} {'restarts':>8}")
+    for dimensions, length, walls in itertools.product(BOARD_SIZES, SNAKE_LENGTHS, WALL_COUNTS):
+        stats = run_scenario(dimensions, length, walls, args.ticks, args.seed)
+        board = f"{dimensions[0]}x{dimensions[1]}"
+        print(
+            f"{board:>9} {length:>6} {walls:>5} {stats['ticks_per_sec']:>10.0f} "
+            f"{stats['p50_us']:>8.1f} {stats['p95_us']:>8.1f} {stats['p99_us']:>8.1f} "
+            f"{stats['peak_kib']:>9.1f} {stats['restarts']:>8}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+class DeltaEncoder:
+    KEYFRAME_INTERVAL = 50 # ticks between forced keyframes
+
+    # top level fields sent whenever they change
+    TRACKED_FIELDS = ("food_pos", "remaining_time", "game_over", "game_over_message")
+
+    def __init__(self):
+        self.seq = 0
+        self.ticks_since_keyframe = 0
+        self.force_keyframe = True
+
+        self.fields = {}
+        self.players = {} # username -> (player, heads_added, tails_removed, score, direction, role)
+        self.wall_ids = set()
+        self.wall_spawns_left = {}
+
+    # Next frame will be a keyframe (e.g. when a client lost frames)
+    def request_keyframe(self):
+        self.force_keyframe = True
+
+    # Builds either a full keyframe or a diff against the previous frame
+    def encode(self, state):
+        self.seq += 1
+
+        if (
+            self.force_keyframe
+            or self.ticks_since_keyframe >= self.KEYFRAME_INTERVAL
+            or state.players.keys() != self.players.keys()
+            or any(self.players[u][0] is not p for u, p in state.players.items())
+        ):
+            return self.keyframe(state)
+
+        self.ticks_since_keyframe += 1
+        return self.delta(state)
+
+    def keyframe(self, state):
+        self.force_keyframe = False
+        self.ticks_since_keyframe = 0
+
+        self.fields = {key: getattr(state, key) for key in self.TRACKED_FIELDS}
+        self.players = {u: self.player_marker(p) for u, p in state.players.items()}
+        self.wall_ids = {w["id"] for w in state.walls}
+        self.wall_spawns_left = state.get_wall_spawns_left()
+
+        # the state is already encoded from cached fragments
+        return {"type": "keyframe", "seq": self.seq, "state_json": state.to_json()}
+
+    def delta(self, state):
+        message = {"type": "delta", "seq": self.seq}
+
+        # players: new heads, number of tail cells removed, changed score / direction
+        players = {}
+        for username, player in state.players.items():
+            _, heads, tails, score, direction, role = self.players[username]
+            marker = self.player_marker(player)
+            if marker == self.players[username]:
+                continue
+
+            changes = {}
+            if player.heads_added != heads:
+                changes["head"] = player.get_head_segments(player.heads_added - heads)
+            if player.tails_removed != tails:
+                changes["tail"] = player.tails_removed - tails
+            if player.score != score:
+                changes["score"] = player.score
+            if player.direction != direction:
+                changes["direction"] = player.direction
+            if player.role != role:
+                changes["role"] = player.role
+
+            players[username] = changes
+            self.players[username] = marker
+
+        if players:
+            message["players"] = players
+
+        # scalar fields
+        for key in self.TRACKED_FIELDS:
+            value = getattr(state, key)
+            if value != self.fields[key]:
+                message[key] = value
+                self.fields[key] = value
+
+        # walls spawned / expired
+        wall_ids = {w["id"] for w in state.walls}
+        if wall_ids != self.wall_ids:
+            added = [w for w in state.walls if w["id"] not in self.wall_ids]
+            removed = list(self.wall_ids - wall_ids)
+            if added:
+                message["walls_added"] = added
+            if removed:
+                message["walls_removed"] = removed
+            self.wall_ids = wall_ids
+
+        # wall quota
+        wall_spawns_left = state.get_wall_spawns_left()
+        if wall_spawns_left != self.wall_spawns_left:
+            message["wall_spawns_left"] = wall_spawns_left
+            self.wall_spawns_left = wall_spawns_left
+
+        return message
+
+    def player_marker(self, player):
+        return (player, player.heads_added, player.tails_removed, player.score, list(player.direction), player.role)
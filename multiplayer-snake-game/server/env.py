@@ -0,0 +1,277 @@
+import argparse
+import logging
+import random
+import time
+from multiprocessing import Pipe, Process, shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from state import State
+from simulation import Simulation
+from grid import SNAKE_BASE, WALL
+from inputs import FOOD_MOVES
+from batch_simulation import BatchSimulation, SNAKE_WON
+
+# Reset/step environments for training snake and controller bots on the game rules.
+# Every step takes one action per role and returns rewards for both, the snake's
+# reward is the controller's loss:
+#   snake action       0 keeps going, 1-4 turn to SNAKE_ACTIONS[a] (State.DIRECTION_MAP keys)
+#   controller action  0 does nothing, 1-5 the CONTROLLER_ACTIONS[a] input
+SNAKE_ACTIONS = [None] + list(State.DIRECTION_MAP)
+CONTROLLER_ACTIONS = [None] + list(FOOD_MOVES) + ["spawn_wall"]
+SPAWN_WALL = CONTROLLER_ACTIONS.index("spawn_wall")
+
+# Observations are uint8 tensors of shape (OBS_CHANNELS, height, width), one plane each
+OBS_CHANNELS = ("walls", "snake", "head", "food")
+
+FOOD_REWARD = 1.0
+WIN_REWARD = 5.0 # snake wins, or loses by dying or running out of time
+
+def require_numpy():
+    if np is None:
+        raise ImportError("The environments need numpy (pip install numpy)")
+
+# One match through Simulation: deterministic game clock, seeded rng and no countdown
+class SnakeEnv:
+    def __init__(self, dimensions=None, seed=0, **rules):
+        require_numpy()
+        self.dimensions = dimensions
+        self.rules = rules
+        self.rng = random.Random(seed)
+        self.sim = None
+
+    # Starts a new match and returns its first observation
+    def reset(self, seed=None):
+        self.sim = Simulation(seed=self.rng.getrandbits(32) if seed is None else seed, dimensions=self.dimensions)
+        for name, value in self.rules.items():
+            setattr(self.sim.state, name, value)
+        return self.observe()
+
+    # Returns (observation, (snake reward, controller reward), done, info)
+    def step(self, snake_action=0, controller_action=0):
+        state = self.sim.state
+        snake = state.players.get(Simulation.SNAKE)
+        score = snake.score if snake else 0
+
+        # same order as the room's input buffer drains them
+        inputs = []
+        if snake_action:
+            inputs.append((Simulation.SNAKE, {"direction": SNAKE_ACTIONS[snake_action]}))
+        if controller_action:
+            inputs.append((Simulation.CONTROLLER, {"action": CONTROLLER_ACTIONS[controller_action]}))
+        done = self.sim.step(inputs)
+
+        snake = state.players.get(Simulation.SNAKE)
+        reward = (snake.score - score) * FOOD_REWARD if snake else 0.0
+        if done:
+            reward += WIN_REWARD if state.winner == Simulation.SNAKE else -WIN_REWARD
+
+        info = {
+            "score": snake.score if snake else score,
+            "remaining_time": state.remaining_time,
+            "winner": state.winner,
+            "message": state.game_over_message
+        }
+        return self.observe(), (reward, -reward), done, info
+
+    def observe(self):
+        state = self.sim.state
+        height, width = state.dimensions
+        cells = np.frombuffer(state.grid.cells, dtype=np.uint8)
+
+        obs = np.zeros((len(OBS_CHANNELS), height * width), dtype=np.uint8)
+        obs[0] = cells == WALL
+        obs[1] = cells >= SNAKE_BASE
+
+        snake = state.players.get(Simulation.SNAKE)
+        if snake and snake.body:
+            obs[2, snake.get_head_index()] = 1
+        obs[3, state.food_pos[0] * width + state.food_pos[1]] = 1
+        return obs.reshape(len(OBS_CHANNELS), height, width)
+
+# n matches stepped at once on BatchSimulation. Finished boards start a new match
+# within the same step, so every call returns observations of running matches.
+class BatchEnv:
+    # out: optional (n, OBS_CHANNELS, height, width) uint8 array to write observations into
+    def __init__(self, n, dimensions=None, seed=0, out=None, **rules):
+        require_numpy()
+        self.sim = BatchSimulation(n, dimensions, seed=seed, **rules)
+        self.n = n
+        height, width = self.sim.dimensions
+
+        self.food_moves = np.zeros((len(CONTROLLER_ACTIONS), 2), dtype=np.intp)
+        for action, move in FOOD_MOVES.items():
+            self.food_moves[CONTROLLER_ACTIONS.index(action)] = move
+
+        # observation buffer, reused by every step: copy what has to be kept
+        if out is None:
+            out = np.zeros((n, len(OBS_CHANNELS), height, width), dtype=np.uint8)
+        self.obs = out
+        self.planes = out.reshape(n, len(OBS_CHANNELS), -1)
+        self.rows = np.arange(n)
+        self.heads = np.zeros(n, dtype=np.intp)
+        self.foods = np.zeros(n, dtype=np.intp)
+
+    def reset(self):
+        self.sim.reset()
+        self.planes[:] = 0
+        return self.observe()
+
+    # Takes (n,) snake and controller actions, returns (observations, (n, 2) rewards,
+    # done, outcome) where outcome is BatchSimulation's code for the finished matches
+    def step(self, snake_actions, controller_actions):
+        sim = self.sim
+        controller_actions = np.asarray(controller_actions)
+        score = sim.score.copy()
+
+        done = sim.step(
+            np.asarray(snake_actions) - 1,
+            self.food_moves[controller_actions],
+            controller_actions == SPAWN_WALL
+        )
+        outcome = sim.outcome.copy()
+
+        reward = (sim.score - score) * FOOD_REWARD
+        reward = np.where(done, reward + np.where(outcome == SNAKE_WON, WIN_REWARD, -WIN_REWARD), reward)
+        rewards = np.stack([reward, -reward], axis=1)
+
+        sim.reset(np.flatnonzero(done))
+        return self.observe(), rewards, done, outcome
+
+    # Rewrites the dense planes, head and food planes only move one cell per board
+    def observe(self):
+        sim, planes = self.sim, self.planes
+        np.copyto(planes[:, 0], sim.walls)
+        np.greater(sim.counts, 0, out=planes[:, 1])
+
+        planes[self.rows, 2, self.heads] = 0
+        planes[self.rows, 3, self.foods] = 0
+        self.heads = sim.body[self.rows, sim.head]
+        self.foods = sim.food.copy()
+        planes[self.rows, 2, self.heads] = 1
+        planes[self.rows, 3, self.foods] = 1
+        return self.obs
+
+def worker_main(conn, memory_name, offset, n, dimensions, seed, rules):
+    memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        height, width = BatchSimulation(1, dimensions).dimensions
+        out = np.ndarray((n, len(OBS_CHANNELS), height, width), dtype=np.uint8, buffer=memory.buf, offset=offset)
+        env = BatchEnv(n, dimensions, seed=seed, out=out, **rules)
+
+        while True:
+            command, *args = conn.recv()
+            if command == "reset":
+                env.reset()
+                conn.send(None)
+            elif command == "step":
+                _, rewards, done, outcome = env.step(*args)
+                conn.send((rewards, done, outcome))
+            else:
+                break
+        del out, env
+    finally:
+        memory.close()
+        conn.close()
+
+# BatchEnv split over worker processes, observations shared through one block of shared memory
+class ParallelEnv:
+    def __init__(self, n, workers=2, dimensions=None, seed=0, **rules):
+        require_numpy()
+        height, width = BatchSimulation(1, dimensions).dimensions
+        shape = (n, len(OBS_CHANNELS), height, width)
+        plane = len(OBS_CHANNELS) * height * width
+
+        self.n = n
+        self.memory = shared_memory.SharedMemory(create=True, size=n * plane)
+        self.obs = np.ndarray(shape, dtype=np.uint8, buffer=self.memory.buf)
+
+        # contiguous slices of boards per worker
+        bounds = np.linspace(0, n, workers + 1).astype(int)
+        self.slices = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        self.conns = []
+        self.processes = []
+
+        for i, part in enumerate(self.slices):
+            conn, child = Pipe()
+            process = Process(
+                target=worker_main,
+                args=(child, self.memory.name, part.start * plane, part.stop - part.start, dimensions, seed + i, rules),
+                daemon=True
+            )
+            process.start()
+            child.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def reset(self):
+        for conn in self.conns:
+            conn.send(("reset",))
+        for conn in self.conns:
+            conn.recv()
+        return self.obs
+
+    # Same as BatchEnv.step, the workers step their boards in parallel
+    def step(self, snake_actions, controller_actions):
+        for conn, part in zip(self.conns, self.slices):
+            conn.send(("step", snake_actions[part], controller_actions[part]))
+
+        results = [conn.recv() for conn in self.conns]
+        rewards, done, outcome = (np.concatenate(parts) for parts in zip(*results))
+        return self.obs, rewards, done, outcome
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(("close",))
+        for process in self.processes:
+            process.join()
+
+        del self.obs
+        self.memory.close()
+        self.memory.unlink()
+
+# Random actions, the same for every environment so only stepping is compared
+def benchmark(envs, workers, ticks, seed):
+    rng = np.random.default_rng(seed)
+    snake_actions = rng.integers(0, len(SNAKE_ACTIONS), (ticks, envs))
+    controller_actions = np.where(rng.random((ticks, envs)) < 0.02, SPAWN_WALL, rng.integers(0, SPAWN_WALL, (ticks, envs)))
+
+    env = SnakeEnv(seed=seed)
+    env.reset()
+    steps = min(ticks * 10, 5000)
+    started = time.perf_counter()
+    for t in range(steps):
+        _, _, done, _ = env.step(snake_actions[t % ticks, 0], controller_actions[t % ticks, 0])
+        if done:
+            env.reset()
+    report("SnakeEnv", steps, time.perf_counter() - started)
+
+    for name, env in (("BatchEnv", BatchEnv(envs, seed=seed)), (f"ParallelEnv x{workers}", ParallelEnv(envs, workers, seed=seed))):
+        env.reset()
+        started = time.perf_counter()
+        for t in range(ticks):
+            env.step(snake_actions[t], controller_actions[t])
+        report(name, envs * ticks, time.perf_counter() - started)
+        if isinstance(env, ParallelEnv):
+            env.close()
+
+def report(name, steps, elapsed):
+    print(f"{name:>16}: {steps} steps in {elapsed:.2f}s, {steps / elapsed:,.0f} steps/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Step throughput of the training environments")
+    parser.add_argument("--envs", type=int, default=4096, help="environments in the batched variants")
+    parser.add_argument("--workers", type=int, default=2, help="processes for ParallelEnv")
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    benchmark(args.envs, args.workers, args.ticks, args.seed)
+
+if __name__ == "__main__":
+    main()
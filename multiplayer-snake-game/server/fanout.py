@@ -0,0 +1,93 @@
+import asyncio
+from collections import deque
+
+from logging_utils import log_message
+from metrics import BACKLOGS_DROPPED, BYTES_OUT, MESSAGES_OUT
+from protocol import encode_frame
+
+class ClientStream:
+    MAX_DEPTH = 8 # frames queued per client before it is treated as a laggard
+
+    def __init__(self, websocket, encoding):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.finished = False
+        self.dropped = 0
+        self.task = asyncio.create_task(self.run())
+
+    # Queues a frame, dropping the backlog of a client that can't keep up
+    def push(self, message):
+        if len(self.queue) >= self.MAX_DEPTH:
+            # the client sees a sequence gap on the next delta and resyncs from a keyframe
+            self.queue.clear()
+            self.dropped += 1
+            BACKLOGS_DROPPED.inc()
+            log_message("DEBUG", "FanOut", "Dropped backlog for slow client (%d times)", self.dropped)
+
+        self.queue.append(message)
+        self.ready.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+
+                while self.queue:
+                    await self.websocket.send(self.queue.popleft())
+
+                if self.finished:
+                    break
+        except Exception:
+            # connection closed, the server handler takes care of disconnecting
+            pass
+
+    # Stops the stream once the queued frames have been sent
+    def finish(self):
+        self.finished = True
+        self.ready.set()
+
+    def close(self):
+        self.task.cancel()
+
+class FanOut:
+    def __init__(self):
+        self.streams = {} # websocket -> ClientStream
+        self.encodings = {} # encoding -> number of streams using it
+
+    def add(self, websocket, encoding):
+        self.streams[websocket] = ClientStream(websocket, encoding)
+        self.encodings[encoding] = self.encodings.get(encoding, 0) + 1
+
+    def remove(self, websocket):
+        stream = self.streams.pop(websocket, None)
+        if stream:
+            stream.close()
+            self.encodings[stream.encoding] -= 1
+            if not self.encodings[stream.encoding]:
+                del self.encodings[stream.encoding]
+
+    # Serializes the frame once per encoding in use
+    def encode(self, frame):
+        return {encoding: encode_frame(frame, encoding) for encoding in self.encodings}
+
+    # Hands the encoded frame to every connection without waiting on any of them
+    def send(self, encoded):
+        for stream in self.streams.values():
+            stream.push(encoded[stream.encoding])
+
+        for encoding, message in encoded.items():
+            count = self.encodings[encoding]
+            MESSAGES_OUT.labels(encoding).inc(count)
+            BYTES_OUT.labels(encoding).inc(len(message) * count)
+
+    def publish(self, frame):
+        self.send(self.encode(frame))
+
+    def finish(self):
+        for stream in self.streams.values():
+            stream.finish()
+        self.streams = {}
+        self.encodings = {}
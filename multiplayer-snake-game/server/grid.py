@@ -0,0 +1,114 @@
+from array import array
+
+EMPTY = 0
+WALL = 1
+SNAKE_BASE = 2 # snake cells are tagged with the owning player's grid id (>= SNAKE_BASE)
+
+# Food is not tagged: it is a single cell the state compares against each head, and
+# it can sit on a snake or wall cell that already owns the tag
+class OccupancyGrid:
+    FREE_MARGIN = 4 # cells this close to the border are not indexed as free, food never spawns there
+
+    def __init__(self, dimensions):
+        self.height, self.width = dimensions
+        size = self.height * self.width
+
+        # owner tag of every cell
+        self.cells = bytearray(size)
+
+        # number of segments of the owning snake on the cell (a snake may cross itself)
+        self.counts = bytearray(size)
+
+        # free cell index: packed indices of the empty cells inside the margin, and the
+        # slot of each cell in that list (-1 when occupied or outside the margin)
+        margin = self.FREE_MARGIN
+        self.free = array("i", (
+            y * self.width + x
+            for y in range(margin, self.height - margin)
+            for x in range(margin, self.width - margin)
+        ))
+        self.free_slot = array("i", [-1]) * size
+        for slot, i in enumerate(self.free):
+            self.free_slot[i] = slot
+
+    def index(self, y, x):
+        return y * self.width + x
+
+    def in_bounds(self, y, x):
+        return 0 <= y < self.height and 0 <= x < self.width
+
+    # Returns the tag of a cell, out of bounds cells count as walls
+    def get(self, y, x):
+        if not self.in_bounds(y, x):
+            return WALL
+        return self.cells[y * self.width + x]
+
+    def is_empty(self, y, x):
+        return self.get(y, x) == EMPTY
+
+    # Checks if a snake with the given id would collide on the cell
+    def is_blocked_for(self, y, x, owner):
+        tag = self.get(y, x)
+        return tag != EMPTY and tag != owner
+
+    def in_margin(self, i):
+        y, x = divmod(i, self.width)
+        margin = self.FREE_MARGIN
+        return margin <= y < self.height - margin and margin <= x < self.width - margin
+
+    # Sets a cell's tag and keeps the free cell index in step
+    def set_tag(self, i, tag):
+        old = self.cells[i]
+        self.cells[i] = tag
+
+        if old == EMPTY and tag != EMPTY:
+            self.take_free(i)
+        elif old != EMPTY and tag == EMPTY:
+            self.release_free(i)
+
+    # O(1) removal: the last free cell moves into the slot being vacated
+    def take_free(self, i):
+        slot = self.free_slot[i]
+        if slot < 0:
+            return
+
+        last = self.free.pop()
+        if last != i:
+            self.free[slot] = last
+            self.free_slot[last] = slot
+        self.free_slot[i] = -1
+
+    def release_free(self, i):
+        if self.free_slot[i] >= 0 or not self.in_margin(i):
+            return
+        self.free_slot[i] = len(self.free)
+        self.free.append(i)
+
+    # Uniformly random empty cell inside the margin as [y, x], None when there is none
+    def random_free_cell(self, rng):
+        if not self.free:
+            return None
+        i = self.free[rng.randrange(len(self.free))]
+        return [i // self.width, i % self.width]
+
+    # Snake cells are addressed by packed index (y * width + x), as stored in Player.body
+    def add_snake_cell(self, i, owner):
+        self.set_tag(i, owner)
+        self.counts[i] += 1
+
+    def remove_snake_cell(self, i, owner):
+        if self.cells[i] != owner:
+            return
+        self.counts[i] -= 1
+        if self.counts[i] == 0:
+            self.set_tag(i, EMPTY)
+
+    def add_wall(self, cells):
+        for y, x in cells:
+            self.set_tag(y * self.width + x, WALL)
+
+    def remove_wall(self, cells):
+        for y, x in cells:
+            i = y * self.width + x
+            if self.cells[i] == WALL:
+                self.set_tag(i, EMPTY)
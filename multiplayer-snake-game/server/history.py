@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import atexit
+import json
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+from metrics import HISTORY_BATCH_SECONDS, HISTORY_DROPPED, HISTORY_WRITTEN
+from ratings import Ratings
+from logging_utils import log_message
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    ended REAL NOT NULL,        -- unix time the room closed
+    duration REAL NOT NULL,     -- game seconds played after the countdown
+    winner TEXT,                -- None when the match was abandoned
+    message TEXT NOT NULL,
+    wall_spawns INTEGER NOT NULL,
+    seed INTEGER,
+    replay TEXT
+);
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id INTEGER NOT NULL REFERENCES matches (id),
+    username TEXT NOT NULL,
+    role TEXT,
+    score INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    ended REAL NOT NULL,        -- copied from matches so recent matches come from one index
+    PRIMARY KEY (match_id, username)
+);
+CREATE INDEX IF NOT EXISTS match_players_recent ON match_players (username, ended DESC);
+CREATE INDEX IF NOT EXISTS matches_ended ON matches (ended);
+CREATE TABLE IF NOT EXISTS ratings (
+    role TEXT NOT NULL,
+    username TEXT NOT NULL,
+    rating REAL NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (role, username)
+);
+"""
+
+def connect(path, readonly=False):
+    if readonly:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10, check_same_thread=False)
+    else:
+        db = sqlite3.connect(path, timeout=10) # waits for other worker processes writing
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+    db.row_factory = sqlite3.Row
+    return db
+
+# Match results kept in SQLite. Rooms only queue a result tuple; a writer thread
+# inserts them in batches, one transaction per batch, so ticks never touch the disk.
+class MatchHistory:
+    BATCH_SIZE = 1000 # results per transaction
+    MAX_QUEUED = 100000 # results held while the disk is slow, newer ones are dropped
+    MAX_LIMIT = 100 # most matches a client can ask for
+
+    # readonly: only queries, for processes that never finish matches such as the router
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.queue = queue.Queue(self.MAX_QUEUED)
+        self.reader = None # read-only connection for queries, made on first use
+        self.reader_lock = threading.Lock()
+        self.writer = None
+
+        # a read-only history never writes, not even the schema: the workers create it
+        if not readonly:
+            connect(path).close() # creates the schema before any query
+            self.writer = threading.Thread(target=self.write_loop, name="match-history", daemon=True)
+            self.writer.start()
+            atexit.register(self.close)
+
+    def log(self, level, msg, *args):
+        log_message(level, "History", msg, *args)
+
+    # Queues the result of a started match: called by the room as it closes. players
+    # holds everyone who played, including those that left during the match, rated
+    # the (snake, controller, snake won) outcome returned by Ratings.update, if any.
+    def record(self, state, players, seed=None, replay=None, rated=None):
+        if not state.game_started:
+            return
+
+        duration = max(0.0, state.clock() - state.match_start_time)
+        result = (
+            time.time(), duration, state.winner, state.game_over_message or "Abandoned",
+            state.next_wall_id - 1, seed, replay,
+            [(username, player.role, player.score) for username, player in players.items()],
+            rated
+        )
+
+        try:
+            self.queue.put_nowait(result)
+        except queue.Full:
+            HISTORY_DROPPED.inc()
+
+    # Writer thread: waits for a result, then takes whatever else is queued up to BATCH_SIZE
+    def write_loop(self):
+        db = connect(self.path)
+        running = True
+
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = [result for result in batch if result is not None]
+
+            if batch:
+                self.write(db, batch)
+
+        db.close()
+
+    def write(self, db, batch):
+        started = time.perf_counter()
+        try:
+            with db:
+                # taken before the ratings are read, so no other worker rates in between
+                db.execute("BEGIN IMMEDIATE")
+                for ended, duration, winner, message, wall_spawns, seed, replay, players, rated in batch:
+                    match_id = db.execute(
+                        "INSERT INTO matches (ended, duration, winner, message, wall_spawns, seed, replay) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (ended, duration, winner, message, wall_spawns, seed, replay)
+                    ).lastrowid
+                    db.executemany(
+                        "INSERT INTO match_players (match_id, username, role, score, won, ended) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(match_id, username, role, score, username == winner, ended) for username, role, score in players]
+                    )
+                    if rated:
+                        db.executemany(
+                            "INSERT INTO ratings (role, username, rating, games) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT (role, username) DO UPDATE SET rating = excluded.rating, games = excluded.games",
+                            self.rate(db, *rated)
+                        )
+        except sqlite3.Error as e:
+            self.log("ERROR", "Could not save %d match results: %s", len(batch), e)
+            HISTORY_DROPPED.inc(len(batch))
+            return
+
+        HISTORY_WRITTEN.inc(len(batch))
+        HISTORY_BATCH_SECONDS.observe(time.perf_counter() - started)
+        self.log("DEBUG", "Saved %d match results", len(batch))
+
+    # Rates a match against the saved ratings rather than the process' own copy:
+    # with several workers each one only knows the matches it ran itself
+    def rate(self, db, snake, controller, snake_won):
+        saved = []
+        for role, username in (("snake", snake), ("controller", controller)):
+            row = db.execute("SELECT rating, games FROM ratings WHERE role = ? AND username = ?", (role, username)).fetchone()
+            saved.append((row["rating"], row["games"]) if row else (Ratings.INITIAL, 0))
+
+        (snake_rating, snake_games), (controller_rating, controller_games) = saved
+        snake_rating, controller_rating = Ratings.rate(snake_rating, snake_games, controller_rating, controller_games, snake_won)
+        return [
+            ("snake", snake, snake_rating, snake_games + 1),
+            ("controller", controller, controller_rating, controller_games + 1)
+        ]
+
+    # Latest matches of a player, newest first, with everyone's scores. None saved
+    # when the database or its schema doesn't exist yet.
+    def recent_matches(self, username, limit=20):
+        with self.reader_lock:
+            try:
+                if self.reader is None:
+                    self.reader = connect(self.path, readonly=True)
+
+                rows = self.reader.execute(
+                    "SELECT m.* FROM match_players p JOIN matches m ON m.id = p.match_id "
+                    "WHERE p.username = ? ORDER BY p.ended DESC LIMIT ?",
+                    (username, limit)
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                self.log("WARNING", "Could not read match history: %s", e)
+                return []
+
+            matches = [dict(row) for row in rows]
+            for match in matches:
+                match["players"] = [dict(row) for row in self.reader.execute(
+                    "SELECT username, role, score, won FROM match_players WHERE match_id = ?", (match["id"],)
+                )]
+        return matches
+
+    # Every saved rating as (role, username, rating, games), read once at startup
+    def load_ratings(self):
+        db = connect(self.path, readonly=True)
+        try:
+            return db.execute("SELECT role, username, rating, games FROM ratings").fetchall()
+        finally:
+            db.close()
+
+    # Same query off the event loop
+    async def recent(self, username, limit=20):
+        return await asyncio.to_thread(self.recent_matches, username, limit)
+
+    # Answers a {"history": username, "limit": n} handshake and closes the connection
+    async def send_recent(self, websocket, data):
+        username = str(data["history"])
+        try:
+            limit = min(max(int(data.get("limit", 20)), 1), self.MAX_LIMIT)
+        except (TypeError, ValueError):
+            await websocket.close(reason="Invalid history limit")
+            return
+        matches = await self.recent(username, limit)
+        await websocket.send(json.dumps({"type": "history", "username": username, "matches": matches}))
+        await websocket.close()
+
+    def pending(self):
+        return self.queue.qsize()
+
+    # Writes out what is queued and stops the writer: called by the server as it
+    # stops, atexit is only a fallback for processes that exit some other way
+    def close(self):
+        if self.writer is None or not self.writer.is_alive():
+            return
+        self.queue.put(None)
+        self.writer.join()
+
+# Queues finished matches as fast as possible and reports how fast they are written
+def benchmark(path, matches):
+    from simulation import Simulation
+
+    history = MatchHistory(path)
+    sim = Simulation()
+    sim.run(100, lambda sim: sim.autopilot())
+    snake, controller = sim.state.players.get(sim.SNAKE), sim.state.players[sim.CONTROLLER]
+    rng = random.Random(0)
+
+    started = time.perf_counter()
+    for i in range(matches):
+        players = {f"player{rng.randrange(10000)}": snake, f"player{rng.randrange(10000)}": controller}
+        history.record(sim.state, players, seed=i)
+    queued = time.perf_counter() - started
+    history.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"queued {matches} results in {queued * 1e6 / matches:.1f}us each, "
+        f"written in {elapsed:.2f}s ({matches / elapsed:,.0f} matches/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the match history database")
+    parser.add_argument("path")
+    parser.add_argument("--player", help="show the player's recent matches")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--benchmark", type=int, metavar="MATCHES", help="write made-up results instead")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    if args.benchmark:
+        benchmark(args.path, args.benchmark)
+    elif args.player:
+        for match in MatchHistory(args.path, readonly=True).recent_matches(args.player, args.limit):
+            scores = ", ".join(f"{p['username']} ({p['role']}) {p['score']}" for p in match["players"])
+            ended = time.strftime("%Y-%m-%d %H:%M", time.localtime(match["ended"]))
+            print(f"{ended}  {match['duration']:5.1f}s  {match['message']:<22} winner {match['winner']}: {scores}")
+    else:
+        parser.error("nothing to do: pass --player or --benchmark")
@@ -0,0 +1,127 @@
+import time
+from collections import deque
+
+from metrics import INPUTS_COALESCED, INPUTS_DROPPED
+from state import State
+
+# Food offset of each controller action
+FOOD_MOVES = {
+    "food_up": (-1, 0),
+    "food_down": (1, 0),
+    "food_left": (0, -1),
+    "food_right": (0, 1)
+}
+
+class InputBuffer:
+    MAX_TURNS = 2 # turns queued ahead, one is applied per tick
+    RATE = 20.0 # messages per second allowed on average
+    BURST = 10 # messages allowed at once
+    RESYNC_TICKS = 10 # fewest ticks between two keyframes one client asks for
+
+    # Collects one player's inputs between ticks. Only the handler pushes and only the
+    # tick drains, both on the event loop, so no lock is needed.
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.turns = deque()
+        self.food_moves = [] # food actions in order, the rate limit bounds how many
+        self.spawn_wall = False
+        self.resync = False # client missed a delta frame
+        self.ticks_since_resync = self.RESYNC_TICKS
+
+        # token bucket
+        self.tokens = self.BURST
+        self.refilled_at = clock()
+
+        # stats
+        self.received = 0
+        self.dropped = 0 # over the rate limit
+        self.coalesced = 0 # merged into an input already queued
+
+    def allow(self):
+        now = self.clock()
+        self.tokens = min(self.BURST, self.tokens + (now - self.refilled_at) * self.RATE)
+        self.refilled_at = now
+
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def coalesce(self):
+        self.coalesced += 1
+        INPUTS_COALESCED.inc()
+
+    # Queues a decoded input, returns False if it was rate limited
+    def push(self, data):
+        self.received += 1
+        if not self.allow():
+            self.dropped += 1
+            INPUTS_DROPPED.inc()
+            return False
+
+        if "resync" in data:
+            if self.resync:
+                self.coalesce()
+            self.resync = True
+
+        elif "direction" in data:
+            key = data["direction"]
+            if self.turns and self.turns[-1] == key:
+                self.coalesce()
+            elif len(self.turns) < self.MAX_TURNS:
+                self.turns.append(key)
+            else:
+                # latest intent replaces the last queued turn
+                self.turns[-1] = key
+                self.coalesce()
+
+        elif data.get("action") in FOOD_MOVES:
+            # not summed: the food is clamped to the board after every step, so
+            # "up, up, down" at the top edge ends one cell lower than their sum says
+            self.food_moves.append(data["action"])
+
+        elif data.get("action") == "spawn_wall":
+            if self.spawn_wall:
+                self.coalesce()
+            self.spawn_wall = True
+
+        return True
+
+    # Inputs to apply this tick: the oldest queued turn that changes the snake's current
+    # direction, every food move in order and at most one wall
+    def drain(self, direction=None):
+        inputs = []
+
+        while self.turns:
+            key = self.turns.popleft()
+            new_dir = State.DIRECTION_MAP.get(key)
+            if direction is None or (
+                new_dir and new_dir != direction
+                and [new_dir[0] + direction[0], new_dir[1] + direction[1]] != [0, 0]
+            ):
+                inputs.append({"direction": key})
+                break
+            self.coalesce()
+
+        if self.food_moves:
+            inputs.extend({"action": action} for action in self.food_moves)
+            self.food_moves = []
+
+        if self.spawn_wall:
+            inputs.append({"action": "spawn_wall"})
+            self.spawn_wall = False
+
+        return inputs
+
+    # Called once per tick, True when an asked for keyframe should go out now.
+    # A request within RESYNC_TICKS of the last one waits instead of being dropped.
+    def resync_due(self):
+        self.ticks_since_resync += 1
+        if not self.resync or self.ticks_since_resync < self.RESYNC_TICKS:
+            return False
+        self.resync = False
+        self.ticks_since_resync = 0
+        return True
+
+    def stats(self):
+        return {"received": self.received, "dropped": self.dropped, "coalesced": self.coalesced}
@@ -1,24 +1,56 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+
+PAD = 15
 
 logging.basicConfig(
     level=logging.INFO,
-    format="%(levelname)-8s - %(message)s"
+    format=f"%(levelname)-8s - %(name)-{PAD}s | %(message)s"
 )
 
-logger = logging.getLogger()
-
-def log_message(level, component, message):
-    PAD = 15
-    format_string = f"{component.ljust(PAD)} | {message}"
-
-    level = level.upper()
-    if level == "INFO":
-        logger.info(format_string)
-    elif level == "ERROR":
-        logger.error(format_string)
-    elif level == "DEBUG":
-        logger.debug(format_string)
-    elif level == "WARNING":
-        logger.warning(format_string)
-    elif level == "CRITICAL":
-        logger.critical(format_string)
\ No newline at end of file
+LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+# one logger per component, named after it so the formatter pads the name
+loggers = {}
+
+def get_logger(component):
+    logger = loggers.get(component)
+    if logger is None:
+        logger = loggers[component] = logging.getLogger(component)
+    return logger
+
+# Checks the level before anything is formatted
+def is_enabled(level, component):
+    return get_logger(component).isEnabledFor(LEVELS[level.upper()])
+
+# Logs %-style messages lazily: args are only formatted if the level is enabled
+def log_message(level, component, message, *args):
+    logger = get_logger(component)
+    levelno = LEVELS[level.upper()]
+    if logger.isEnabledFor(levelno):
+        logger.log(levelno, message, *args)
+
+# Moves log I/O off the event loop: records go into a queue drained by a listener thread
+def enable_queue_logging():
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    if not handlers or any(isinstance(h, logging.handlers.QueueHandler) for h in handlers):
+        return
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener.start()
+    atexit.register(listener.stop)
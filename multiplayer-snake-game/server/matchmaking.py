@@ -0,0 +1,136 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+from websockets.protocol import State
+
+from logging_utils import log_message
+
+# True while a client connection can still be sent to
+def connection_open(websocket):
+    return websocket.state is State.OPEN
+
+class Ticket:
+    __slots__ = ("payload", "joined_at", "future", "active")
+
+    def __init__(self, payload, joined_at, future):
+        self.payload = payload
+        self.joined_at = joined_at
+        self.future = future
+        self.active = True
+
+class Matchmaker:
+    ROLES = ("snake", "controller")
+    WAIT_SAMPLES = 1000 # recent wait times kept for the stats
+
+    # on_match(first_payload, first_role, second_payload, second_role) returns the
+    # results handed back to the two waiting tickets; alive(payload) tells whether a
+    # queued client is still connected, those that left are never paired
+    def __init__(self, on_match, clock=time.monotonic, alive=None):
+        self.on_match = on_match
+        self.clock = clock
+        self.alive = alive
+        self.queue = deque()
+        self.depth = 0 # active tickets in the queue
+
+        # stats
+        self.matched = 0
+        self.cancelled = 0 # includes timeouts
+        self.timed_out = 0
+        self.wait_times = deque(maxlen=self.WAIT_SAMPLES)
+
+    def log(self, level, msg, *args):
+        log_message(level, "Matchmaker", msg, *args)
+
+    # Queues a client and pairs it straight away if someone is waiting
+    def join(self, payload):
+        ticket = Ticket(payload, self.clock(), asyncio.get_running_loop().create_future())
+        self.queue.append(ticket)
+        self.depth += 1
+
+        if self.depth >= 2:
+            self.pair()
+        return ticket
+
+    # Pops the oldest ticket still waiting, None if there is none. Cancelled ones are
+    # skipped lazily, those of clients that disconnected before their wait() noticed
+    # are cancelled here.
+    def pop_active(self):
+        while self.queue:
+            ticket = self.queue.popleft()
+            if not ticket.active:
+                continue
+            if self.alive and not self.alive(ticket.payload):
+                self.cancel(ticket)
+                continue
+            ticket.active = False
+            self.depth -= 1
+            return ticket
+        return None
+
+    def pair(self):
+        first = self.pop_active()
+        second = self.pop_active() if first else None
+        if second is None:
+            if first:
+                # the opponent had left: the survivor keeps its place at the front
+                first.active = True
+                self.depth += 1
+                self.queue.appendleft(first)
+            return
+
+        roles = list(self.ROLES)
+        random.shuffle(roles)
+
+        now = self.clock()
+        self.wait_times.append(now - first.joined_at)
+        self.wait_times.append(now - second.joined_at)
+        self.matched += 1
+
+        first_result, second_result = self.on_match(first.payload, roles[0], second.payload, roles[1])
+        first.future.set_result(first_result)
+        second.future.set_result(second_result)
+
+        self.log("DEBUG", "Paired after %.3fs, %d waiting", now - first.joined_at, self.depth)
+
+    def cancel(self, ticket):
+        if not ticket.active:
+            return
+        ticket.active = False
+        self.depth -= 1
+        self.cancelled += 1
+        ticket.future.cancel()
+
+        # drop cancelled tickets piling up behind a short queue
+        if len(self.queue) > 2 * self.depth + 64:
+            self.queue = deque(t for t in self.queue if t.active)
+
+    # Waits for the ticket to be paired; returns None if the connection closed or the wait timed out
+    async def wait(self, ticket, websocket, timeout=None):
+        closed = asyncio.ensure_future(websocket.wait_closed())
+        try:
+            await asyncio.wait([ticket.future, closed], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            connection_closed = closed.done()
+        finally:
+            closed.cancel()
+
+        if ticket.future.done() and not ticket.future.cancelled():
+            return ticket.future.result()
+
+        if not connection_closed:
+            self.timed_out += 1
+        self.cancel(ticket)
+        return None
+
+    def stats(self):
+        waits = sorted(self.wait_times)
+        return {
+            "queue_depth": self.depth,
+            "matched": self.matched,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
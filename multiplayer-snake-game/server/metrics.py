@@ -0,0 +1,240 @@
+import asyncio
+import time
+from bisect import bisect_left
+
+from logging_utils import log_message
+
+# Tick phases and other latencies: 50us up to 1s
+TIME_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+
+def format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.children = {} # label values -> child
+        REGISTRY.register(self)
+
+    # Child for a set of label values; a metric without labels is its own child
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.new_child()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        for values, child in self.children.items():
+            lines.extend(self.render_child(values, child))
+        return lines
+
+class Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    # also used to mirror a total kept elsewhere, such as the scheduler stats
+    def set(self, value):
+        self.value = value
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def new_child(self):
+        return Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def render_child(self, values, child):
+        return [f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}"]
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+class HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = format_labels(self.labelnames, values, f'le="{format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+
+        labels = format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = [] # called before every scrape to refresh gauges
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    # Prometheus text exposition format
+    def render(self):
+        for collector in self.collectors:
+            collector()
+
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Times consecutive phases of one piece of work into a histogram labelled by phase
+class PhaseTimer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = self.last = 0.0
+
+    def start(self):
+        self.started = self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.histogram.labels(phase).observe(now - self.last)
+        self.last = now
+
+    def elapsed(self):
+        return self.last - self.started
+
+# game server
+TICK_SECONDS = Histogram("snake_tick_seconds", "Time spent in one room tick")
+TICK_PHASE_SECONDS = Histogram("snake_tick_phase_seconds", "Time spent in each phase of a room tick", ("phase",))
+LOCK_WAIT_SECONDS = Histogram("snake_lock_wait_seconds", "Time handlers waited for a room's state lock on join and leave")
+MESSAGES_IN = Counter("snake_messages_received_total", "Messages received from clients")
+MESSAGES_OUT = Counter("snake_messages_sent_total", "Frames queued to clients", ("encoding",))
+BYTES_OUT = Counter("snake_bytes_sent_total", "Bytes of frames queued to clients", ("encoding",))
+INPUTS_DROPPED = Counter("snake_inputs_dropped_total", "Inputs dropped by the per-player rate limit")
+INPUTS_COALESCED = Counter("snake_inputs_coalesced_total", "Inputs merged into one already queued for the tick")
+BACKLOGS_DROPPED = Counter("snake_send_backlogs_dropped_total", "Send backlogs dropped for clients that could not keep up")
+
+CLIENTS = Gauge("snake_clients", "Connected clients", ("kind",))
+ROOMS = Gauge("snake_rooms", "Active rooms")
+SEND_QUEUE_FRAMES = Gauge("snake_send_queue_frames", "Frames waiting in client send queues")
+SEND_QUEUE_MAX = Gauge("snake_send_queue_max_depth", "Deepest client send queue")
+
+# match history writer thread
+HISTORY_WRITTEN = Counter("snake_history_matches_written_total", "Match results saved to the history database")
+HISTORY_DROPPED = Counter("snake_history_matches_dropped_total", "Match results lost to a full queue or a database error")
+HISTORY_QUEUE = Gauge("snake_history_queue_depth", "Match results waiting to be saved")
+HISTORY_BATCH_SECONDS = Histogram("snake_history_batch_seconds", "Time spent saving one batch of match results")
+
+SCHEDULER_TICKS = Counter("snake_scheduler_ticks_total", "Ticks run by the scheduler")
+SCHEDULER_LATE = Counter("snake_scheduler_late_ticks_total", "Ticks that ran later than the lateness threshold")
+SCHEDULER_SKIPPED = Counter("snake_scheduler_skipped_ticks_total", "Ticks skipped to catch up with the schedule")
+SCHEDULER_FAILED = Counter("snake_scheduler_failed_ticks_total", "Ticks that raised, their task was dropped")
+SCHEDULER_MAX_LATENESS = Gauge("snake_scheduler_max_lateness_seconds", "Latest a tick has run")
+
+# matchmaking, on the game server or the router
+MATCHMAKER_QUEUE = Gauge("snake_matchmaker_queue_depth", "Players waiting for an opponent")
+MATCHMAKER_MATCHED = Counter("snake_matchmaker_matched_total", "Matches made")
+MATCHMAKER_CANCELLED = Counter("snake_matchmaker_cancelled_total", "Players that left the queue, including timeouts")
+MATCHMAKER_TIMED_OUT = Counter("snake_matchmaker_timed_out_total", "Players that gave up waiting")
+MATCHMAKER_WAIT = Gauge("snake_matchmaker_wait_seconds", "Recent time to be matched", ("stat",))
+
+def collect_matchmaker(matchmaker):
+    stats = matchmaker.stats()
+    MATCHMAKER_QUEUE.set(stats["queue_depth"])
+    MATCHMAKER_MATCHED.set(stats["matched"])
+    MATCHMAKER_CANCELLED.set(stats["cancelled"])
+    MATCHMAKER_TIMED_OUT.set(stats["timed_out"])
+    for stat in ("avg", "p95", "max"):
+        MATCHMAKER_WAIT.labels(stat).set(stats[f"wait_{stat}"])
+
+def collect_scheduler(scheduler):
+    SCHEDULER_TICKS.set(scheduler.ticks)
+    SCHEDULER_LATE.set(scheduler.late_ticks)
+    SCHEDULER_SKIPPED.set(scheduler.skipped_ticks)
+    SCHEDULER_FAILED.set(scheduler.failed_ticks)
+    SCHEDULER_MAX_LATENESS.set(scheduler.max_lateness)
+
+# Minimal HTTP endpoint: GET /metrics returns the registry, anything else a 404
+async def handle_scrape(reader, writer):
+    try:
+        request = await reader.readline()
+        while (await reader.readline()).strip():
+            pass # headers
+
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", REGISTRY.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host, port):
+    server = await asyncio.start_server(handle_scrape, host, port)
+    log_message("INFO", "Metrics", "Metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -1,16 +1,39 @@
+import json
+from collections import deque
+
 from logging_utils import log_message
 
 class Player:
-    def __init__(self, segments, direction, colour_pair_id, role="snake"):
-        self.segments = segments
+    __slots__ = ("body", "width", "grid_id", "direction", "score", "colour", "role",
+        "heads_added", "tails_removed", "json_cache", "json_marker")
+
+    def __init__(self, segments, direction, colour_pair_id, width, role="snake", grid_id=None):
+        # body cells packed as y * width + x, head first (same packing as the occupancy grid)
+        self.width = width
+        self.body = deque(y * width + x for y, x in segments)
+        self.grid_id = grid_id
         self.direction = direction
         self.score = 0
         self.colour = colour_pair_id
         self.role = role
 
+        # running move counters, used to build per-tick deltas
+        self.heads_added = 0
+        self.tails_removed = 0
+
+        # encoded to_dict, reused until the player changes
+        self.json_cache = None
+        self.json_marker = None
+
     # Logs a message
-    def log_message(self, type, message):
-        log_message(type, "Player", f"{message}")
+    def log_message(self, type, message, *args):
+        log_message(type, "Player", message, *args)
+
+    # Unpacks the body into [y, x] segments, head first
+    @property
+    def segments(self):
+        width = self.width
+        return [[i // width, i % width] for i in self.body]
 
     # Converts the object to a dictionary
     def to_dict(self):
@@ -22,30 +45,50 @@ class Player:
             "role":self.role
         }
 
+    # Encodes to_dict, re-encoding only when the body, score, direction or role changed
+    def to_json(self):
+        marker = (self.heads_added, self.tails_removed, self.score,
+            self.direction[0], self.direction[1], self.role, self.colour)
+        if marker != self.json_marker:
+            self.json_cache = json.dumps(self.to_dict())
+            self.json_marker = marker
+        return self.json_cache
+
     # Returns the head of the snake
     def get_head(self, j=None):
+        y, x = divmod(self.body[0], self.width)
         if j is not None:
-            return self.segments[0][j]
-        return self.segments[0]
+            return (y, x)[j]
+        return [y, x]
+
+    # Returns the first n segments as [y, x], head first
+    def get_head_segments(self, n):
+        width = self.width
+        return [[self.body[i] // width, self.body[i] % width] for i in range(min(n, len(self.body)))]
+
+    # Returns the packed index of the head
+    def get_head_index(self):
+        return self.body[0]
 
     # Adds the new head in the current direction
     def add_new_head(self):
-        new_head = [self.get_head(0)+self.direction[0], 
-            self.get_head(1)+self.direction[1]]
-        self.segments.insert(0, new_head)
+        self.body.appendleft(self.body[0] + self.direction[0] * self.width + self.direction[1])
+        self.heads_added += 1
 
-    # Pops the tail (for movement)
+    # Pops the tail (for movement) and returns its packed index
     def pop_tail(self):
-        self.segments.pop()
+        self.tails_removed += 1
+        return self.body.pop()
 
  # Updates whether the snake is alive by checking for a collision
-    def check_is_alive(self, occupied_positions, dimensions):
-        if self.get_head(0) in [0, dimensions[0]-1] or self.get_head(1) in [0, dimensions[1]-1]:
+    def check_is_alive(self, grid, dimensions):
+        y, x = divmod(self.body[0], self.width)
+        if y in [0, dimensions[0]-1] or x in [0, dimensions[1]-1]:
             self.log_message("DEBUG", "Player hit wall")
             return False
 
-        elif self.get_head() in occupied_positions:
+        elif grid.is_blocked_for(y, x, self.grid_id):
             self.log_message("DEBUG", "Player collided with a segment")
-            return False  
-        
-        return True
\ No newline at end of file
+            return False
+
+        return True
@@ -0,0 +1,187 @@
+import json
+import struct
+
+# Wire encodings a client can ask for in its username handshake. They only apply to
+# game frames: control messages (leaderboard, redirect, history) are always JSON text
+# and the assigned username plain text, so clients handle text frames in both.
+JSON = "json"
+BINARY = "binary"
+ENCODINGS = (JSON, BINARY)
+
+# Binary frame types (server -> client)
+FRAME_KEYFRAME = 1
+FRAME_DELTA = 2
+FRAME_WAITING = 3
+FRAME_RESULT = 4
+
+# Delta section flags
+DELTA_PLAYERS = 1
+DELTA_FOOD = 2
+DELTA_TIME = 4
+DELTA_GAME_OVER = 8
+DELTA_MESSAGE = 16
+DELTA_WALLS_ADDED = 32
+DELTA_WALLS_REMOVED = 64
+DELTA_SPAWNS_LEFT = 128
+
+# Player change flags
+PLAYER_HEAD = 1
+PLAYER_TAIL = 2
+PLAYER_SCORE = 4
+PLAYER_DIRECTION = 8
+PLAYER_ROLE = 16
+
+# Binary input opcodes (client -> server)
+INPUT_DIRECTION = 1
+INPUT_ACTION = 2
+INPUT_RESYNC = 3
+
+ACTIONS = ["food_up", "food_down", "food_left", "food_right", "spawn_wall"]
+
+MAX_USERNAME = 32 # characters kept of the handshake username
+
+HEADER = struct.Struct("!BI") # frame type, seq
+DELTA_FLAGS = struct.Struct("!H")
+CELL = struct.Struct("!HH")
+SHORT = struct.Struct("!H")
+SIGNED_SHORT = struct.Struct("!h")
+DIRECTION = struct.Struct("!bb")
+WALL = struct.Struct("!IdH") # id, expires_at, cell count
+WALL_ID = struct.Struct("!I")
+
+# Encodes a frame dict in the requested encoding
+def encode_frame(frame, encoding):
+    if encoding == BINARY:
+        return encode_binary_frame(frame)
+    if frame.get("type") == "keyframe":
+        return f'{{"type": "keyframe", "seq": {frame["seq"]}, "state": {frame["state_json"]}}}'
+    return json.dumps(frame)
+
+# Username from a handshake: text, stripped and cut to MAX_USERNAME characters
+def clean_username(value):
+    username = str(value if value is not None else "").strip()[:MAX_USERNAME]
+    return username or "player"
+
+def encode_binary_frame(frame):
+    frame_type = frame.get("type")
+
+    if frame_type == "delta":
+        return encode_delta(frame)
+
+    if frame_type == "keyframe":
+        # keyframes are rare, the state body stays JSON
+        return HEADER.pack(FRAME_KEYFRAME, frame["seq"]) + frame["state_json"].encode()
+
+    if frame_type == "waiting":
+        return HEADER.pack(FRAME_WAITING, 0)
+
+    if frame_type == "result":
+        return HEADER.pack(FRAME_RESULT, 0) + pack_long_str(frame["winner"] or "")
+
+    raise ValueError(f"Unknown frame type: {frame_type}")
+
+def pack_str(value):
+    data = value.encode()
+    return bytes((len(data),)) + data
+
+def pack_long_str(value):
+    data = value.encode()
+    return SHORT.pack(len(data)) + data
+
+def encode_delta(frame):
+    flags = 0
+    parts = []
+
+    players = frame.get("players")
+    if players:
+        flags |= DELTA_PLAYERS
+        parts.append(bytes((len(players),)))
+        for username, changes in players.items():
+            parts.append(pack_player(username, changes))
+
+    if "food_pos" in frame:
+        flags |= DELTA_FOOD
+        parts.append(CELL.pack(*frame["food_pos"]))
+
+    if "remaining_time" in frame:
+        flags |= DELTA_TIME
+        remaining_time = frame["remaining_time"]
+        parts.append(SIGNED_SHORT.pack(-1 if remaining_time is None else remaining_time))
+
+    if "game_over" in frame:
+        flags |= DELTA_GAME_OVER
+        parts.append(bytes((int(frame["game_over"]),)))
+
+    if "game_over_message" in frame:
+        flags |= DELTA_MESSAGE
+        parts.append(pack_long_str(frame["game_over_message"]))
+
+    if "walls_added" in frame:
+        flags |= DELTA_WALLS_ADDED
+        parts.append(bytes((len(frame["walls_added"]),)))
+        for wall in frame["walls_added"]:
+            parts.append(WALL.pack(wall["id"], wall["expires_at"], len(wall["cells"])))
+            parts.extend(CELL.pack(y, x) for y, x in wall["cells"])
+
+    if "walls_removed" in frame:
+        flags |= DELTA_WALLS_REMOVED
+        parts.append(bytes((len(frame["walls_removed"]),)))
+        parts.extend(WALL_ID.pack(wall_id) for wall_id in frame["walls_removed"])
+
+    if "wall_spawns_left" in frame:
+        flags |= DELTA_SPAWNS_LEFT
+        spawns_left = frame["wall_spawns_left"]
+        parts.append(bytes((len(spawns_left),)))
+        for username, count in spawns_left.items():
+            parts.append(pack_long_str(username) + bytes((count,)))
+
+    return HEADER.pack(FRAME_DELTA, frame["seq"]) + DELTA_FLAGS.pack(flags) + b"".join(parts)
+
+def pack_player(username, changes):
+    flags = 0
+    parts = []
+
+    if "head" in changes:
+        flags |= PLAYER_HEAD
+        parts.append(SHORT.pack(len(changes["head"])))
+        parts.extend(CELL.pack(y, x) for y, x in changes["head"])
+
+    if "tail" in changes:
+        flags |= PLAYER_TAIL
+        parts.append(SHORT.pack(changes["tail"]))
+
+    if "score" in changes:
+        flags |= PLAYER_SCORE
+        parts.append(SHORT.pack(changes["score"]))
+
+    if "direction" in changes:
+        flags |= PLAYER_DIRECTION
+        parts.append(DIRECTION.pack(*changes["direction"]))
+
+    if "role" in changes:
+        flags |= PLAYER_ROLE
+        parts.append(pack_str(changes["role"] or ""))
+
+    return pack_long_str(username) + bytes((flags,)) + b"".join(parts)
+
+# Decodes a client message (JSON text or binary input) into the JSON dict form,
+# None if it is malformed
+def decode_input(msg):
+    if isinstance(msg, str):
+        try:
+            data = json.loads(msg)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    if len(msg) == 1 and msg[0] == INPUT_RESYNC:
+        return {"resync": True}
+    if len(msg) != 2:
+        return None
+
+    opcode, arg = msg
+    if opcode == INPUT_DIRECTION:
+        return {"direction": chr(arg)}
+    if opcode == INPUT_ACTION and arg < len(ACTIONS):
+        return {"action": ACTIONS[arg]}
+    return None
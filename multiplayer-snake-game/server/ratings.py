@@ -0,0 +1,241 @@
+import argparse
+import random
+import time
+from array import array
+from itertools import islice
+
+# Counts per bucket with O(log n) updates, prefix sums and k-th lookups
+class FenwickTree:
+    def __init__(self, size):
+        self.size = size
+        self.tree = array("i", [0]) * (size + 1)
+        self.total = 0
+
+    # Replaces the contents with the given count per bucket in O(size)
+    def build(self, counts):
+        tree = self.tree
+        tree[1:] = array("i", counts)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self.total = sum(counts)
+
+    def add(self, bucket, delta):
+        self.total += delta
+        i = bucket + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    # Number of items in buckets 0..bucket
+    def prefix(self, bucket):
+        count = 0
+        i = bucket + 1
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    # Bucket holding the k-th item counting from bucket 0 (1-based k)
+    def find(self, k):
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            i = position + step
+            if i <= self.size and self.tree[i] < k:
+                position = i
+                k -= self.tree[i]
+            step >>= 1
+        return position
+
+# Ratings of one role. Players are bucketed by rating at RESOLUTION buckets per point,
+# so updates, rank and top-k lookups cost O(log buckets) whatever the number of players.
+# Players in the same bucket count as tied.
+class Ladder:
+    MIN_RATING = 0
+    MAX_RATING = 4000
+    RESOLUTION = 10
+
+    def __init__(self):
+        self.ratings = {} # username -> rating
+        self.games = {} # username -> rated matches played
+        self.buckets = {} # bucket -> usernames in it
+        self.tree = FenwickTree((self.MAX_RATING - self.MIN_RATING) * self.RESOLUTION)
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def bucket(self, rating):
+        bucket = int((rating - self.MIN_RATING) * self.RESOLUTION)
+        return min(max(bucket, 0), self.tree.size - 1)
+
+    def get(self, username, default=None):
+        return self.ratings.get(username, default)
+
+    # Adds many players at once, rebuilding the buckets and tree instead of one update each
+    def load(self, rows):
+        for username, rating, games in rows:
+            self.ratings[username] = rating
+            self.games[username] = games
+
+        self.buckets = {}
+        counts = [0] * self.tree.size
+        for username, rating in self.ratings.items():
+            bucket = self.bucket(rating)
+            self.buckets.setdefault(bucket, set()).add(username)
+            counts[bucket] += 1
+        self.tree.build(counts)
+
+    def set(self, username, rating, games):
+        old = self.ratings.get(username)
+        if old is not None:
+            bucket = self.bucket(old)
+            members = self.buckets[bucket]
+            members.discard(username)
+            if not members:
+                del self.buckets[bucket]
+            self.tree.add(bucket, -1)
+
+        bucket = self.bucket(rating)
+        self.buckets.setdefault(bucket, set()).add(username)
+        self.tree.add(bucket, 1)
+        self.ratings[username] = rating
+        self.games[username] = games
+
+    # 1 + the number of players rated higher, None when the player is unrated
+    def rank(self, username):
+        rating = self.ratings.get(username)
+        if rating is None:
+            return None
+        return 1 + self.tree.total - self.tree.prefix(self.bucket(rating))
+
+    # The k best players as (username, rating), best first
+    def top(self, k):
+        best = []
+        remaining = self.tree.total
+        while remaining and len(best) < k:
+            members = self.buckets[self.tree.find(remaining)]
+            taken = islice(members, k - len(best))
+            best.extend(sorted(((u, self.ratings[u]) for u in taken), key=lambda item: -item[1]))
+            remaining -= len(members)
+        return best
+
+# Elo ratings per role, updated when a match ends and kept for every player of the server
+class Ratings:
+    ROLES = ("snake", "controller")
+    INITIAL = 1500
+    K = 32 # largest change per match once a player is established
+    K_NEW = 64 # for the first NEW_GAMES matches, so new players settle quickly
+    NEW_GAMES = 10
+    TOP = 10 # players per role in the lobby leaderboard
+
+    def __init__(self):
+        self.ladders = {role: Ladder() for role in self.ROLES}
+        self.top_cache = None # leaderboard lists, rebuilt after a rating changes
+
+    # Rows of (role, username, rating, games) as saved by MatchHistory
+    def load(self, rows):
+        by_role = {role: [] for role in self.ROLES}
+        for role, username, rating, games in rows:
+            if role in by_role:
+                by_role[role].append((username, rating, games))
+
+        for role, ladder_rows in by_role.items():
+            self.ladders[role].load(ladder_rows)
+        self.top_cache = None
+
+    @classmethod
+    def k_factor(cls, games):
+        return cls.K_NEW if games < cls.NEW_GAMES else cls.K
+
+    # New (snake rating, controller rating) after a match between players with
+    # the given ratings and rated matches played
+    @classmethod
+    def rate(cls, snake_rating, snake_games, controller_rating, controller_games, snake_won):
+        expected = 1 / (1 + 10 ** ((controller_rating - snake_rating) / 400))
+        result = 1.0 if snake_won else 0.0
+        return (
+            snake_rating + cls.k_factor(snake_games) * (result - expected),
+            controller_rating + cls.k_factor(controller_games) * (expected - result)
+        )
+
+    # Rates a finished match between a snake and a controller, players being everyone
+    # who played it. Returns (snake, controller, snake won) for the history to rate the
+    # saved ratings with, None for a match without a winner.
+    def update(self, state, players):
+        roles = {player.role: username for username, player in players.items()}
+        snake, controller = roles.get("snake"), roles.get("controller")
+        if not state.game_over or state.winner is None or not snake or not controller:
+            return None
+
+        snakes, controllers = self.ladders["snake"], self.ladders["controller"]
+        snake_games, controller_games = snakes.games.get(snake, 0), controllers.games.get(controller, 0)
+        snake_won = state.winner == snake
+
+        snake_rating, controller_rating = self.rate(
+            snakes.get(snake, self.INITIAL), snake_games,
+            controllers.get(controller, self.INITIAL), controller_games,
+            snake_won
+        )
+        snakes.set(snake, snake_rating, snake_games + 1)
+        controllers.set(controller, controller_rating, controller_games + 1)
+        self.top_cache = None
+        return snake, controller, snake_won
+
+    # Lobby message: the best players of each role and where the given player stands
+    def leaderboard(self, username=None):
+        if self.top_cache is None:
+            self.top_cache = {
+                role: [{"username": u, "rating": round(r)} for u, r in ladder.top(self.TOP)]
+                for role, ladder in self.ladders.items()
+            }
+
+        you = {}
+        for role, ladder in self.ladders.items():
+            rating = ladder.get(username)
+            if rating is not None:
+                you[role] = {"rating": round(rating), "rank": ladder.rank(username), "players": len(ladder)}
+
+        return {"type": "leaderboard", "top": self.top_cache, "you": you}
+
+# Rates made-up players and times the updates and queries
+def benchmark(players, matches):
+    from player import Player
+    from state import State
+
+    ratings = Ratings()
+    rng = random.Random(0)
+    ladder = ratings.ladders["snake"]
+
+    started = time.perf_counter()
+    ratings.load((role, f"player{i}", rng.gauss(1500, 200), 20) for i in range(players) for role in Ratings.ROLES)
+    print(f"loaded {players} players per role in {time.perf_counter() - started:.2f}s")
+
+    state = State()
+    state.game_over = True
+    snake_player, controller_player = Player([], [0, 0], 1, 1, "snake"), Player([], [0, 0], 2, 1, "controller")
+    started = time.perf_counter()
+    for _ in range(matches):
+        snake, controller = f"player{rng.randrange(players)}", f"player{rng.randrange(players)}"
+        state.winner = rng.choice((snake, controller))
+        ratings.update(state, {snake: snake_player, controller: controller_player} if snake != controller else {})
+    elapsed = time.perf_counter() - started
+    print(f"{matches} rated matches: {elapsed / matches * 1e6:.1f}us each")
+
+    started = time.perf_counter()
+    for _ in range(matches):
+        ladder.rank(f"player{rng.randrange(players)}")
+    print(f"rank: {(time.perf_counter() - started) / matches * 1e6:.1f}us")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        ladder.top(Ratings.TOP)
+    print(f"top {Ratings.TOP}: {(time.perf_counter() - started) / 1000 * 1e6:.1f}us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rating ladder benchmark")
+    parser.add_argument("--players", type=int, default=1000000)
+    parser.add_argument("--matches", type=int, default=100000)
+    args = parser.parse_args()
+    benchmark(args.players, args.matches)
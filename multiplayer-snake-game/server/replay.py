@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+from state import State
+from simulation import ManualClock
+from logging_utils import log_message
+
+# Replay files are JSON lines: a header with the seed, start time and initial state,
+# then one entry per change to the match, appended as the match runs:
+#   ["join", username, role]     player added with a role (None while waiting)
+#   ["leave", username]          player disconnected
+#   ["input", username, data]    input passed to State.apply_input
+#   ["tick", n]                  n ticks with no input in between
+#   ["end", winner, scores]      written when the room closes
+REPLAY_VERSION = 2 # 2: food placed from the grid's free cell index
+
+# Replay lines of every room in the process go through one writer thread, so a tick
+# only serializes its entries and never waits on the disk
+class ReplayWriter:
+    def __init__(self):
+        self.queue = queue.SimpleQueue() # (path, line), line None closes the file
+        self.thread = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def put(self, path, line):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.write_loop, name="replay-writer", daemon=True)
+                    self.thread.start()
+        self.queue.put((path, line))
+
+    def write_loop(self):
+        files = {}
+        failed = set() # replays that hit an error, the rest of their lines are dropped
+
+        while True:
+            path, line = self.queue.get()
+            if path is None:
+                break
+            if path in failed:
+                if line is None:
+                    failed.discard(path)
+                continue
+
+            try:
+                if line is None:
+                    files.pop(path).close()
+                    log_message("INFO", "Replay", "Saved replay %s", path)
+                    continue
+
+                file = files.get(path)
+                if file is None:
+                    file = files[path] = open(path, "a")
+                file.write(line)
+            except OSError as e:
+                log_message("ERROR", "Replay", "Could not write replay %s: %s", path, e)
+                failed.add(path)
+                file = files.pop(path, None)
+                if file:
+                    file.close()
+
+        for file in files.values():
+            file.close()
+
+    # Writes out what is queued and stops the thread, the next put starts a new one
+    def close(self):
+        with self.lock:
+            if self.thread is None:
+                return
+            self.queue.put((None, None))
+            self.thread.join()
+            self.thread = None
+
+replay_writer = ReplayWriter()
+
+class ReplayRecorder:
+    def __init__(self, path, seed, start, state):
+        self.path = path
+        self.pending_ticks = 0
+        self.closed = False
+
+        self.write({
+            "version": REPLAY_VERSION,
+            "seed": seed,
+            "start": start,
+            "state": state.to_dict()
+        })
+
+    @classmethod
+    def for_room(cls, replay_dir, room):
+        os.makedirs(replay_dir, exist_ok=True)
+        name = f"{int(room.start)}-{os.getpid()}-room{room.room_id}.replay"
+        return cls(os.path.join(replay_dir, name), room.seed, room.start, room.state)
+
+    # serialized right away: entries such as the state hold lists the match keeps changing
+    def write(self, entry):
+        if self.closed:
+            return # players still leave the room after the match ended
+        replay_writer.put(self.path, json.dumps(entry, separators=(",", ":")) + "\n")
+
+    # consecutive ticks are written as a single entry
+    def flush_ticks(self):
+        if self.pending_ticks:
+            self.write(["tick", self.pending_ticks])
+            self.pending_ticks = 0
+
+    def join(self, username, role):
+        self.flush_ticks()
+        self.write(["join", username, role])
+
+    def leave(self, username):
+        self.flush_ticks()
+        self.write(["leave", username])
+
+    def input(self, username, data):
+        self.flush_ticks()
+        self.write(["input", username, data])
+
+    def tick(self):
+        self.pending_ticks += 1
+
+    def close(self, state):
+        self.flush_ticks()
+        self.write(["end", state.winner, {u: p.score for u, p in state.players.items()}])
+        replay_writer.put(self.path, None)
+        self.closed = True
+
+class Replay:
+    def __init__(self, path):
+        with open(path) as f:
+            self.header = json.loads(f.readline())
+            self.entries = [json.loads(line) for line in f if line.strip()]
+
+        if self.header.get("version") != REPLAY_VERSION:
+            raise ValueError(f"Unsupported replay version: {self.header.get('version')}")
+
+        self.seed = self.header["seed"]
+        self.start = self.header["start"]
+        self.end = next((e for e in self.entries if e[0] == "end"), None)
+
+    # Fresh state seeded like the recorded room, checked against the recorded initial state
+    def new_state(self):
+        state = State(self.header["state"]["dimensions"], clock=ManualClock(self.start), rng=random.Random(self.seed))
+        if json.loads(json.dumps(state.to_dict())) != self.header["state"]:
+            raise ValueError("Replay was recorded with a different version of the game")
+        return state
+
+    # Yields the recorded entries with tick runs expanded into single ["tick"] entries
+    def events(self):
+        for entry in self.entries:
+            if entry[0] == "tick":
+                for _ in range(entry[1]):
+                    yield ["tick"]
+            elif entry[0] != "end":
+                yield entry
+
+    # Applies a non-tick entry to a room or replay player
+    @staticmethod
+    def apply(target, entry):
+        kind = entry[0]
+        if kind == "join":
+            target.add_player(entry[1], entry[2])
+        elif kind == "leave":
+            target.remove_player(entry[1])
+        elif kind == "input":
+            target.apply_input(entry[1], entry[2])
+
+    # Re-simulates the match as fast as possible, on_tick(state) is called after every tick
+    def play(self, on_tick=None):
+        player = ReplayPlayer(self.new_state())
+
+        for entry in self.events():
+            if entry[0] == "tick":
+                player.tick()
+                if on_tick:
+                    on_tick(player.state)
+            else:
+                self.apply(player, entry)
+
+        return player
+
+    # Returns a list of differences between the replayed result and the recorded one
+    def verify(self, state):
+        if self.end is None:
+            return ["replay has no end entry (match did not finish)"]
+
+        _, winner, scores = self.end
+        problems = []
+        if state.winner != winner:
+            problems.append(f"winner {state.winner!r}, recorded {winner!r}")
+
+        replayed = {u: p.score for u, p in state.players.items()}
+        if replayed != scores:
+            problems.append(f"scores {replayed}, recorded {scores}")
+        return problems
+
+# Drives a State the same way Room does, without any networking
+class ReplayPlayer:
+    def __init__(self, state):
+        self.state = state
+        self.ticks = 0
+
+    def add_player(self, username, role):
+        self.state.players.pop(username, None)
+        self.state.add_player(username, role=role)
+
+    def remove_player(self, username):
+        self.state.player_left(username)
+
+    def apply_input(self, username, data):
+        self.state.apply_input(username, data)
+
+    def tick(self):
+        self.state.update_state()
+        self.state.clock.advance(self.state.tick_interval)
+        self.ticks += 1
+
+def fast_forward(path):
+    replay = Replay(path)
+
+    started = time.perf_counter()
+    player = replay.play()
+    elapsed = time.perf_counter() - started
+
+    print(f"{path}: {player.ticks} ticks in {elapsed:.3f}s ({player.ticks / max(elapsed, 1e-9):,.0f} ticks/s)")
+    print(f"winner: {player.state.winner}")
+
+    problems = replay.verify(player.state)
+    for problem in problems:
+        print(f"MISMATCH: {problem}")
+    return not problems
+
+# Serves the replay as room 1 of a game server; watch it with the client's spectate prompt
+def watch(path, host, port, speed):
+    from rooms import ReplayRoom
+    from server import Server
+
+    async def serve():
+        server = Server(host, port)
+        room = ReplayRoom(1, server.scheduler, Replay(path), speed, on_close=server.rooms.remove_room)
+        server.rooms.rooms[room.room_id] = room
+        server.rooms.next_room_id = 2
+        await server.start()
+
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded snake match")
+    parser.add_argument("path")
+    parser.add_argument("--watch", action="store_true", help="stream the replay to spectating clients instead of fast-forwarding")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed when watching")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    if args.watch:
+        watch(args.path, args.host, args.port, args.speed)
+    else:
+        raise SystemExit(0 if fast_forward(args.path) else 1)
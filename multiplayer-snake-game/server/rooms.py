@@ -0,0 +1,353 @@
+import asyncio
+import random
+import time
+
+from state import State
+from simulation import ManualClock
+from delta import DeltaEncoder
+from fanout import FanOut
+from inputs import InputBuffer
+from metrics import TICK_PHASE_SECONDS, TICK_SECONDS, PhaseTimer
+from logging_utils import log_message
+from replay import Replay, ReplayRecorder
+
+class SpectatorFeed:
+    # Frames for all spectators watching at the same rate: delta encoded against what
+    # this feed last sent, serialized once per encoding for all of them
+    def __init__(self, rate):
+        self.rate = rate
+        self.encoder = DeltaEncoder()
+        self.fanout = FanOut()
+        self.resync = False # a spectator missed a delta frame
+        self.ticks_since_resync = InputBuffer.RESYNC_TICKS
+
+    # Called for every published frame, True when an asked for keyframe should go out
+    # now. Spectators share the encoder so one of them can't force keyframes on all.
+    def resync_due(self):
+        self.ticks_since_resync += 1
+        if not self.resync or self.ticks_since_resync < InputBuffer.RESYNC_TICKS:
+            return False
+        self.resync = False
+        self.ticks_since_resync = 0
+        return True
+
+class Room:
+    MAX_PLAYERS = 2
+
+    # seed and start pin down the match so a replay can reproduce it
+    def __init__(self, room_id, scheduler, on_close=None, seed=None, start=None):
+        self.room_id = room_id
+        self.seed = random.getrandbits(32) if seed is None else seed
+
+        # game time advances by one tick interval per tick, so a replay does not
+        # depend on how late the scheduler ran the ticks
+        self.clock = ManualClock(time.time() if start is None else start)
+        self.start = self.clock.now
+
+        self.state = State(clock=self.clock, rng=random.Random(self.seed))
+        self.state_lock = asyncio.Lock()
+        self.encoder = DeltaEncoder()
+        self.fanout = FanOut()
+        self.clients = {} # websocket -> username
+        self.inputs = {} # username -> InputBuffer, drained once per tick
+        self.scheduler = scheduler
+        self.on_close = on_close
+        self.scheduled = False
+        self.closed = False
+        self.match = None # router match token, if any
+        self.recorder = None # ReplayRecorder when replays are kept
+        self.history = None # MatchHistory the result is saved to, if any
+        self.ratings = None # Ratings updated with the result, if any
+        self.roster = {} # username -> Player of everyone who joined, kept after they leave or die
+        self.timer = PhaseTimer(TICK_PHASE_SECONDS)
+
+        # read-only viewers, grouped by the rate they asked for
+        self.spectators = {} # websocket -> SpectatorFeed
+        self.feeds = {} # rate -> SpectatorFeed
+        self.ticks = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__} {self.room_id}"
+
+    def log(self, level, msg, *args):
+        log_message(level, "Room", "[%s] " + msg, self.room_id, *args)
+
+    # Room accepts players until the match has its two players
+    def is_open(self):
+        return not self.closed and not self.state.game_started and len(self.state.players) < self.MAX_PLAYERS
+
+    # Adds a player with the role picked by the matchmaker, or assigns roles
+    # randomly once the second player arrives when no role is given
+    def add_client(self, websocket, username, encoding, role=None):
+        unique_username = self.state.get_unique_username(username)
+        self.clients[websocket] = unique_username
+        self.inputs[unique_username] = InputBuffer()
+        self.fanout.add(websocket, encoding)
+
+        if role is not None:
+            self.add_player(unique_username, role)
+
+        elif len(self.state.players) == 0:
+            # first player joins and waits for second player
+            self.add_player(unique_username, None)
+
+        elif len(self.state.players) == 1:
+            # once the second player joins, both players are assigned roles automatically
+            existing_username = next(iter(self.state.players))
+
+            roles = ["snake", "controller"]
+            random.shuffle(roles)
+
+            self.state.players.pop(existing_username)
+
+            # re-add existing player with correct role
+            self.add_player(existing_username, roles[0])
+
+            # add second player
+            self.add_player(unique_username, roles[1])
+
+        if not self.scheduled:
+            self.scheduled = True
+            self.scheduler.add(self)
+
+        return unique_username
+
+    # Removes a player, returns the username if it was in the room
+    def remove_client(self, websocket):
+        username = self.clients.pop(websocket, None)
+        self.fanout.remove(websocket)
+        if username:
+            self.inputs.pop(username, None)
+            self.remove_player(username)
+        return username
+
+    # Called by the handler for every input, applied on the next tick
+    def queue_input(self, username, data):
+        buffer = self.inputs.get(username)
+        if buffer:
+            buffer.push(data)
+
+    def apply_buffered_inputs(self):
+        for username, buffer in self.inputs.items():
+            player = self.state.players.get(username)
+            for data in buffer.drain(player.direction if player else None):
+                self.apply_input(username, data)
+            # not recorded, a keyframe doesn't change the match
+            if buffer.resync_due():
+                self.encoder.request_keyframe()
+
+    # Everything that changes the match goes through these so it can be recorded.
+    # A player re-added with a role replaces its earlier entry.
+    def add_player(self, username, role):
+        if self.recorder:
+            self.recorder.join(username, role)
+        self.state.players.pop(username, None)
+        self.state.add_player(username, role=role)
+        self.roster[username] = self.state.players[username]
+
+    def remove_player(self, username):
+        if self.recorder:
+            self.recorder.leave(username)
+        self.state.player_left(username)
+
+    def apply_input(self, username, data):
+        if self.recorder:
+            self.recorder.input(username, data)
+        self.state.apply_input(username, data)
+
+    # Adds a viewer receiving every `rate`-th game frame
+    def add_spectator(self, websocket, encoding, rate):
+        feed = self.feeds.get(rate)
+        if feed is None:
+            feed = self.feeds[rate] = SpectatorFeed(rate)
+
+        feed.fanout.add(websocket, encoding)
+        self.spectators[websocket] = feed
+
+        # late joiners start from a keyframe, joins within a tick share it
+        feed.encoder.request_keyframe()
+
+    def remove_spectator(self, websocket):
+        feed = self.spectators.pop(websocket, None)
+        if feed is None:
+            return
+
+        feed.fanout.remove(websocket)
+        if not feed.fanout.streams:
+            del self.feeds[feed.rate]
+
+    # A spectator missed a delta frame, players ask through queue_input
+    def request_keyframe(self, websocket):
+        feed = self.spectators.get(websocket)
+        if feed:
+            feed.resync = True
+
+    @property
+    def tick_interval(self):
+        return self.state.tick_interval
+
+    # Advances the match by one tick and returns the frame to broadcast
+    def build_frame(self):
+        if not self.state.game_started:
+            return {"type": "waiting"}
+
+        if self.recorder:
+            self.recorder.tick()
+        self.state.update_state()
+        self.clock.advance(self.state.tick_interval)
+        self.timer.mark("simulation")
+
+        if self.state.game_over:
+            return {
+                "type": "result",
+                "winner": self.state.winner
+            }
+
+        frame = self.encoder.encode(self.state)
+        self.timer.mark("delta")
+        return frame
+
+    # Called by the scheduler, returns False once the room should stop ticking.
+    # Handlers never await while holding state_lock, so the tick can run synchronously.
+    def tick(self):
+        if self.closed:
+            return False
+
+        self.timer.start()
+        self.apply_buffered_inputs()
+        self.timer.mark("inputs")
+        self.publish(self.build_frame())
+        TICK_SECONDS.observe(self.timer.elapsed())
+
+        if self.state.game_over or not self.clients:
+            self.close()
+            return False
+
+        return True
+
+    def publish(self, frame):
+        encoded = self.fanout.encode(frame)
+        self.timer.mark("serialize")
+        self.fanout.send(encoded)
+        self.timer.mark("fanout")
+
+        if self.feeds:
+            self.publish_spectators(frame)
+            self.timer.mark("spectators")
+
+    # Game frames are encoded per feed on the ticks it wants, waiting and result
+    # frames go to every feed as they are
+    def publish_spectators(self, frame):
+        if frame["type"] not in ("keyframe", "delta"):
+            for feed in self.feeds.values():
+                feed.fanout.publish(frame)
+            return
+
+        self.ticks += 1
+        for feed in self.feeds.values():
+            if self.ticks % feed.rate == 0:
+                if feed.resync_due():
+                    feed.encoder.request_keyframe()
+                feed.fanout.publish(feed.encoder.encode(self.state))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.fanout.finish()
+        for feed in self.feeds.values():
+            feed.fanout.finish()
+        if self.recorder:
+            self.recorder.close(self.state)
+        players = {u: p for u, p in self.roster.items() if p.role is not None}
+        rated = self.ratings.update(self.state, players) if self.ratings else None
+        if self.history:
+            self.history.record(self.state, players, self.seed, self.recorder.path if self.recorder else None, rated)
+        self.log("INFO", "Closing room (winner: %s)", self.state.winner)
+        if self.on_close:
+            self.on_close(self)
+
+# Plays a recorded match back to spectators, one recorded tick per room tick
+class ReplayRoom(Room):
+    def __init__(self, room_id, scheduler, replay, speed=1.0, on_close=None):
+        super().__init__(room_id, scheduler, on_close, seed=replay.seed, start=replay.start)
+        self.speed = speed
+        self.events = replay.events()
+        replay.new_state() # fails early on a replay from another game version
+
+    @property
+    def tick_interval(self):
+        return self.state.tick_interval / self.speed
+
+    # Starts playing once someone is watching
+    def add_spectator(self, websocket, encoding, rate):
+        super().add_spectator(websocket, encoding, rate)
+        if not self.scheduled:
+            self.scheduled = True
+            self.scheduler.add(self)
+
+    def tick(self):
+        if self.closed:
+            return False
+
+        # apply the recorded joins and inputs up to the next tick
+        self.timer.start()
+        for entry in self.events:
+            if entry[0] == "tick":
+                break
+            Replay.apply(self, entry)
+        else:
+            self.close()
+            return False
+
+        self.timer.mark("inputs")
+        self.publish(self.build_frame())
+        TICK_SECONDS.observe(self.timer.elapsed())
+
+        if self.state.game_over:
+            self.close()
+            return False
+
+        return True
+
+class RoomManager:
+    # Room ids go first_room_id, first_room_id + room_id_step, ... so that the workers
+    # of a sharded server never share one and the router can tell whose room it is
+    def __init__(self, scheduler, replay_dir=None, history=None, ratings=None, first_room_id=1, room_id_step=1):
+        self.scheduler = scheduler
+        self.replay_dir = replay_dir # directory for match replays, None to keep none
+        self.history = history # MatchHistory for match results, None to keep none
+        self.ratings = ratings # Ratings updated when matches end, None to rate none
+        self.rooms = {}
+        self.match_rooms = {} # match token from the router -> room
+        self.next_room_id = first_room_id
+        self.room_id_step = room_id_step
+
+    def log(self, level, msg, *args):
+        log_message(level, "RoomManager", msg, *args)
+
+    def create_room(self):
+        room = Room(self.next_room_id, self.scheduler, on_close=self.remove_room)
+        room.history = self.history
+        room.ratings = self.ratings
+        self.next_room_id += self.room_id_step
+        self.rooms[room.room_id] = room
+
+        if self.replay_dir:
+            room.recorder = ReplayRecorder.for_room(self.replay_dir, room)
+        self.log("DEBUG", "Created room %s", room.room_id)
+        return room
+
+    # Returns the room reserved for a match paired by the router
+    def get_match_room(self, match):
+        room = self.match_rooms.get(match)
+        if room is None or not room.is_open():
+            room = self.match_rooms[match] = self.create_room()
+            room.match = match
+        return room
+
+    def remove_room(self, room):
+        self.rooms.pop(room.room_id, None)
+        if self.match_rooms.get(room.match) is room:
+            del self.match_rooms[room.match]
+        self.log("DEBUG", "Removed room %s, %d active", room.room_id, len(self.rooms))
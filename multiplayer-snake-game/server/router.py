@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import json
+import multiprocessing
+import secrets
+
+import websockets
+
+import metrics
+from logging_utils import enable_queue_logging, log_message
+from matchmaking import Matchmaker, connection_open
+from history import MatchHistory
+from ratings import Ratings
+from protocol import clean_username
+
+# Runs a game server in a worker process
+def run_worker(host, port, replay_dir=None, metrics_port=None, history_path=None, worker=0, workers=1):
+    from server import Server
+
+    enable_queue_logging()
+    asyncio.run(Server(host, port, replay_dir, metrics_port, history_path, worker, workers).start())
+
+class Router:
+    RATINGS_REFRESH = 30 # seconds between reloads of the workers' saved ratings
+
+    def __init__(self, host, port, worker_ports, metrics_port=None, history_path=None):
+        self.host = host
+        self.port = port
+        self.worker_ports = worker_ports
+        self.metrics_port = metrics_port
+
+        # the workers save match results, the router only answers history queries
+        self.history = MatchHistory(history_path, readonly=True) if history_path else None
+        self.ratings = None # lobby leaderboard, read from the history
+        self.ratings_task = None
+        self.workers = itertools.cycle(range(len(worker_ports)))
+
+        # shared lobby for all workers
+        self.matchmaker = Matchmaker(self.route_match, alive=connection_open)
+
+    def log(self, level, msg, *args):
+        log_message(level, "Router", msg, *args)
+
+    # Hands matches to the workers in turn: the router is not told when a match ends,
+    # so it cannot tell which worker is least busy
+    def next_worker(self):
+        return next(self.workers)
+
+    # Called by the matchmaker: both clients get the same redirect to the chosen worker,
+    # roles are assigned by the worker room when they arrive
+    def route_match(self, first, first_role, second, second_role):
+        worker = self.next_worker()
+        redirect = json.dumps({
+            "type": "redirect",
+            "port": self.worker_ports[worker],
+            "match": secrets.token_hex(8)
+        })
+        self.log("INFO", "Routed match to worker %d (port %d)", worker, self.worker_ports[worker])
+        return redirect, redirect
+
+    # Worker i numbers its rooms i + 1, i + 1 + workers, ... (see RoomManager)
+    def worker_for_room(self, room_id):
+        return (room_id - 1) % len(self.worker_ports)
+
+    # Spectators are sent to the worker running the room and repeat their handshake there
+    async def redirect_spectator(self, websocket, data):
+        try:
+            room_id = int(data["spectate"])
+        except (TypeError, ValueError):
+            await websocket.close(reason="Invalid spectate request")
+            return
+        if room_id < 1:
+            await websocket.close(reason="No such room")
+            return
+
+        port = self.worker_ports[self.worker_for_room(room_id)]
+        await websocket.send(json.dumps({"type": "redirect", "port": port}))
+        self.log("INFO", "Sent spectator of room %d to port %d", room_id, port)
+
+    async def handler(self, websocket):
+        try:
+            # the username handshake is forwarded by the client after the redirect
+            data = json.loads(await websocket.recv())
+
+            if "spectate" in data:
+                await self.redirect_spectator(websocket, data)
+                return
+
+            if "history" in data:
+                if self.history is None:
+                    await websocket.close(reason="No match history on this server")
+                else:
+                    await self.history.send_recent(websocket, data)
+                return
+
+            ticket = self.matchmaker.join(websocket)
+            if not ticket.future.done():
+                await websocket.send(json.dumps({"type": "waiting"}))
+                if self.ratings:
+                    await websocket.send(json.dumps(self.ratings.leaderboard(clean_username(data.get("username")))))
+
+            redirect = await self.matchmaker.wait(ticket, websocket)
+            if redirect is not None:
+                await websocket.send(redirect)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    # Workers save the matches they run with the history, which rates them against the
+    # saved ratings; the router rebuilds its copy from the database off the event loop
+    async def refresh_ratings(self):
+        while True:
+            rows = await asyncio.to_thread(self.history.load_ratings)
+            ratings = Ratings()
+            await asyncio.to_thread(ratings.load, rows)
+            self.ratings = ratings
+            await asyncio.sleep(self.RATINGS_REFRESH)
+
+    async def start(self):
+        self.log("INFO", "Router running on %s:%s with %d workers", self.host, self.port, len(self.worker_ports))
+
+        if self.history:
+            self.ratings_task = asyncio.create_task(self.refresh_ratings())
+
+        if self.metrics_port:
+            metrics.REGISTRY.add_collector(lambda: metrics.collect_matchmaker(self.matchmaker))
+            await metrics.start_metrics_server("127.0.0.1", self.metrics_port)
+
+        async with websockets.serve(self.handler, self.host, self.port):
+            await asyncio.Future()
+
+# Starts one game server process per worker port and runs the router in this process
+# The router's metrics are on metrics_port, worker i's on metrics_port + 1 + i
+def run_sharded(host, port, workers, replay_dir=None, metrics_port=None, history_path=None):
+    worker_ports = [port + 1 + i for i in range(workers)]
+
+    for i, worker_port in enumerate(worker_ports):
+        worker_metrics_port = metrics_port + 1 + i if metrics_port else None
+        multiprocessing.Process(
+            target=run_worker,
+            args=(host, worker_port, replay_dir, worker_metrics_port, history_path, i, workers),
+            daemon=True
+        ).start()
+
+    enable_queue_logging()
+    asyncio.run(Router(host, port, worker_ports, metrics_port, history_path).start())
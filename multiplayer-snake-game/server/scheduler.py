@@ -0,0 +1,103 @@
+import asyncio
+import heapq
+import itertools
+import traceback
+
+from logging_utils import log_message
+
+class TickScheduler:
+    LATE_THRESHOLD = 0.25 # fraction of the tick interval a tick may run late before it is reported
+
+    def __init__(self):
+        self.heap = [] # (deadline, order, task)
+        self.order = itertools.count()
+        self.timer = None
+        self.timer_deadline = None
+
+        # stats
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_ticks = 0
+        self.failed_ticks = 0
+        self.max_lateness = 0.0
+
+    def log(self, level, msg, *args):
+        log_message(level, "Scheduler", msg, *args)
+
+    # Schedules a task (anything with tick() and tick_interval) one interval from now
+    def add(self, task):
+        loop = asyncio.get_running_loop()
+        self.push(loop.time() + task.tick_interval, task)
+
+    def push(self, deadline, task):
+        heapq.heappush(self.heap, (deadline, next(self.order), task))
+        self.arm()
+
+    # Keeps a single event loop timer set to the earliest deadline
+    def arm(self):
+        if not self.heap:
+            return
+
+        deadline = self.heap[0][0]
+        if self.timer is not None:
+            if self.timer_deadline <= deadline:
+                return
+            self.timer.cancel()
+
+        self.timer_deadline = deadline
+        self.timer = asyncio.get_running_loop().call_at(deadline, self.fire)
+
+    # Runs every task whose deadline has passed and schedules its next tick
+    def fire(self):
+        self.timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, task = heapq.heappop(self.heap)
+            lateness = now - deadline
+
+            try:
+                keep_running = task.tick()
+            except Exception:
+                # one broken task must not stop the timer every other task runs on
+                self.failed_ticks += 1
+                self.log("ERROR", "Tick of %r failed, dropping it:\n%s", task, traceback.format_exc())
+                self.drop(task)
+                continue
+            self.ticks += 1
+
+            if lateness > task.tick_interval * self.LATE_THRESHOLD:
+                self.late_ticks += 1
+                self.max_lateness = max(self.max_lateness, lateness)
+                self.log("DEBUG", "Tick ran %.1fms late", lateness * 1000)
+
+            if not keep_running:
+                continue
+
+            # next deadline stays on the absolute schedule
+            interval = task.tick_interval
+            next_deadline = deadline + interval
+
+            if next_deadline <= now:
+                # more than a whole period behind: skip the missed frames instead of bursting
+                skipped = int((now - deadline) / interval)
+                self.skipped_ticks += skipped
+                next_deadline = deadline + (skipped + 1) * interval
+
+            heapq.heappush(self.heap, (next_deadline, next(self.order), task))
+
+            # the loop clock moves on while ticks run
+            now = loop.time()
+
+        self.arm()
+
+    # Closes a task whose tick raised, it is not scheduled again
+    def drop(self, task):
+        close = getattr(task, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception:
+            self.log("ERROR", "Closing %r failed:\n%s", task, traceback.format_exc())
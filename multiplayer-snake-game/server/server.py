@@ -1,131 +1,243 @@
+import argparse
 import asyncio
 import json
+import signal
+import time
 import websockets
 import logging
-import random
 
-from state import State
-from logging_utils import log_message
+import metrics
+
+from rooms import RoomManager
+from scheduler import TickScheduler
+from matchmaking import Matchmaker, connection_open
+from history import MatchHistory
+from ratings import Ratings
+from replay import replay_writer
+from protocol import ENCODINGS, JSON, clean_username, decode_input, encode_frame
+from logging_utils import enable_queue_logging, log_message
 
 logging.getLogger("websockets").setLevel(logging.WARNING)
 
 class Server:
-    def __init__(self, host, port):
+    QUEUE_TIMEOUT = 300 # seconds a client waits for an opponent
+    MAX_SPECTATE_RATE = 10 # spectators get at least every 10th frame
+
+    # worker: index of this process among the workers of a sharded server
+    def __init__(self, host, port, replay_dir=None, metrics_port=None, history_path=None, worker=0, workers=1):
         self.host = host
         self.port = port
-        self.state = State()
-        self.clients = {}
-
-        self.state_lock = asyncio.Lock()
-        self.game_started = False
+        self.metrics_port = metrics_port # local metrics endpoint, None to disable
+        self.history = MatchHistory(history_path) if history_path else None
+        self.ratings = Ratings() # lobby leaderboard, the history rates the saved ratings itself
+        self.scheduler = TickScheduler()
+        self.rooms = RoomManager(self.scheduler, replay_dir, self.history, self.ratings, worker + 1, workers)
+        self.matchmaker = Matchmaker(self.create_match, alive=lambda client: connection_open(client[0]))
+        self.clients = {} # websocket -> room
 
-        self.match_start_time = None
-        self.START_DELAY = 9 # match instruction screen time
-        self.SCORE_TO_WIN = 5
-
-    def log(self, level, msg):
-        log_message(level, "Server", msg)
+    def log(self, level, msg, *args):
+        log_message(level, "Server", msg, *args)
 
     async def handler(self, websocket):
         try:
             # receive username
             msg = await websocket.recv()
             data = json.loads(msg)
-            username = data["username"]
-
-            async with self.state_lock:
-                unique_username = self.state.get_unique_username(username)
-                self.clients[websocket] = unique_username
-
-                if len(self.state.players) == 0:
-                    # first player joins and waits for second player
-                    self.state.add_player(unique_username, role=None)
 
-                elif len(self.state.players) == 1:
-                    # once the second player joins, both players are assigned roles automatically
-                    existing_username = next(iter(self.state.players))
-
-                    roles = ["snake", "controller"]
-                    random.shuffle(roles)
-
-                    existing_player = self.state.players.pop(existing_username)
-
-                    # re-add existing player with correct role
-                    self.state.add_player(existing_username, role=roles[0])
-
-                    # add second player
-                    self.state.add_player(unique_username, role=roles[1])
+            # frame encoding negotiated in the handshake
+            encoding = data.get("encoding", JSON)
+            if encoding not in ENCODINGS:
+                encoding = JSON
+
+            if "spectate" in data:
+                await self.spectate(websocket, data, encoding)
+                return
+
+            if "history" in data:
+                await self.send_history(websocket, data)
+                return
+
+            # capped so usernames always fit the binary frames
+            username = clean_username(data.get("username"))
+
+            if "match" in data:
+                # clients redirected by the router join the room of their match
+                room = self.rooms.get_match_room(data["match"])
+                started = time.perf_counter()
+                async with room.state_lock:
+                    metrics.LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+                    unique_username = room.add_client(websocket, username, encoding)
+                    self.clients[websocket] = room
+            else:
+                ticket = self.matchmaker.join((websocket, username, encoding))
+                if not ticket.future.done():
+                    await websocket.send(encode_frame({"type": "waiting"}, encoding))
+                    # control message, JSON text in either encoding
+                    await websocket.send(json.dumps(self.ratings.leaderboard(username)))
+
+                result = await self.matchmaker.wait(ticket, websocket, self.QUEUE_TIMEOUT)
+                if result is None:
+                    await websocket.close(reason="No opponent found")
+                    return
+                room, unique_username = result
 
             # send unique username back
             await websocket.send(unique_username)
-            self.log("INFO", f"{unique_username} connected.")
+            self.log("INFO", "%s connected to room %s (%s).", unique_username, room.room_id, encoding)
 
-            # main receive loop
+            # main receive loop: inputs are buffered and applied by the next tick,
+            # neither touches the state so no lock is taken
             async for msg in websocket:
-                data = json.loads(msg)
-                async with self.state_lock:
-                    if "direction" in data:
-                        self.state.update_player_direction(unique_username, data["direction"])
-                    elif "action" in data:
-
-                        # controller actions
-                        player = self.state.players.get(unique_username)
-                        if player and player.role == "controller":
-                            if data["action"] == "food_up":
-                                self.state.move_food(-1, 0)
-                            elif data["action"] == "food_down":
-                                self.state.move_food(1, 0)
-                            elif data["action"] == "food_left":
-                                self.state.move_food(0, -1)
-                            elif data["action"] == "food_right":
-                                self.state.move_food(0, 1)
-                            elif data["action"] == "spawn_wall":
-                                if player.role == "controller":
-                                    self.state.spawn_wall_in_front_of_snake(unique_username)
+                metrics.MESSAGES_IN.inc()
+                data = decode_input(msg)
+                if data is not None:
+                    room.queue_input(unique_username, data)
 
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
             await self.disconnect(websocket)
         
+    # Read-only viewer of a room: {"spectate": room_id, "rate": n} subscribes to the
+    # room's shared spectator stream for every n-th frame
+    async def spectate(self, websocket, data, encoding):
+        try:
+            room_id = int(data["spectate"])
+            rate = min(max(int(data.get("rate", 1)), 1), self.MAX_SPECTATE_RATE)
+        except (TypeError, ValueError):
+            await websocket.close(reason="Invalid spectate request")
+            return
+
+        room = self.rooms.rooms.get(room_id)
+        if room is None or room.closed:
+            await websocket.close(reason="No such room")
+            return
+
+        started = time.perf_counter()
+        async with room.state_lock:
+            metrics.LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+            room.add_spectator(websocket, encoding, rate)
+            self.clients[websocket] = room
+
+        self.log("INFO", "Spectator joined room %s (%s, every %d frames), %d watching",
+            room.room_id, encoding, rate, len(room.spectators))
+
+        # spectators only ever ask for keyframes
+        async for msg in websocket:
+            metrics.MESSAGES_IN.inc()
+            data = decode_input(msg)
+            if data is not None and "resync" in data:
+                room.request_keyframe(websocket)
+
+    # {"history": username} asks for the player's recent matches instead of playing
+    async def send_history(self, websocket, data):
+        if self.history is None:
+            await websocket.close(reason="No match history on this server")
+            return
+        await self.history.send_recent(websocket, data)
+
+    # Called by the matchmaker with two queued clients: creates their room
+    def create_match(self, first, first_role, second, second_role):
+        room = self.rooms.create_room()
+        results = []
+
+        for (websocket, username, encoding), role in ((first, first_role), (second, second_role)):
+            unique_username = room.add_client(websocket, username, encoding, role)
+            self.clients[websocket] = room
+            results.append((room, unique_username))
+
+        return results
+
     async def disconnect(self, websocket):
-        async with self.state_lock:
-            username = self.clients.pop(websocket, None)
+        room = self.clients.pop(websocket, None)
+        if room is None:
+            return
+
+        started = time.perf_counter()
+        async with room.state_lock:
+            metrics.LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+            if websocket in room.spectators:
+                room.remove_spectator(websocket)
+                return
+
+            username = room.remove_client(websocket)
             if username:
-                self.state.remove_player(username)
-                self.log("INFO", f"{username} disconnected.")
-
-    async def broadcast_loop(self):
-        while True:
-            async with self.state_lock:
-                if len(self.state.players) < 2:
-                    message = json.dumps({"type": "waiting"})
-                else:
-                    self.state.update_state()
-
-                    if self.state.game_over:
-                        message = json.dumps({
-                            "type": "result",
-                            "winner": self.state.winner
-                        })
-                    else:
-                        message = self.state.to_json()
-
-            for ws in list(self.clients):
-                try:
-                    await ws.send(message)
-                except:
-                    await self.disconnect(ws)
-
-            await asyncio.sleep(self.state.tick_interval)
+                self.log("INFO", "%s disconnected.", username)
+
+    # Refreshes the gauges right before a metrics scrape
+    def collect_metrics(self):
+        players = spectators = queued = deepest = 0
+
+        for room in self.rooms.rooms.values():
+            players += len(room.clients)
+            spectators += len(room.spectators)
+
+            fanouts = [room.fanout] + [feed.fanout for feed in room.feeds.values()]
+            for fanout in fanouts:
+                for stream in fanout.streams.values():
+                    depth = len(stream.queue)
+                    queued += depth
+                    deepest = max(deepest, depth)
+
+        metrics.CLIENTS.labels("player").set(players)
+        metrics.CLIENTS.labels("spectator").set(spectators)
+        metrics.ROOMS.set(len(self.rooms.rooms))
+        metrics.SEND_QUEUE_FRAMES.set(queued)
+        metrics.SEND_QUEUE_MAX.set(deepest)
+
+        if self.history:
+            metrics.HISTORY_QUEUE.set(self.history.pending())
+
+        metrics.collect_scheduler(self.scheduler)
+        metrics.collect_matchmaker(self.matchmaker)
 
     async def start(self):
-        self.log("INFO", f"Server running on {self.host}:{self.port}")
+        if self.history:
+            rows = await asyncio.to_thread(self.history.load_ratings)
+            await asyncio.to_thread(self.ratings.load, rows)
+            self.log("INFO", "Loaded %d ratings", len(rows))
 
-        async with websockets.serve(self.handler, self.host, self.port):
-            asyncio.create_task(self.broadcast_loop())
-            await asyncio.Future()
+        self.log("INFO", "Server running on %s:%s", self.host, self.port)
+
+        if self.metrics_port:
+            metrics.REGISTRY.add_collector(self.collect_metrics)
+            await metrics.start_metrics_server("127.0.0.1", self.metrics_port)
+
+        # sharded workers are stopped with SIGTERM, which would skip the finally below
+        stop = asyncio.get_running_loop().create_future()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set_result, None)
+        except NotImplementedError:
+            pass # no signal handlers on Windows event loops
+
+        try:
+            async with websockets.serve(self.handler, self.host, self.port):
+                await stop
+        finally:
+            # results and replay lines still queued by the writer threads are saved before exiting
+            await asyncio.to_thread(replay_writer.close)
+            if self.history:
+                await asyncio.to_thread(self.history.close)
+                self.log("INFO", "Match history closed")
 
 if __name__ == "__main__":
-    server = Server("0.0.0.0", 5050)
-    asyncio.run(server.start())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Multiplayer snake server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--workers", type=int, default=1,
+        help="game server processes; above 1 a router on --port sends matches to workers on the following ports")
+    parser.add_argument("--replays", default=None,
+        help="directory to save a replay of every match to")
+    parser.add_argument("--metrics-port", type=int, default=None,
+        help="serve Prometheus metrics on 127.0.0.1 at this port; workers use the following ports")
+    parser.add_argument("--history", default=None,
+        help="SQLite database to save match results to, shared by all workers")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        from router import run_sharded
+        run_sharded(args.host, args.port, args.workers, args.replays, args.metrics_port, args.history)
+    else:
+        enable_queue_logging()
+        server = Server(args.host, args.port, args.replays, args.metrics_port, args.history)
+        asyncio.run(server.start())
\ No newline at end of file
@@ -0,0 +1,100 @@
+import random
+
+from state import State
+from grid import EMPTY
+
+class ManualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+class Simulation:
+    SNAKE = "snake"
+    CONTROLLER = "controller"
+
+    def __init__(self, seed=0, dimensions=None, skip_countdown=True):
+        self.seed = seed
+        self.clock = ManualClock()
+        self.state = State(dimensions, clock=self.clock, rng=random.Random(seed))
+        self.ticks = 0
+
+        self.state.add_player(self.SNAKE, role="snake")
+        self.state.add_player(self.CONTROLLER, role="controller")
+
+        if skip_countdown:
+            self.clock.advance(self.state.START_DELAY)
+
+    # Advances one tick: applies the inputs, updates the state and moves the clock on by tick_interval
+    def step(self, inputs=()):
+        for username, data in inputs:
+            self.state.apply_input(username, data)
+
+        self.state.update_state()
+        self.clock.advance(self.state.tick_interval)
+        self.ticks += 1
+        return self.state.game_over
+
+    # Runs up to n ticks, script(sim) returns the inputs for each tick
+    def run(self, n, script=None):
+        for _ in range(n):
+            inputs = script(self) if script else ()
+            if self.step(inputs):
+                break
+        return self.ticks
+
+    # Replaces the snake's body with a serpentine of the given length starting at the top left
+    def set_snake_length(self, length):
+        state = self.state
+        snake = state.players[self.SNAKE]
+        height, width = state.dimensions
+
+        for i in snake.body:
+            state.grid.remove_snake_cell(i, snake.grid_id)
+
+        cells = []
+        y, x, dx = 2, 2, 1
+        while len(cells) < length and y < height - 2:
+            cells.append(y * width + x)
+            if 2 <= x + dx < width - 2:
+                x += dx
+            else:
+                y += 1
+                dx = -dx
+
+        snake.body.clear()
+        snake.body.extend(reversed(cells))
+        snake.direction = [1, 0]
+        snake.json_marker = None # body changed without moving
+
+        for i in snake.body:
+            state.grid.add_snake_cell(i, snake.grid_id)
+
+    # Scripted snake input: keeps going straight unless the next cell is a border or wall
+    def autopilot(self):
+        state = self.state
+        snake = state.players.get(self.SNAKE)
+        if not snake or not snake.body:
+            return []
+
+        y, x = snake.get_head()
+        height, width = state.dimensions
+        options = [snake.direction] + list(State.DIRECTION_MAP.values())
+
+        for dy, dx in options:
+            ny, nx = y + dy, x + dx
+            if (
+                0 < ny < height - 1 and 0 < nx < width - 1
+                and state.grid.get(ny, nx) in (EMPTY, snake.grid_id)
+                and not state.is_opposite_direction([dy, dx], snake.direction)
+            ):
+                if [dy, dx] == snake.direction:
+                    return []
+                key = next(k for k, v in State.DIRECTION_MAP.items() if v == [dy, dx])
+                return [(self.SNAKE, {"direction": key})]
+
+        return []
@@ -2,9 +2,11 @@
 import json
 import random
 import time
+from collections import deque
 
-from logging_utils import log_message
+from logging_utils import is_enabled, log_message
 from player import Player
+from grid import OccupancyGrid, SNAKE_BASE, WALL
 
 class State:
     DIRECTION_MAP = {
@@ -14,17 +16,32 @@ class State:
         "d": [0, 1]
     }
 
-    def __init__(self):
-        self.dimensions = [30, 50]
+    def __init__(self, dimensions=None, clock=time.time, rng=None):
+        # clock and rng can be injected for headless simulation and replays
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+        self.dimensions = dimensions or [30, 50]
         self.food_pos = self.get_random_position()
         self.players = {}
+
+        # persistent occupancy grid for snake bodies and walls
+        self.grid = OccupancyGrid(self.dimensions)
+        self.next_grid_id = SNAKE_BASE
         self.game_started = False
         self.game_over = False
         self.winner = None
         self.game_over_message = ""
 
         self.walls = [] 
-        self.wall_spawns = {} 
+        self.next_wall_id = 1
+        self.walls_json = None # cached encoding, reset when walls change
+
+        # wall spawn quota: (time, username) in spawn order plus running counts per player
+        self.wall_spawns = deque()
+        self.wall_spawn_counts = {}
+        self.wall_spawns_left = None # cached quota, reset when counts or players change
+        self.wall_spawns_left_json = None
         self.WALL_LIMIT = 4
         self.WALL_COOLDOWN = 60
         self.WALL_LIFETIME = 8
@@ -46,32 +63,73 @@ class State:
         self.remaining_time = None
 
     # Logs a message
-    def log_message(self, type, message):
-        log_message(type, f"State", message)
+    def log_message(self, type, message, *args):
+        log_message(type, "State", message, *args)
 
-    def to_json(self):
-        return json.dumps({
+    def to_dict(self):
+        return {
             "dimensions": self.dimensions,
             "food_pos": self.food_pos,
             "players": {username: player.to_dict() for username, player in self.players.items()},
             "game_over": self.game_over,
             "game_over_message": self.game_over_message,
             "walls": self.walls,
-            "wall_spawns_left": {
-                u: max(0, self.WALL_LIMIT - len([
-                    t for t in self.wall_spawns.get(u, [])
-                    if time.time() - t < self.WALL_COOLDOWN
-                ]))
-                for u in self.players
-            },
+            "wall_spawns_left": self.get_wall_spawns_left(),
             "remaining_time": self.remaining_time,
             "score_to_win": self.SCORE_TO_WIN
-        })
+        }
+
+    # Same output as json.dumps(self.to_dict()), reusing cached fragments for the
+    # players, walls and quota that did not change since the last call
+    def to_json(self):
+        players = ", ".join(
+            f"{json.dumps(username)}: {player.to_json()}"
+            for username, player in self.players.items()
+        )
+
+        if self.walls_json is None:
+            self.walls_json = json.dumps(self.walls)
+
+        self.get_wall_spawns_left()
+        if self.wall_spawns_left_json is None:
+            self.wall_spawns_left_json = json.dumps(self.wall_spawns_left)
+
+        return (
+            f'{{"dimensions": {json.dumps(self.dimensions)}, '
+            f'"food_pos": {json.dumps(self.food_pos)}, '
+            f'"players": {{{players}}}, '
+            f'"game_over": {json.dumps(self.game_over)}, '
+            f'"game_over_message": {json.dumps(self.game_over_message)}, '
+            f'"walls": {self.walls_json}, '
+            f'"wall_spawns_left": {self.wall_spawns_left_json}, '
+            f'"remaining_time": {json.dumps(self.remaining_time)}, '
+            f'"score_to_win": {json.dumps(self.SCORE_TO_WIN)}}}'
+        )
+
+    # Drops spawns older than WALL_COOLDOWN from the running counts
+    def expire_wall_spawns(self, now):
+        while self.wall_spawns and now - self.wall_spawns[0][0] >= self.WALL_COOLDOWN:
+            _, username = self.wall_spawns.popleft()
+            self.wall_spawn_counts[username] -= 1
+            self.wall_spawns_left = None
+
+    # Number of walls each player can still spawn in the current cooldown window
+    def get_wall_spawns_left(self):
+        self.expire_wall_spawns(self.clock())
+
+        if self.wall_spawns_left is None:
+            self.wall_spawns_left = {
+                u: max(0, self.WALL_LIMIT - self.wall_spawn_counts.get(u, 0))
+                for u in self.players
+            }
+            self.wall_spawns_left_json = None
+
+        return self.wall_spawns_left
 
     # Gets a random position
     def get_random_position(self, buffer=3):
-        return [random.randint(1+buffer, self.dimensions[0]-2-buffer), 
-            random.randint(1+buffer, self.dimensions[1]-2-buffer)]
+        return [self.rng.randint(1+buffer, self.dimensions[0]-2-buffer), 
+            self.rng.randint(1+buffer, self.dimensions[1]-2-buffer)]
 
     # Appends a number until the username is unique
     def get_unique_username(self, username):
@@ -80,20 +138,20 @@ class State:
             suffix = str(counter)
             counter += 1
 
-        self.log_message("INFO", f"Unique username: {username+suffix}")
+        self.log_message("INFO", "Unique username: %s", username+suffix)
         return username+suffix
 
     # Adds a new player to the map
     def add_player(self, username, role=None):
-        self.log_message("INFO", f"Player {username}: Joining as {role}")
+        self.log_message("INFO", "Player %s: Joining as %s", username, role)
 
         colour_pair_id = self.get_available_colour()
 
         if role == "snake":
-            y = random.randint(5, self.dimensions[0] - 6)
-            x = random.randint(5, self.dimensions[1] - 6)
+            y = self.rng.randint(5, self.dimensions[0] - 6)
+            x = self.rng.randint(5, self.dimensions[1] - 6)
             segments = [[y, x]]
-            direction = random.choice(list(State.DIRECTION_MAP.values()))
+            direction = self.rng.choice(list(State.DIRECTION_MAP.values()))
 
         elif role == "controller":
             segments = []
@@ -103,43 +161,60 @@ class State:
             segments = [] # controller has no body
             direction = [0, 0] # no movement
 
-        player = Player(segments, direction, colour_pair_id, role)
+        player = Player(segments, direction, colour_pair_id, self.dimensions[1], role, self.next_grid_id)
+        self.next_grid_id += 1
         self.players[username] = player
+        self.wall_spawns_left = None
+
+        for i in player.body:
+            self.grid.add_snake_cell(i, player.grid_id)
 
         if len(self.players) == 2:
             self.game_started = True
-            self.match_start_time = time.time() + self.START_DELAY
+            self.match_start_time = self.clock() + self.START_DELAY
 
     def get_available_colour(self):
         used_colour = {player.colour for player in self.players.values()}
         for colour in range(1, 8):
             if colour not in used_colour:
                 return colour
-        return random.randint(1, 7)
+        return self.rng.randint(1, 7)
 
     # Removes a player from the map
     def remove_player(self, username):
         if username in self.players:
-            self.log_message("INFO", f"Player {username}: Removing from list of players in game")
-            self.players.pop(username)
-            self.log_message("DEBUG", f"List of players: {[username for username in self.players]}")
-
-    # Gets the segments from all the snakes
-    def get_occupied_positions(self):
-        occupied_positions = []
-
-        for player in self.players.values():
-            occupied_positions.extend(player.segments)
-
-        return occupied_positions
-
-    # Regenerates the food if a snake eats it
-    def regenerate_food(self, eater, occupied_positions):
-        self.log_message("INFO", f"Player {eater}: Ate food")
+            self.log_message("INFO", "Player %s: Removing from list of players in game", username)
+            player = self.players.pop(username)
+            self.wall_spawns_left = None
+            for i in player.body:
+                self.grid.remove_snake_cell(i, player.grid_id)
+            if is_enabled("DEBUG", "State"):
+                self.log_message("DEBUG", "List of players: %s", list(self.players))
+
+    # A player disconnected: once the match is on, the one left wins, a match
+    # left during the countdown ends without a winner
+    def player_left(self, username):
+        self.remove_player(username)
+        if not self.game_started or self.game_over:
+            return
 
-        self.food_pos = self.get_random_position()
-        while self.food_pos in occupied_positions:
-            self.food_pos = self.get_random_position()
+        self.game_over = True
+        if self.clock() < self.match_start_time:
+            self.winner = None
+            self.game_over_message = "Match abandoned"
+        else:
+            self.winner = next(iter(self.players), None)
+            self.game_over_message = "Opponent left"
+        self.log_message("INFO", "Player %s: Left the match, winner %s", username, self.winner)
+
+    # Moves the food to a random free cell after a snake eats it
+    def regenerate_food(self, eater):
+        self.log_message("INFO", "Player %s: Ate food", eater)
+
+        # the grid's free cell index excludes snakes and walls; on a full board the food stays put
+        food_pos = self.grid.random_free_cell(self.rng)
+        if food_pos is not None:
+            self.food_pos = food_pos
         
         self.players[eater].score += 1
 
@@ -150,70 +225,57 @@ class State:
 
     # Moves all snakes one step
     def update_state(self):
-        now = time.time()
+        now = self.clock()
 
         # No snakes alive
-        if not any(p.role == "snake" and p.segments for p in self.players.values()):
+        if not any(p.role == "snake" and p.body for p in self.players.values()):
             return
 
         if not self.game_started or now < self.match_start_time or self.game_over:
             return
 
         # Cleanup expired walls
-        self.walls = [w for w in self.walls if w["expires_at"] > now]
+        if any(w["expires_at"] <= now for w in self.walls):
+            for wall in self.walls:
+                if wall["expires_at"] <= now:
+                    self.grid.remove_wall(wall["cells"])
+            self.walls = [w for w in self.walls if w["expires_at"] > now]
+            self.walls_json = None
 
         eliminated_players = []
         eater = None
 
         for username, player in self.players.items():
-            if player.role != "snake" or not player.segments:
+            if player.role != "snake" or not player.body:
                 continue
 
-            # Occupied positions : other snakes only
-            occupied_positions = [
-                pos
-                for u, p in self.players.items()
-                if p.role == "snake" and u != username
-                for pos in p.segments
-            ]
-
-            old_tail = player.segments[-1]
-
             # Move snake
             player.add_new_head()
-
-            # Allow moving into own tail
-            temp_occupied = occupied_positions.copy()
-            if old_tail in temp_occupied:
-                temp_occupied.remove(old_tail)
+            head_y, head_x = player.get_head()
 
             # Wall collision
-            hit_wall = False
-            for wall in self.walls:
-                if player.get_head() in wall["cells"]:
-                    self.log_message("INFO", f"{username} hit a wall")
-                    eliminated_players.append(username)
-                    hit_wall = True
-                    break
-
-            if hit_wall:
+            if self.grid.get(head_y, head_x) == WALL:
+                self.log_message("INFO", "%s hit a wall", username)
+                eliminated_players.append(username)
                 continue
 
-            # Boundary / snake collision
-            if not player.check_is_alive(temp_occupied, self.dimensions):
-                self.log_message("INFO", f"Player {username}: Has died")
+            # Boundary / snake collision (other snakes only)
+            if not player.check_is_alive(self.grid, self.dimensions):
+                self.log_message("INFO", "Player %s: Has died", username)
                 eliminated_players.append(username)
                 continue
 
+            self.grid.add_snake_cell(player.get_head_index(), player.grid_id)
+
             # Food check
             if player.get_head() != self.food_pos:
-                player.pop_tail()
+                self.grid.remove_snake_cell(player.pop_tail(), player.grid_id)
             else:
                 eater = username
 
         # Handle food scoring
         if eater is not None:
-            self.regenerate_food(eater, [])
+            self.regenerate_food(eater)
             self.sort_leaderboard()
 
         # Remove eliminated snakes
@@ -260,7 +322,33 @@ class State:
     # Sorts the players based on score
     def sort_leaderboard(self):
         self.players = dict(sorted(self.players.items(), key=lambda player: player[1].score, reverse=True))
-
+        self.wall_spawns_left = None
+
+
+    # Applies a client input ({"direction": key} or {"action": name}), or a
+    # {"food_move": [dy, dx]} clamped once, as the batch simulation moves food
+    def apply_input(self, username, data):
+        if "direction" in data:
+            self.update_player_direction(username, data["direction"])
+        elif "food_move" in data:
+            player = self.players.get(username)
+            if player and player.role == "controller":
+                self.move_food(*data["food_move"])
+        elif "action" in data:
+
+            # controller actions
+            player = self.players.get(username)
+            if player and player.role == "controller":
+                if data["action"] == "food_up":
+                    self.move_food(-1, 0)
+                elif data["action"] == "food_down":
+                    self.move_food(1, 0)
+                elif data["action"] == "food_left":
+                    self.move_food(0, -1)
+                elif data["action"] == "food_right":
+                    self.move_food(0, 1)
+                elif data["action"] == "spawn_wall":
+                    self.spawn_wall_in_front_of_snake(username)
 
     # Updates the player's direction to match their keypress
     def update_player_direction(self, username, key):
@@ -270,7 +358,7 @@ class State:
             new_dir = State.DIRECTION_MAP[key]
             if not self.is_opposite_direction(new_dir, player.direction):
                 player.direction = new_dir
-                self.log_message("INFO", f"Player {username}: Direction updated to {key}")
+                self.log_message("INFO", "Player %s: Direction updated to %s", username, key)
 
     # Checks if two directions are opposites
     def is_opposite_direction(self, dir1, dir2):
@@ -283,14 +371,12 @@ class State:
         self.food_pos = [ny, nx]
     
     def spawn_wall_in_front_of_snake(self, controller_username):
-        now = time.time()
-        history = self.wall_spawns.get(controller_username, [])
+        now = self.clock()
 
         # Remove old timestamps
-        history = [t for t in history if now - t < self.WALL_COOLDOWN]
-        self.wall_spawns[controller_username] = history
+        self.expire_wall_spawns(now)
 
-        if len(history) >= self.WALL_LIMIT:
+        if self.wall_spawn_counts.get(controller_username, 0) >= self.WALL_LIMIT:
             return False
 
         # Find the snake
@@ -305,15 +391,9 @@ class State:
         base_y = head_y + dy * 5
         base_x = head_x + dx * 5
 
-        length = random.randint(5, 7)
+        length = self.rng.randint(5, 7)
         cells = []
 
-        occupied = {
-            (y, x)
-            for player in self.players.values()
-            for y, x in player.segments
-        }
-
         # Wall is perpendicular to movement
         for i in range(-length // 2, length // 2 + 1):
             if dy != 0: # moving vertically : horizontal wall
@@ -321,18 +401,29 @@ class State:
             else: # moving horizontally : vertical wall
                 y, x = base_y + i, base_x
 
+            # skips wall cells as well as snakes: a grid cell holds one tag, so
+            # overlapping walls would let the first to expire clear the other's cell.
+            # Food isn't in the grid and a wall may still cover it, as it always could.
             if (
                 1 <= y < self.dimensions[0] - 1 and
                 1 <= x < self.dimensions[1] - 1 and
-                (y, x) not in occupied
+                self.grid.is_empty(y, x)
             ):
                 cells.append([y, x])
 
+        self.add_wall(cells, now)
+        self.wall_spawns.append((now, controller_username))
+        self.wall_spawn_counts[controller_username] = self.wall_spawn_counts.get(controller_username, 0) + 1
+        self.wall_spawns_left = None
+        return True
+
+    # Places a wall on the board that expires after WALL_LIFETIME
+    def add_wall(self, cells, now):
+        self.grid.add_wall(cells)
         self.walls.append({
+            "id": self.next_wall_id,
             "cells": cells,
             "expires_at": now + self.WALL_LIFETIME
         })
-
-        history.append(now)
-        self.wall_spawns[controller_username] = history
-        return True
\ No newline at end of file
+        self.next_wall_id += 1
+        self.walls_json = None
\ No newline at end of file
@@ -0,0 +1,43 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, "server")
+CLIENT = os.path.join(ROOT, "client")
+
+# server modules import each other by name, as when run from server/
+sys.path.insert(0, SERVER)
+
+# Client and server both have a protocol module: client modules are loaded as
+# client_<name>, with the client's protocol swapped in while they import
+def load_client_module(name):
+    key = "client_" + name
+    if key in sys.modules:
+        return sys.modules[key]
+
+    server_protocol = sys.modules.get("protocol")
+    if name != "protocol":
+        sys.modules["protocol"] = load_client_module("protocol")
+
+    try:
+        spec = importlib.util.spec_from_file_location(key, os.path.join(CLIENT, name + ".py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[key] = module
+        spec.loader.exec_module(module)
+    finally:
+        if server_protocol is not None:
+            sys.modules["protocol"] = server_protocol
+        else:
+            sys.modules.pop("protocol", None)
+    return module
+
+@pytest.fixture(scope="session")
+def client_protocol():
+    return load_client_module("protocol")
+
+@pytest.fixture(scope="session")
+def loadgen():
+    return load_client_module("loadgen")
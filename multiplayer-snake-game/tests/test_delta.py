@@ -0,0 +1,59 @@
+import json
+
+from delta import DeltaEncoder
+from simulation import Simulation
+
+def expected(state):
+    return json.loads(json.dumps(state.to_dict()))
+
+# Steps the match and returns the next frame, keyframes with their state decoded
+def tick(sim, encoder):
+    sim.step(sim.autopilot())
+    frame = encoder.encode(sim.state)
+    if frame["type"] == "keyframe":
+        frame["state"] = json.loads(frame.pop("state_json"))
+    return frame
+
+def test_deltas_carry_only_what_changed():
+    sim = Simulation(seed=1)
+    encoder = DeltaEncoder()
+    assert tick(sim, encoder)["type"] == "keyframe"
+
+    frame = tick(sim, encoder)
+    assert frame["type"] == "delta"
+    assert list(frame["players"]) == [Simulation.SNAKE] # the controller never moves
+    assert set(frame["players"][Simulation.SNAKE]) <= {"head", "tail", "score", "direction"}
+    assert len(frame["players"][Simulation.SNAKE]["head"]) == 1
+
+def test_resync_after_a_lost_delta(client_protocol):
+    sim = Simulation(seed=1)
+    encoder = DeltaEncoder()
+    client_state = tick(sim, encoder)["state"]
+    for _ in range(3):
+        client_state = client_protocol.apply_delta(client_state, tick(sim, encoder))
+    assert client_state == expected(sim.state)
+
+    # the lost delta leaves a gap: applying the next one would put the snake in the wrong place
+    lost = tick(sim, encoder)
+    frame = tick(sim, encoder)
+    assert frame["seq"] == lost["seq"] + 1
+    assert client_protocol.apply_delta(client_state, frame) != expected(sim.state)
+
+    # the keyframe asked for brings the client back, deltas apply on top of it again
+    encoder.request_keyframe()
+    frame = tick(sim, encoder)
+    assert frame["type"] == "keyframe"
+    client_state = frame["state"]
+    for _ in range(5):
+        client_state = client_protocol.apply_delta(client_state, tick(sim, encoder))
+    assert client_state == expected(sim.state)
+
+def test_keyframes_are_forced_periodically_and_on_roster_changes():
+    sim = Simulation(seed=1)
+    encoder = DeltaEncoder()
+    types = [tick(sim, encoder)["type"] for _ in range(DeltaEncoder.KEYFRAME_INTERVAL + 2)]
+    assert types[0] == types[-1] == "keyframe"
+    assert types.count("keyframe") == 2
+
+    sim.state.remove_player(Simulation.CONTROLLER)
+    assert tick(sim, encoder)["type"] == "keyframe"
@@ -0,0 +1,59 @@
+import asyncio
+
+import protocol
+from fanout import ClientStream, FanOut
+from protocol import BINARY, JSON
+
+class FakeWebSocket:
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    async def send(self, message):
+        await self.unblocked.wait()
+        self.sent.append(message)
+
+def test_frames_are_serialized_once_per_encoding(monkeypatch):
+    encoded = []
+    encode_frame = protocol.encode_frame
+    monkeypatch.setattr("fanout.encode_frame", lambda frame, encoding: encoded.append(encoding) or encode_frame(frame, encoding))
+
+    async def main():
+        fanout = FanOut()
+        sockets = [(FakeWebSocket(), encoding) for encoding in (JSON, JSON, JSON, BINARY, BINARY)]
+        for websocket, encoding in sockets:
+            fanout.add(websocket, encoding)
+
+        fanout.publish({"type": "waiting"})
+        await asyncio.sleep(0)
+
+        assert sorted(encoded) == [BINARY, JSON]
+        for websocket, encoding in sockets:
+            assert websocket.sent == [encode_frame({"type": "waiting"}, encoding)]
+        fanout.finish()
+    asyncio.run(main())
+
+def test_slow_client_loses_its_backlog_without_holding_up_the_rest():
+    async def main():
+        fanout = FanOut()
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        fanout.add(slow, JSON)
+        fanout.add(fast, JSON)
+
+        frames = ClientStream.MAX_DEPTH + 3
+        for seq in range(frames):
+            fanout.publish({"type": "delta", "seq": seq})
+            await asyncio.sleep(0)
+        assert len(fast.sent) == frames
+        assert fanout.streams[slow].dropped == 1
+
+        # the slow client gets its first frame and what came after the drop, and then
+        # sees the gap in seq that makes it ask for a keyframe
+        slow.unblocked.set()
+        await asyncio.sleep(0)
+        assert len(slow.sent) < frames
+        assert slow.sent[-1] == fast.sent[-1]
+        fanout.finish()
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import random
+
+from grid import EMPTY, WALL, OccupancyGrid
+from simulation import Simulation
+
+SNAKE, OTHER = 2, 3 # grid ids of two snakes
+
+def test_snakes_collide_with_walls_and_other_snakes_only():
+    grid = OccupancyGrid([10, 10])
+    grid.add_snake_cell(grid.index(2, 2), SNAKE)
+    grid.add_snake_cell(grid.index(2, 3), OTHER)
+    grid.add_wall([[5, 5]])
+
+    assert not grid.is_blocked_for(2, 2, SNAKE) # its own body
+    assert grid.is_blocked_for(2, 3, SNAKE)
+    assert grid.is_blocked_for(5, 5, SNAKE)
+    assert grid.is_blocked_for(-1, 4, SNAKE) # off the board counts as a wall
+    assert not grid.is_blocked_for(7, 7, SNAKE)
+
+def test_cell_stays_taken_while_a_crossing_snake_covers_it():
+    grid = OccupancyGrid([10, 10])
+    i = grid.index(4, 4)
+    grid.add_snake_cell(i, SNAKE)
+    grid.add_snake_cell(i, SNAKE)
+
+    grid.remove_snake_cell(i, SNAKE)
+    assert grid.get(4, 4) == SNAKE
+    grid.remove_snake_cell(i, SNAKE)
+    assert grid.is_empty(4, 4)
+
+    # another snake can't release a cell it doesn't own
+    grid.add_wall([[4, 4]])
+    grid.remove_snake_cell(i, OTHER)
+    assert grid.get(4, 4) == WALL
+    grid.remove_wall([[4, 4]])
+    assert grid.get(4, 4) == EMPTY
+
+# Puts a wall right in front of the snake and moves it into it
+def test_snake_dies_on_a_spawned_wall():
+    sim = Simulation(seed=1)
+    snake = sim.state.players[Simulation.SNAKE]
+    y, x = snake.get_head()
+    dy, dx = snake.direction
+    sim.state.add_wall([[y + dy, x + dx]], sim.clock())
+
+    sim.step()
+    assert Simulation.SNAKE not in sim.state.players
+    for i in snake.body:
+        assert sim.state.grid.cells[i] != snake.grid_id # the dead snake left the grid
+
+def test_grid_follows_the_moving_snake():
+    sim = Simulation(seed=1)
+    sim.set_snake_length(6)
+    sim.run(20, lambda sim: sim.autopilot())
+
+    snake = sim.state.players[Simulation.SNAKE]
+    owned = {i for i, tag in enumerate(sim.state.grid.cells) if tag == snake.grid_id}
+    assert owned == set(snake.body)
+
+def test_free_cell_index_tracks_empty_cells_inside_the_margin():
+    grid = OccupancyGrid([12, 12])
+    margin = OccupancyGrid.FREE_MARGIN
+    inside = {(y, x) for y in range(margin, 12 - margin) for x in range(margin, 12 - margin)}
+
+    taken = [(4, 4), (4, 5), (6, 7)]
+    grid.add_wall([list(cell) for cell in taken[:2]])
+    grid.add_snake_cell(grid.index(*taken[2]), SNAKE)
+    grid.add_wall([[1, 1]]) # outside the margin, never indexed
+
+    def free():
+        return {divmod(i, grid.width) for i in grid.free}
+    assert free() == inside - set(taken)
+
+    rng = random.Random(0)
+    for _ in range(200):
+        y, x = grid.random_free_cell(rng)
+        assert grid.is_empty(y, x) and (y, x) in inside
+
+    grid.remove_wall([[4, 4], [1, 1]])
+    grid.remove_snake_cell(grid.index(6, 7), SNAKE)
+    assert free() == inside - {(4, 5)}
+
+def test_full_board_has_no_free_cell():
+    grid = OccupancyGrid([10, 10])
+    grid.add_wall([[y, x] for y in range(10) for x in range(10)])
+    assert grid.random_free_cell(random.Random(0)) is None
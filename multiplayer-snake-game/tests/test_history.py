@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+import json
+import time
+
+import pytest
+
+from history import MatchHistory
+from player import Player
+from state import State
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.close_reason = None
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def close(self, reason=""):
+        self.close_reason = reason
+
+# Results saved in a row get distinct end times, newest first ordering depends on them
+@pytest.fixture
+def ticking_clock(monkeypatch):
+    monkeypatch.setattr(time, "time", itertools.count(1_700_000_000).__next__)
+
+def match(winner, scores, message="Snake WON!"):
+    state = State()
+    state.game_started = True
+    state.game_over = winner is not None
+    state.winner = winner
+    state.game_over_message = message
+    state.match_start_time = state.clock() - 30
+
+    players = {}
+    for username, (role, score) in scores.items():
+        players[username] = Player([], [0, 0], len(players) + 1, 1, role)
+        players[username].score = score
+    return state, players
+
+def test_results_round_trip(tmp_path, ticking_clock):
+    path = str(tmp_path / "history.db")
+    history = MatchHistory(path)
+
+    history.record(*match("sam", {"sam": ("snake", 10), "cal": ("controller", 0)}), seed=7, replay="one.replay")
+    history.record(*match("cal", {"sam": ("snake", 3), "dee": ("controller", 0)}, "Controller wins!"), seed=8)
+    history.record(*match(None, {"eve": ("snake", 0), "sam": ("controller", 0)}, ""))
+    history.close()
+
+    reader = MatchHistory(path, readonly=True)
+    matches = reader.recent_matches("sam")
+    assert [m["seed"] for m in matches] == [None, 8, 7] # newest first
+    assert [m["winner"] for m in matches] == [None, "cal", "sam"]
+    assert matches[0]["message"] == "Abandoned"
+    assert matches[2]["replay"] == "one.replay"
+    assert matches[2]["duration"] >= 30
+
+    players = {p["username"]: p for p in matches[2]["players"]}
+    assert players["sam"] == {"username": "sam", "role": "snake", "score": 10, "won": 1}
+    assert players["cal"] == {"username": "cal", "role": "controller", "score": 0, "won": 0}
+
+    assert len(reader.recent_matches("sam", limit=2)) == 2
+    assert len(reader.recent_matches("dee")) == 1
+    assert reader.recent_matches("nobody") == []
+
+def test_unstarted_matches_are_not_saved(tmp_path):
+    path = str(tmp_path / "history.db")
+    history = MatchHistory(path)
+    state, players = match(None, {"sam": ("snake", 0)})
+    state.game_started = False
+    history.record(state, players)
+    history.close()
+
+    assert MatchHistory(path, readonly=True).recent_matches("sam") == []
+
+def test_send_recent(tmp_path, ticking_clock):
+    path = str(tmp_path / "history.db")
+    history = MatchHistory(path)
+    for i in range(3):
+        history.record(*match("sam", {"sam": ("snake", 10), "cal": ("controller", 0)}), seed=i)
+    history.close()
+
+    reader = MatchHistory(path, readonly=True)
+    websocket = FakeWebSocket()
+    asyncio.run(reader.send_recent(websocket, {"history": "sam", "limit": "2"}))
+    message = json.loads(websocket.sent[0])
+    assert message["type"] == "history"
+    assert [m["seed"] for m in message["matches"]] == [2, 1]
+
+    websocket = FakeWebSocket()
+    asyncio.run(reader.send_recent(websocket, {"history": "sam", "limit": "lots"}))
+    assert websocket.sent == []
+    assert websocket.close_reason == "Invalid history limit"
+
+def test_readonly_history_never_writes(tmp_path):
+    path = tmp_path / "history.db"
+    reader = MatchHistory(str(path), readonly=True)
+    assert reader.recent_matches("sam") == []
+    assert not path.exists()
+
+    # the schema made by a writer later on is picked up
+    MatchHistory(str(path)).close()
+    assert reader.recent_matches("sam") == []
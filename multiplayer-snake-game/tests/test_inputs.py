@@ -0,0 +1,57 @@
+import pytest
+
+from inputs import InputBuffer
+from simulation import Simulation
+
+ACTIONS = [
+    ["food_up", "food_up", "food_down"],
+    ["food_left", "food_left", "food_left", "food_right"],
+    ["food_up", "food_right", "food_down", "food_left", "food_up"],
+]
+
+# Food position after the actions, sent one by one or through the room's buffer
+def food_after(actions, food_pos, buffered):
+    sim = Simulation(seed=1)
+    sim.state.food_pos = list(food_pos)
+
+    if buffered:
+        buffer = InputBuffer(clock=lambda: 0.0)
+        for action in actions:
+            assert buffer.push({"action": action})
+        inputs = buffer.drain()
+    else:
+        inputs = [{"action": action} for action in actions]
+
+    for data in inputs:
+        sim.state.apply_input(Simulation.CONTROLLER, data)
+    return sim.state.food_pos
+
+@pytest.mark.parametrize("actions", ACTIONS)
+@pytest.mark.parametrize("food_pos", [[1, 1], [1, 10], [10, 10], [28, 48]])
+def test_buffered_food_moves_match_unbuffered(actions, food_pos):
+    assert food_after(actions, food_pos, True) == food_after(actions, food_pos, False)
+
+def test_one_turn_and_one_wall_per_tick():
+    buffer = InputBuffer(clock=lambda: 0.0)
+    for data in ({"direction": "w"}, {"direction": "a"}, {"action": "spawn_wall"}, {"action": "spawn_wall"}):
+        buffer.push(data)
+
+    assert buffer.drain([0, 1]) == [{"direction": "w"}, {"action": "spawn_wall"}]
+    assert buffer.drain([-1, 0]) == [{"direction": "a"}]
+    assert buffer.drain([0, -1]) == []
+
+def test_resyncs_are_coalesced_and_spaced_out():
+    buffer = InputBuffer(clock=lambda: 0.0)
+    for _ in range(5):
+        buffer.push({"resync": True})
+
+    assert buffer.resync_due()
+    assert buffer.drain() == [] # never applied to the match
+
+    # asking again every tick still gets one keyframe per RESYNC_TICKS
+    due = []
+    for _ in range(3 * InputBuffer.RESYNC_TICKS):
+        buffer.resync = True
+        due.append(buffer.resync_due())
+    assert sum(due) == 3
+    assert not buffer.resync_due()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import random
+
+from delta import DeltaEncoder
+from protocol import BINARY, encode_frame
+from simulation import Simulation
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+# Drops one delta on the way to a bot, then checks it waits for the keyframe it asks for
+def test_bot_rejoins_after_sequence_gap(loadgen, client_protocol):
+    async def run():
+        sim = Simulation(seed=1)
+        encoder = DeltaEncoder()
+        bot = loadgen.Bot(0, "localhost", 0, BINARY, loadgen.Stats(), 1.0, random.Random(0))
+        websocket = FakeWebSocket()
+
+        def tick(deliver=True):
+            sim.step(sim.autopilot())
+            frame = encode_frame(encoder.encode(sim.state), BINARY)
+            if deliver:
+                bot.apply(client_protocol.decode_frame(frame), websocket)
+
+        def expected():
+            return json.loads(json.dumps(sim.state.to_dict()))
+
+        for _ in range(5):
+            tick()
+        assert bot.state == expected()
+        synced_seq, synced_state = bot.seq, bot.state
+
+        # lost delta: the next ones are ignored, seq and state stay where they were
+        tick(deliver=False)
+        for _ in range(3):
+            tick()
+        await asyncio.sleep(0)
+
+        assert bot.awaiting_keyframe
+        assert (bot.seq, bot.state) == (synced_seq, synced_state)
+        assert bot.stats.dropped == 1
+        assert bot.stats.resyncs == 1
+        assert len(websocket.sent) == 1 # one resync, not one per ignored delta
+
+        # the server answers the resync with a keyframe, deltas apply again after it
+        encoder.request_keyframe()
+        tick()
+        assert not bot.awaiting_keyframe
+        for _ in range(3):
+            tick()
+        assert bot.seq == encoder.seq
+        assert bot.state == expected()
+
+    asyncio.run(run())
+
+# Control messages are JSON text in the binary encoding too, the username is plain text
+def test_bot_reads_text_control_messages(loadgen):
+    bot = loadgen.Bot(0, "localhost", 0, BINARY, loadgen.Stats(), 1.0, random.Random(0))
+    leaderboard = {"type": "leaderboard", "top": {}, "you": {}}
+    assert bot.decode(json.dumps(leaderboard)) == leaderboard
+
+    for username in ("bot0_1", "42", "null"):
+        assert bot.decode(username) is None
+        assert bot.username == username
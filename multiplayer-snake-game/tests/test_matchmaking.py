@@ -0,0 +1,48 @@
+import asyncio
+
+from matchmaking import Matchmaker
+
+class Client:
+    def __init__(self, name):
+        self.name = name
+        self.open = True
+
+def run(main):
+    return asyncio.run(main())
+
+def matchmaker(pairs):
+    def on_match(first, first_role, second, second_role):
+        pairs.append((first.name, second.name))
+        return first_role, second_role
+    return Matchmaker(on_match, alive=lambda client: client.open)
+
+def test_pairs_in_order():
+    async def main():
+        pairs = []
+        lobby = matchmaker(pairs)
+        tickets = [lobby.join(Client(name)) for name in "abcd"]
+
+        assert pairs == [("a", "b"), ("c", "d")]
+        assert {t.future.result() for t in tickets[:2]} == {"snake", "controller"}
+        assert lobby.depth == 0
+    run(main)
+
+def test_disconnected_client_is_skipped():
+    async def main():
+        pairs = []
+        lobby = matchmaker(pairs)
+        gone = Client("gone")
+        gone_ticket = lobby.join(gone)
+        gone.open = False
+
+        survivor_ticket = lobby.join(Client("survivor"))
+        assert pairs == []
+        assert gone_ticket.future.cancelled()
+        assert not survivor_ticket.future.done()
+        assert lobby.depth == 1
+
+        # the survivor kept its place and meets the next client
+        lobby.join(Client("next"))
+        assert pairs == [("survivor", "next")]
+        assert survivor_ticket.future.done()
+    run(main)
@@ -0,0 +1,54 @@
+from player import Player
+from simulation import Simulation
+
+WIDTH = 50
+
+def test_body_is_packed_against_the_board_width():
+    player = Player([[3, 7], [3, 6], [3, 5]], [0, 1], 1, WIDTH)
+    assert list(player.body) == [3 * WIDTH + 7, 3 * WIDTH + 6, 3 * WIDTH + 5]
+    assert player.get_head() == [3, 7]
+    assert player.get_head_index() == 3 * WIDTH + 7
+    assert player.segments == [[3, 7], [3, 6], [3, 5]]
+
+def test_moving_adds_a_head_and_releases_the_tail():
+    player = Player([[3, 7], [3, 6], [3, 5]], [0, 1], 1, WIDTH)
+    player.add_new_head()
+    assert player.pop_tail() == 3 * WIDTH + 5
+    assert player.segments == [[3, 8], [3, 7], [3, 6]]
+
+    player.direction = [1, 0]
+    player.add_new_head()
+    assert player.pop_tail() == 3 * WIDTH + 6
+    assert player.segments == [[4, 8], [3, 8], [3, 7]]
+    assert (player.heads_added, player.tails_removed) == (2, 2)
+    assert player.get_head_segments(2) == [[4, 8], [3, 8]]
+    assert player.get_head_segments(10) == player.segments
+
+def test_eating_grows_the_snake_by_keeping_its_tail():
+    sim = Simulation(seed=1)
+    snake = sim.state.players[Simulation.SNAKE]
+    y, x = snake.get_head()
+    dy, dx = snake.direction
+    sim.state.food_pos = [y + dy, x + dx]
+    tail = snake.body[-1]
+
+    sim.step()
+    assert len(snake.body) == 2
+    assert snake.body[-1] == tail
+    assert snake.get_head() == [y + dy, x + dx]
+    assert snake.score == 1
+
+    sim.step()
+    assert len(snake.body) == 2
+    assert tail not in snake.body
+    assert sim.state.grid.is_empty(*divmod(tail, sim.state.dimensions[1]))
+
+def test_json_is_reencoded_only_after_a_change():
+    player = Player([[3, 7]], [0, 1], 1, WIDTH)
+    first = player.to_json()
+    assert player.to_json() is first
+
+    player.add_new_head()
+    player.pop_tail()
+    assert player.to_json() is not first
+    assert '"segments": [[3, 8]]' in player.to_json()
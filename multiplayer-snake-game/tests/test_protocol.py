@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from delta import DeltaEncoder
+from protocol import BINARY, JSON, MAX_USERNAME, clean_username, decode_input, encode_frame
+from simulation import Simulation
+
+LONG_NAME = "é" * 300 # 600 bytes, more than a 1-byte length can hold
+
+# Match between the given usernames, steered by the autopilot so it runs for a while
+def simulation(snake, controller):
+    class Match(Simulation):
+        SNAKE = snake
+        CONTROLLER = controller
+    return Match(seed=3)
+
+# What a client decodes from an encoded frame
+def receive(client_protocol, wire, encoding):
+    if encoding == BINARY:
+        return client_protocol.decode_frame(wire)
+    return json.loads(wire)
+
+# Plain JSON form of the server state, the client's copy must equal it
+def expected(state):
+    return json.loads(json.dumps(state.to_dict()))
+
+@pytest.mark.parametrize("encoding", [JSON, BINARY])
+@pytest.mark.parametrize("snake, controller", [("alice", "bob"), (LONG_NAME, "b" + LONG_NAME)])
+def test_keyframe_delta_round_trip(client_protocol, encoding, snake, controller):
+    sim = simulation(snake, controller)
+    encoder = DeltaEncoder()
+    client_state = None
+    seen = set()
+
+    for tick in range(120):
+        inputs = sim.autopilot()
+        if tick % 7 == 0:
+            inputs.append((controller, {"action": "food_left"}))
+        if tick % 30 == 5:
+            inputs.append((controller, {"action": "spawn_wall"}))
+        if sim.step(inputs):
+            break
+
+        frame = receive(client_protocol, encode_frame(encoder.encode(sim.state), encoding), encoding)
+        seen.add(frame["type"])
+        if frame["type"] == "keyframe":
+            client_state = frame["state"]
+        else:
+            assert frame["seq"] == encoder.seq
+            client_state = client_protocol.apply_delta(client_state, frame)
+
+        assert client_state == expected(sim.state)
+
+    assert seen == {"keyframe", "delta"}
+    assert sim.state.walls or sim.state.next_wall_id > 1
+
+@pytest.mark.parametrize("winner", [LONG_NAME, None])
+def test_binary_result_with_long_winner(client_protocol, winner):
+    frame = client_protocol.decode_frame(encode_frame({"type": "result", "winner": winner}, BINARY))
+    assert frame == {"type": "result", "winner": winner}
+
+def test_handshake_usernames_are_capped():
+    assert clean_username("x" * 300) == "x" * MAX_USERNAME
+    assert clean_username("  alice ") == "alice"
+    assert clean_username(42) == "42"
+    assert clean_username(None) == "player"
+    assert clean_username("   ") == "player"
+
+@pytest.mark.parametrize("message", [
+    {"direction": "w"}, {"action": "food_left"}, {"action": "spawn_wall"}, {"resync": True}
+])
+@pytest.mark.parametrize("encoding", [JSON, BINARY])
+def test_input_round_trip(client_protocol, encoding, message):
+    assert decode_input(client_protocol.encode_input(message, encoding)) == message
+
+@pytest.mark.parametrize("msg", [b"", b"\x01", b"\x02\x63", b"\x09\x00", b"\x01ww", "{", "[1]"])
+def test_malformed_input_is_ignored(msg):
+    assert decode_input(msg) is None
+
+def test_malformed_frames_are_ignored(client_protocol):
+    keyframe = encode_frame({"type": "keyframe", "seq": 1, "state_json": "{}"}, BINARY)
+    result = encode_frame({"type": "result", "winner": LONG_NAME}, BINARY)
+    for wire in (b"", b"\x09" + keyframe[1:], keyframe + b"}", result[:-1] + b"\xff"):
+        assert client_protocol.decode_frame(wire) is None
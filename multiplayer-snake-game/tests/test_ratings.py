@@ -0,0 +1,87 @@
+import pytest
+
+from history import MatchHistory
+from player import Player
+from ratings import Ladder, Ratings
+from state import State
+
+def ladder(ratings):
+    result = Ladder()
+    result.load((username, rating, 1) for username, rating in ratings.items())
+    return result
+
+def finished_match(winner):
+    state = State()
+    state.game_started = True
+    state.game_over = True
+    state.winner = winner
+    state.match_start_time = state.clock()
+    return state
+
+PLAYERS = {"sam": Player([], [0, 0], 1, 1, "snake"), "cal": Player([], [0, 0], 2, 1, "controller")}
+
+def test_rank_counts_players_rated_higher():
+    players = ladder({"a": 1800, "b": 1500, "c": 1650, "d": 1200})
+    assert [players.rank(u) for u in "abcd"] == [1, 3, 2, 4]
+    assert players.rank("nobody") is None
+
+def test_players_in_one_bucket_tie():
+    players = ladder({"a": 1500.01, "b": 1500.02, "c": 1400})
+    assert players.rank("a") == players.rank("b") == 1
+    assert players.rank("c") == 3
+
+def test_set_moves_a_player():
+    players = ladder({"a": 1800, "b": 1500})
+    players.set("b", 1900, 2)
+    assert players.rank("b") == 1
+    assert players.rank("a") == 2
+    assert len(players) == 2
+    assert players.games["b"] == 2
+
+def test_top_is_best_first():
+    ratings = {f"p{i}": 1000 + i * 10 for i in range(50)}
+    players = ladder(ratings)
+    best = sorted(ratings.items(), key=lambda item: -item[1])
+
+    assert players.top(5) == best[:5]
+    assert players.top(100) == best
+    assert Ladder().top(5) == []
+
+def test_ratings_clamped_to_the_ladder():
+    players = ladder({"low": -50, "high": 9000, "mid": 2000})
+    assert players.top(3) == [("high", 9000), ("mid", 2000), ("low", -50)]
+    assert players.rank("low") == 3
+
+def test_update_moves_ratings_in_opposite_directions():
+    ratings = Ratings()
+    assert ratings.update(finished_match("sam"), PLAYERS) == ("sam", "cal", True)
+
+    snake, controller = ratings.ladders["snake"].get("sam"), ratings.ladders["controller"].get("cal")
+    assert snake == pytest.approx(Ratings.INITIAL + Ratings.K_NEW / 2)
+    assert controller == pytest.approx(Ratings.INITIAL - Ratings.K_NEW / 2)
+    assert ratings.leaderboard("sam")["you"]["snake"] == {"rating": round(snake), "rank": 1, "players": 1}
+
+def test_no_rating_without_a_winner():
+    assert Ratings().update(finished_match(None), PLAYERS) is None
+
+# Two workers with their own in-memory ladders share one database: the saved
+# ratings must count every match, not whichever worker wrote last
+def test_history_rates_against_saved_ratings(tmp_path):
+    path = str(tmp_path / "history.db")
+    workers = [Ratings(), Ratings()]
+
+    expected = {"snake": (Ratings.INITIAL, 0), "controller": (Ratings.INITIAL, 0)}
+    for i in range(6):
+        ratings = workers[i % 2]
+        winner = "sam" if i % 3 else "cal"
+        history = MatchHistory(path)
+        history.record(finished_match(winner), PLAYERS, rated=ratings.update(finished_match(winner), PLAYERS))
+        history.close() # written before the other worker's match
+
+        (snake, snake_games), (controller, controller_games) = expected["snake"], expected["controller"]
+        snake, controller = Ratings.rate(snake, snake_games, controller, controller_games, winner == "sam")
+        expected = {"snake": (snake, snake_games + 1), "controller": (controller, controller_games + 1)}
+
+    saved = {role: (rating, games) for role, username, rating, games in MatchHistory(path, readonly=True).load_ratings()}
+    assert saved["snake"] == (pytest.approx(expected["snake"][0]), 6)
+    assert saved["controller"] == (pytest.approx(expected["controller"][0]), 6)
@@ -0,0 +1,61 @@
+import asyncio
+
+from scheduler import TickScheduler
+
+class Task:
+    tick_interval = 0.01
+
+    def __init__(self, fail_at=None, ticks=None):
+        self.fail_at = fail_at # tick that raises
+        self.ticks = ticks # ticks before the task stops itself
+        self.ran = 0
+        self.closed = False
+
+    def tick(self):
+        self.ran += 1
+        if self.ran == self.fail_at:
+            raise RuntimeError("tick failed")
+        return self.ticks is None or self.ran < self.ticks
+
+    def close(self):
+        self.closed = True
+
+def run(tasks, seconds):
+    async def main():
+        scheduler = TickScheduler()
+        for task in tasks:
+            scheduler.add(task)
+        await asyncio.sleep(seconds)
+        return scheduler
+    return asyncio.run(main())
+
+def test_tasks_tick_until_they_stop():
+    forever, short = Task(), Task(ticks=3)
+    scheduler = run([forever, short], 0.2)
+
+    assert short.ran == 3
+    assert forever.ran >= 10
+    assert scheduler.ticks == forever.ran + short.ran
+    assert scheduler.failed_ticks == 0
+
+def test_failing_task_is_dropped_and_the_rest_keep_ticking():
+    healthy, failing = Task(), Task(fail_at=3)
+    scheduler = run([failing, healthy], 0.2)
+
+    assert failing.ran == 3
+    assert failing.closed
+    assert scheduler.failed_ticks == 1
+    assert healthy.ran >= 10
+    assert not healthy.closed
+
+def test_failing_close_does_not_stop_the_scheduler():
+    class BrokenClose(Task):
+        def close(self):
+            raise RuntimeError("close failed")
+
+    healthy, failing = Task(), BrokenClose(fail_at=1)
+    scheduler = run([failing, healthy], 0.1)
+
+    assert failing.ran == 1
+    assert scheduler.failed_ticks == 1
+    assert healthy.ran >= 5
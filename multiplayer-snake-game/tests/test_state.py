@@ -0,0 +1,32 @@
+from replay import ReplayPlayer
+from simulation import Simulation
+from state import State
+
+def test_leaving_after_the_countdown_hands_the_win_over():
+    sim = Simulation(seed=1)
+    sim.run(10, lambda sim: sim.autopilot())
+
+    sim.state.player_left(Simulation.CONTROLLER)
+    assert sim.state.game_over
+    assert sim.state.winner == Simulation.SNAKE
+    assert sim.state.game_over_message == "Opponent left"
+
+def test_leaving_during_the_countdown_abandons_the_match():
+    sim = Simulation(seed=1, skip_countdown=False)
+    sim.step()
+
+    sim.state.player_left(Simulation.SNAKE)
+    assert sim.state.game_over
+    assert sim.state.winner is None
+
+def test_leaving_after_game_over_changes_nothing():
+    sim = Simulation(seed=1)
+    sim.state.player_left(Simulation.SNAKE)
+    sim.state.player_left(Simulation.CONTROLLER)
+    assert sim.state.winner == Simulation.CONTROLLER
+
+def test_leaving_before_the_match_keeps_waiting():
+    player = ReplayPlayer(State())
+    player.add_player("alone", None)
+    player.remove_player("alone")
+    assert not player.state.game_over